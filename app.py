@@ -18,7 +18,7 @@ import smtplib
 import logging
 import string
 from dataclasses import asdict
-from datetime import datetime, timedelta, timezone
+from datetime import datetime, timedelta
 from functools import wraps
 from io import BytesIO
 from logging.handlers import RotatingFileHandler
@@ -28,7 +28,8 @@ from email.mime.multipart import MIMEMultipart
 # ============================================================================
 # THIRD-PARTY KIRJASTOT
 # ============================================================================
-from flask import Flask, jsonify, render_template, request, redirect, url_for, flash, session
+import click
+from flask import Flask, jsonify, render_template, request, redirect, url_for, flash, session, send_file
 from flask_bcrypt import Bcrypt
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 from flask_wtf.csrf import CSRFProtect, generate_csrf
@@ -55,10 +56,15 @@ from docx.enum.text import WD_ALIGN_PARAGRAPH
 # OMAT MODUULIT - TÄMÄ ON KORJATTU JA TÄRKEÄ OSA
 # ============================================================================
 from data_access.database_manager import DatabaseManager
+from data_access.rate_limit_storage import default_rate_limit_uri
+from data_access.similarity_index import NEAR_DUPLICATE_THRESHOLD
+from data_access.job_runner import STATUS_DONE
+from data_access.question_import import iter_json_array
 from logic.stats_manager import EnhancedStatsManager
 from logic.achievement_manager import EnhancedAchievementManager, ENHANCED_ACHIEVEMENTS
 from logic.spaced_repetition import SpacedRepetitionManager
-from logic.simulation_manager import calculate_remaining_time
+from logic.dashboard_manager import DashboardManager
+from logic.simulation_manager import calculate_remaining_time, SimulationStore, SIMULATION_DURATION_SECONDS
 from models.models import User, Question
 from constants import DISTRACTORS
 
@@ -108,11 +114,16 @@ app.logger.info('LOVe Enhanced startup')
 # ============================================================================
 # RATE LIMITING
 # ============================================================================
+# Laskurit ovat SQLite-tiedostossa, jota kaikki saman koneen gunicorn-workerit
+# jakavat (data_access/rate_limit_storage.py). RATELIMIT_STORAGE_URI=memory://
+# palauttaa workerikohtaiset laskurit. Jos tiedosto ei ole käytettävissä,
+# Flask-Limiter käyttää väliaikaisesti muistilaskureita.
 limiter = Limiter(
     get_remote_address,
     app=app,
     default_limits=["500 per day", "100 per hour"],
-    storage_uri="memory://"
+    storage_uri=default_rate_limit_uri(),
+    in_memory_fallback_enabled=True,
 )
 
 # ============================================================================
@@ -123,6 +134,9 @@ db_manager = DatabaseManager()
 stats_manager = EnhancedStatsManager(db_manager)
 achievement_manager = EnhancedAchievementManager(db_manager)
 spaced_repetition_manager = SpacedRepetitionManager(db_manager)
+dashboard_manager = DashboardManager(db_manager, stats_manager, achievement_manager, spaced_repetition_manager)
+# Simulaation tila palvelimella; cookie-sessiossa vain session['simulation_id']
+simulation_store = SimulationStore(db_manager)
 bcrypt = Bcrypt(app)
 
 # ============================================================================
@@ -135,6 +149,38 @@ def execute_query(query, params=(), fetch='all'):
     """
     return db_manager._execute(query, params, fetch)
 
+# ============================================================================
+# PYYNTÖKOHTAINEN TRANSAKTIO (UNIT OF WORK)
+# ============================================================================
+
+@app.before_request
+def begin_db_unit_of_work():
+    """Kaikki pyynnön kyselyt ajetaan samalla yhteydellä ja yhdellä commitilla."""
+    db_manager.begin_unit_of_work()
+
+@app.after_request
+def commit_db_unit_of_work(response):
+    """Vahvistaa pyynnön transaktion ennen vastauksen lähettämistä."""
+    if response.status_code >= 500:
+        # teardown_request perii muutokset
+        return response
+    try:
+        db_manager.commit_unit_of_work()
+    except Exception as e:
+        app.logger.error(f"Pyynnön transaktion vahvistus epäonnistui: {e}")
+        error_response = jsonify({'error': 'Tietokantavirhe, muutoksia ei tallennettu.'})
+        error_response.status_code = 500
+        return error_response
+    return response
+
+@app.teardown_request
+def end_db_unit_of_work(error=None):
+    """Perii vahvistamattomat muutokset ja palauttaa yhteyden pooliin."""
+    try:
+        db_manager.end_unit_of_work(error)
+    except Exception as e:
+        app.logger.error(f"Pyynnön transaktion päättäminen epäonnistui: {e}")
+
 # ============================================================================
 # TIETOKANNAN ALUSTUSTOIMINNOT
 # ============================================================================
@@ -205,16 +251,11 @@ login_manager.login_message_category = "info"
 @login_manager.user_loader
 def load_user(user_id):
     """
-    Lataa käyttäjän tiedot tietokannasta.
-    Käyttää db_manager._execute() metodia joka toimii sekä PostgreSQL:n että SQLite:n kanssa.
+    Lataa käyttäjän tiedot. Rivi luetaan workerin välimuistista
+    (data_access/user_cache.py); kanta kysytään vain, kun rivi puuttuu tai on vanhentunut.
     """
     try:
-        # Käytä db_manager:in _execute metodia (toimii sekä PostgreSQL että SQLite)
-        user_data = db_manager._execute(
-            "SELECT id, username, email, role, distractors_enabled, distractor_probability, expires_at FROM users WHERE id = ?",
-            (user_id,),
-            fetch='one'
-        )
+        user_data = db_manager.user_cache.get(user_id)
         
         if user_data:
             return User(
@@ -366,23 +407,26 @@ def send_reset_email(user_email, reset_url):
         app.logger.error(f"Failed to send email via Brevo: {e}")
         return False
     
+def get_current_simulation():
+    """Palauttaa kirjautuneen käyttäjän aktiivisen simulaation tilan tai None."""
+    return simulation_store.get(current_user.id, session.get('simulation_id'))
+
 @app.route('/api/simulation/question/<int:index>')
 @login_required
 def get_simulation_question_api(index):
     """Hakee yhden kysymyksen simulaatiota varten indeksin perusteella."""
-    if 'simulation' not in session or session['simulation'].get('user_id') != current_user.id:
+    sim_session = get_current_simulation()
+    if sim_session is None:
         return jsonify({'error': 'No active simulation found'}), 404
 
-    sim_session = session['simulation']
     question_ids = sim_session.get('question_ids', [])
 
     if 0 <= index < len(question_ids):
         question_id = question_ids[index]
         question = db_manager.get_question_by_id(question_id, current_user.id)
         if question:
-            # Päivitä sessioon nykyinen indeksi
-            session['simulation']['current_index'] = index
-            session.modified = True
+            # Nykyinen indeksi puskuroidaan: selaus ei kirjoita kantaan joka pyynnöllä
+            simulation_store.buffer(current_user.id, sim_session['session_id'], current_index=index)
             
             # Rakenna JSON-vastaus oikeilla kentillä
             return jsonify({
@@ -509,6 +553,7 @@ def toggle_distractors_api():
     
     try:
         execute_query("UPDATE users SET distractors_enabled = ? WHERE id = ?", (is_enabled, current_user.id), fetch='none')
+        db_manager.invalidate_user_cache(current_user.id)
         app.logger.info(f"User {current_user.username} toggled distractors: {is_enabled}")
         return jsonify({'success': True, 'distractors_enabled': is_enabled})
     except Exception as e:
@@ -525,6 +570,7 @@ def update_distractor_probability_api():
     
     try:
         execute_query("UPDATE users SET distractor_probability = ? WHERE id = ?", (probability, current_user.id), fetch='none')
+        db_manager.invalidate_user_cache(current_user.id)
         app.logger.info(f"User {current_user.username} updated distractor probability: {probability}%")
         return jsonify({'success': True, 'probability': probability})
     except Exception as e:
@@ -537,44 +583,8 @@ def update_distractor_probability_api():
 def get_question_counts_api():
     """Hakee kysymysmäärät kategorioittain ja vaikeustasoittain."""
     try:
-        category_counts = execute_query("""
-            SELECT category, COUNT(*) as count
-            FROM questions
-            GROUP BY category
-            ORDER BY category
-        """, fetch='all')
-        
-        difficulty_counts = execute_query("""
-            SELECT difficulty, COUNT(*) as count
-            FROM questions
-            GROUP BY difficulty
-        """, fetch='all')
-        
-        category_difficulty_counts = execute_query("""
-            SELECT category, difficulty, COUNT(*) as count
-            FROM questions
-            GROUP BY category, difficulty
-        """, fetch='all')
-        
-        total_result = execute_query("SELECT COUNT(*) as count FROM questions", fetch='one')
-        total_count = total_result['count'] if total_result else 0
-        
-        cat_diff_map = {}
-        if category_difficulty_counts:
-            for row in category_difficulty_counts:
-                cat = row['category']
-                diff = row['difficulty']
-                count = row['count']
-                if cat not in cat_diff_map:
-                    cat_diff_map[cat] = {}
-                cat_diff_map[cat][diff] = count
-        
-        return jsonify({
-            'categories': {row['category']: row['count'] for row in category_counts} if category_counts else {},
-            'difficulties': {row['difficulty']: row['count'] for row in difficulty_counts} if difficulty_counts else {},
-            'category_difficulty_map': cat_diff_map,
-            'total': total_count
-        })
+        # Lasketaan muistissa olevasta kysymyspankista (ei kyselyitä)
+        return jsonify(db_manager.get_question_counts())
     except Exception as e:
         app.logger.error(f"Virhe kysymysmäärien haussa: {e}")
         return jsonify({'error': str(e)}), 500
@@ -660,37 +670,39 @@ def submit_answer_api():
     
     is_correct = (selected_option_text == question.options[question.correct])
     
-    # Päivitä normaalit tilastot
-    db_manager.update_question_stats(question_id, is_correct, time_taken, current_user.id)
-    
-    # --- KORJATTU OSA: Päivitä spaced repetition -järjestelmä oikein ---
+    # Laske spaced repetition -arvot ennen tallennusta, jotta edistyminen,
+    # SR-arvot ja yritys voidaan kirjata yhdellä kertaa.
+    # (question-objekti sisältää vanhat `interval` ja `ease_factor` arvot)
+    new_interval, new_ease_factor = None, None
     try:
-        # 1. Määritä suorituksen laatu (0-5 asteikolla)
-        # 5 = täydellinen, 2 = väärä vastaus
+        # Suorituksen laatu (0-5 asteikolla): 5 = täydellinen, 2 = väärä vastaus
         quality = 5 if is_correct else 2
-        
-        # 2. Laske uusi kertausväli ja vaikeuskerroin
-        # (question-objekti on jo haettu aiemmin ja sisältää vanhat `interval` ja `ease_factor` arvot)
         new_interval, new_ease_factor = spaced_repetition_manager.calculate_next_review(
             question=question, 
             performance_rating=quality
         )
-        
-        # 3. Tallenna päivitetyt tiedot tietokantaan
-        spaced_repetition_manager.record_review(
-            user_id=current_user.id,
-            question_id=question_id,
-            interval=new_interval,
-            ease_factor=new_ease_factor
-        )
-        app.logger.info(f"Spaced repetition päivitetty: user={current_user.id}, q={question_id}, quality={quality}, new_interval={new_interval}")
     except Exception as e:
-        app.logger.error(f"Virhe spaced repetition päivityksessä: {e}")
+        app.logger.error(f"Virhe spaced repetition -laskennassa: {e}")
         # Ei estetä vastauksen tallentamista vaikka SR epäonnistuisi
-    # --- KORJAUKSEN LOPPU ---
+    
+    success, error = db_manager.record_answer(
+        current_user.id, question_id, is_correct, time_taken,
+        interval=new_interval, ease_factor=new_ease_factor
+    )
+    if success and new_interval is not None:
+        app.logger.info(f"Spaced repetition päivitetty: user={current_user.id}, q={question_id}, quality={quality}, new_interval={new_interval}")
+    elif not success:
+        app.logger.error(f"Vastauksen tallennus epäonnistui: user={current_user.id}, q={question_id}: {error}")
 
-    # Tarkista saavutukset
-    new_achievement_ids = achievement_manager.check_achievements(current_user.id)
+    # Päivitä tilastokooste ja saavutuslaskurit, tarkista saavutukset (ei lisäkyselyitä)
+    new_achievement_ids = []
+    if success:
+        answer = {
+            'question_id': question.id, 'is_correct': is_correct, 'time_taken': time_taken,
+            'category': question.category, 'first_time': question.times_shown == 0,
+        }
+        stats_manager.record_answers(current_user.id, [answer])
+        new_achievement_ids = achievement_manager.record_answers(current_user.id, [answer])
     new_achievements = []
     
     for ach_id in new_achievement_ids:
@@ -727,10 +739,10 @@ def submit_answer_api():
 def submit_simulation():
     """Palauta koe ja laske tulos."""
     try:
-        if 'simulation' not in session:
+        sim = get_current_simulation()
+        if sim is None:
             return jsonify({'error': 'No active simulation found'}), 404
         
-        sim = session['simulation']
         app.logger.info(f"🎯 Submit simulation - User: {current_user.username}")
         
         user_answers = sim.get('answers', [])
@@ -743,8 +755,12 @@ def submit_simulation():
         total = len(question_ids)
         detailed_results = []
         
+        # Kaikki kysymykset yhdellä haulla (välimuistista), vastaukset yhdellä kirjoituksella
+        questions_by_id = {q.id: q for q in db_manager.get_questions_by_ids(question_ids, current_user.id)}
+        answers_to_save = []
+
         for i, question_id in enumerate(question_ids):
-            question = db_manager.get_question_by_id(question_id, current_user.id)
+            question = questions_by_id.get(question_id)
             
             if not question:
                 app.logger.warning(f"⚠️ Question {question_id} not found")
@@ -756,24 +772,9 @@ def submit_simulation():
             if is_correct:
                 score += 1
             
-            # ✅ UUSI: Tallenna vastaus tietokantaan
-            try:
-                # Laske vastausaika (oletetaan keskiarvo 30s per kysymys)
-                time_taken = 30
-                
-                # Tallenna question_attempts tauluun
-                db_manager.update_question_stats(
-                    question_id=question_id,
-                    is_correct=is_correct,
-                    time_taken=time_taken,
-                    user_id=current_user.id
-                )
-                
-                app.logger.info(f"💾 Saved answer: Q{question_id} - {'✓' if is_correct else '✗'}")
-                
-            except Exception as e:
-                app.logger.error(f"❌ Error saving answer for Q{question_id}: {e}")
-                # Jatka silti muiden tallentamista
+            # Vastausaika: oletetaan keskiarvo 30s per kysymys
+            answers_to_save.append({'question_id': question_id, 'is_correct': is_correct, 'time_taken': 30,
+                                    'first_time': question.times_shown == 0})
             
             # Hae vastaukset tulossivulle
             user_answer_text = question.options[user_answer_index] if user_answer_index is not None and user_answer_index < len(question.options) else None
@@ -787,14 +788,36 @@ def submit_simulation():
                 'explanation': question.explanation or 'Ei selitystä saatavilla'
             })
         
+        success, error = db_manager.record_answers(current_user.id, answers_to_save)
+        if not success:
+            app.logger.error(f"❌ Error saving simulation answers: {error}")
+        else:
+            # Kertausaikataulu kuten harjoittelussa (laatu 5 = oikein, 2 = väärin), laskettuna
+            # vastauksia edeltävästä edistymisestä ja kirjoitettuna yhdellä eräpäivityksellä
+            sr_success, sr_error = spaced_repetition_manager.reschedule(
+                current_user.id,
+                {answer['question_id']: 5 if answer['is_correct'] else 2 for answer in answers_to_save},
+                questions_by_id.values()
+            )
+            if not sr_success:
+                app.logger.error(f"Virhe simulaation kertausaikataulussa: {sr_error}")
+            stats_manager.record_answers(current_user.id, answers_to_save)
+            new_achievement_ids = achievement_manager.record_answers(current_user.id, answers_to_save, context={
+                'simulation_complete': True,
+                'simulation_perfect': total > 0 and score == total,
+            })
+            if new_achievement_ids:
+                app.logger.info(f"User {current_user.username} unlocked {len(new_achievement_ids)} achievements")
+        
         percentage = (score / total * 100) if total > 0 else 0
         
         app.logger.info(f"✅ Score: {score}/{total} = {percentage:.1f}%")
-        app.logger.info(f"💾 Saved {total} answers to database")
+        if success:
+            app.logger.info(f"💾 Saved {len(answers_to_save)} answers to database")
         
         # Poista sessio
-        session.pop('simulation', None)
-        session.modified = True
+        simulation_store.delete(current_user.id)
+        session.pop('simulation_id', None)
         
         return jsonify({
             'score': score,
@@ -846,15 +869,8 @@ def get_questions_api():
 
         app.logger.info(f"Raw questions fetched: {len(questions)}")
 
-        # Prosessoi kysymykset
-        questions_list = []
-        for q in questions:
-            if q.options and 0 <= q.correct < len(q.options):
-                original_correct_text = q.options[q.correct]
-                random.shuffle(q.options)
-                q.correct = q.options.index(original_correct_text)
-            q_dict = asdict(q)
-            questions_list.append(q_dict)
+        # Vaihtoehdot sekoitetaan sanakirjaan; oikea indeksi seuraa permutaatiota
+        questions_list = [q.to_dict(shuffle=True) for q in questions]
 
         if not questions_list:
             app.logger.warning("No questions returned - returning empty list")
@@ -876,32 +892,38 @@ def get_questions_api():
 @app.route('/api/simulation/update', methods=['POST'])
 @login_required
 def update_simulation():
-    """Päivitä simulaation tilanne sessioniin."""
+    """Päivitä simulaation tilanne palvelimelle."""
     try:
         data = request.json
         
-        if 'simulation' not in session:
+        session_id = session.get('simulation_id')
+        if not session_id:
             return jsonify({'error': 'No active simulation'}), 404
         
-        sim = session['simulation']
+        changes = {}
         
         # ✅ KRIITTINEN: Tallenna time_remaining
         if 'time_remaining' in data:
-            sim['time_remaining'] = int(data['time_remaining'])
-            app.logger.info(f"💾 Tallennetaan time_remaining: {sim['time_remaining']} sek")
+            changes['time_remaining'] = int(data['time_remaining'])
+            app.logger.info(f"💾 Tallennetaan time_remaining: {changes['time_remaining']} sek")
         
         # Päivitä muut kentät
         if 'answers' in data:
-            sim['answers'] = data['answers']
+            changes['answers'] = data['answers']
         
         if 'current_index' in data:
-            sim['current_index'] = data['current_index']
+            changes['current_index'] = int(data['current_index'])
         
-        session.modified = True
+        # Vastaukset kirjoitetaan heti: palautus voi osua toiseen workeriin
+        success, error = simulation_store.save(current_user.id, session_id, **changes)
+        if not success:
+            if error == 'not_found':
+                return jsonify({'error': 'No active simulation'}), 404
+            return jsonify({'error': error}), 500
         
         return jsonify({
             'success': True,
-            'time_remaining': sim.get('time_remaining', 3600)
+            'time_remaining': changes.get('time_remaining', SIMULATION_DURATION_SECONDS)
         })
         
     except Exception as e:
@@ -1023,7 +1045,7 @@ def get_review_questions_api():
     
     try:
         # Muunna dataclass-objekti sanakirjaksi
-        question_data = asdict(question)
+        question_data = question.to_dict()
     except Exception as e:
         app.logger.error(f"Virhe review-kysymyksen käsittelyssä: {e}")
         return jsonify({'question': None, 'distractor': None})
@@ -1039,6 +1061,18 @@ def get_review_questions_api():
     return jsonify({'question': question_data, 'distractor': distractor})
 
 
+@app.route("/api/review/due_count")
+@login_required
+@limiter.limit("60 per minute")
+def get_review_due_count_api():
+    """Erääntyvien kertausten määrä nyt / tänään / tällä viikolla."""
+    try:
+        return jsonify(spaced_repetition_manager.count_due(current_user.id))
+    except Exception as e:
+        app.logger.error(f"Virhe kertausmäärien haussa: {e}")
+        return jsonify({'now': 0, 'today': 0, 'week': 0}), 500
+
+
 @app.route("/api/recommendations")
 @login_required
 @limiter.limit("30 per minute")
@@ -1068,34 +1102,29 @@ def terms_route():
 def dashboard():
     """Optimoitu dashboard älykäillä suosituksilla v1.1.0"""
     
-    # Perustiedot
-    stats = stats_manager.get_learning_analytics(current_user.id)
-    streak = stats_manager.get_user_streak(current_user.id)
-    
-    # Erääntyvät kertaukset
-    due_reviews = len(spaced_repetition_manager.get_due_questions(current_user.id, limit=100))
+    # Kaikki osiot kerran, rinnakkain (ks. logic/dashboard_manager.py)
+    data, _timings = dashboard_manager.assemble(current_user.id)
+    stats = data['stats']
+    streak = data['streak']
+    due_reviews = data['due_reviews']
     
     # Vastatut vs. kaikki kysymykset
     answered_questions = stats['general']['answered_questions']
     total_questions = stats['general']['total_questions_in_db']
     
     # Viikon edistys
-    weekly_improvement = calculate_weekly_improvement(current_user.id)
+    weekly_improvement = data['weekly_improvement']
     
     # Saavutukset
-    try:
-        unlocked_achievements = len(achievement_manager.get_unlocked_achievements(current_user.id))
-        recent_achievements = achievement_manager.get_recent_achievements(current_user.id, limit=3)
-    except:
-        unlocked_achievements = 0
-        recent_achievements = []
+    unlocked_achievements = data['achievements']['unlocked']
+    recent_achievements = data['achievements']['recent']
     
     # Kategoriat top 5 heikoimmat
     categories = stats['categories']
     categories_sorted = sorted(categories, key=lambda x: x.get('success_rate', 0))
     
     # ÄLYKÄS SUOSITUS
-    recommendation = generate_smart_recommendation(current_user.id, stats, streak)
+    recommendation = generate_smart_recommendation(current_user.id, stats, streak, due_reviews=due_reviews)
     
     return render_template('dashboard.html',
                          due_reviews=due_reviews,
@@ -1108,7 +1137,7 @@ def dashboard():
                          categories=categories_sorted,
                          recommendation=recommendation)
 
-def generate_smart_recommendation(user_id, stats, streak):
+def generate_smart_recommendation(user_id, stats, streak, due_reviews=None):
     """Generoi personoitu älykäs suositus käyttäjälle"""
     
     recommendations = []
@@ -1144,7 +1173,8 @@ def generate_smart_recommendation(user_id, stats, streak):
         })
     
     # 4. Tarkista erääntyvät kertaukset
-    due_reviews = len(spaced_repetition_manager.get_due_questions(user_id, limit=100))
+    if due_reviews is None:
+        due_reviews = spaced_repetition_manager.count_due_questions(user_id)
     if due_reviews >= 10:
         recommendations.append({
             'priority': 'high',
@@ -1170,31 +1200,10 @@ def generate_smart_recommendation(user_id, stats, streak):
 
 def calculate_weekly_improvement(user_id):
     """Laske viikon edistyminen prosentteina"""
-    
-    now = datetime.now()
-    week_ago = now - timedelta(days=7)
-    two_weeks_ago = now - timedelta(days=14)
-    
     try:
-        # PostgreSQL versio
-        this_week = execute_query("""
-            SELECT AVG(CASE WHEN correct THEN 1.0 ELSE 0.0 END) as avg_rate
-            FROM question_attempts
-            WHERE user_id = %s AND timestamp >= %s
-        """, (user_id, week_ago), fetch='one')
-        
-        last_week = execute_query("""
-            SELECT AVG(CASE WHEN correct THEN 1.0 ELSE 0.0 END) as avg_rate
-            FROM question_attempts
-            WHERE user_id = %s AND timestamp >= %s AND timestamp < %s
-        """, (user_id, two_weeks_ago, week_ago), fetch='one')
-        
-        if this_week and last_week and this_week.get('avg_rate') and last_week.get('avg_rate'):
-            improvement = ((this_week['avg_rate'] - last_week['avg_rate']) / last_week['avg_rate']) * 100
-            return round(improvement, 1)
+        return stats_manager.get_weekly_improvement(user_id)
     except Exception as e:
         app.logger.error(f"Virhe viikon edistymisen laskemisessa: {e}")
-    
     return 0
 
 @app.route("/practice")
@@ -1239,16 +1248,14 @@ def calculator_route():
 @app.route('/simulation')
 @login_required
 def simulation_route():
-    """Renderöi koesimulaatiosivun session-pohjaisella mallilla."""
-    has_existing_session = 'simulation' in session and session['simulation'].get('user_id') == current_user.id
+    """Renderöi koesimulaatiosivun; tila on palvelimella (SimulationStore)."""
+    sim = get_current_simulation()
+    has_existing_session = sim is not None
     
     # ============================================
     # UUSI KOE
     # ============================================
     if request.args.get('new') == 'true':
-        if has_existing_session:
-            session.pop('simulation', None)
-        
         # Hae satunnaiset kysymykset
         question_ids = db_manager.get_random_question_ids(50)
         
@@ -1256,16 +1263,10 @@ def simulation_route():
             flash(f"Simulaation luonti epäonnistui: tietokannassa ei ole tarpeeksi kysymyksiä (vaaditaan 50, löytyi {len(question_ids)}).", "danger")
             return redirect(url_for('dashboard_route'))
 
-        # ✅ Luo uusi sessio
-        session['simulation'] = {
-            'user_id': current_user.id,
-            'question_ids': question_ids,
-            'answers': [None] * len(question_ids),
-            'current_index': 0,
-            'start_time': datetime.now(timezone.utc).isoformat(),
-            'time_remaining': 3600  # ✅ Tallenna alkuperäinen aika
-        }
-        session.modified = True
+        # ✅ Luo uusi sessio (korvaa mahdollisen edellisen)
+        sim = simulation_store.create(current_user.id, question_ids, SIMULATION_DURATION_SECONDS)
+        session.pop('simulation', None)  # vanha cookie-pohjainen tila
+        session['simulation_id'] = sim['session_id']
         app.logger.info(f"✅ Uusi simulaatio luotu: {len(question_ids)} kysymystä, 60 min")
         return redirect(url_for('simulation_route', resume='true'))
 
@@ -1275,20 +1276,15 @@ def simulation_route():
     session_info = {}
     
     if has_existing_session:
-        sim = session['simulation']
-        
         if 'time_remaining' in sim and sim['time_remaining'] is not None:
             time_remaining = max(0, int(sim['time_remaining']))
         else:
             # ✅ Käytetään simulation_managerin funktiota ajan laskemiseen
             time_remaining = calculate_remaining_time(
                 sim.get('start_time'), 
-                3600  # 60 min = 3600 sek
+                SIMULATION_DURATION_SECONDS
             )
-
-        # ✅ UUSI: Tallenna time_remaining AINA kun ladataan sessio
         sim['time_remaining'] = time_remaining
-        session.modified = True
         
         # Rakenna session_info
         session_info = {
@@ -1307,12 +1303,12 @@ def simulation_route():
     if request.args.get('resume') == 'true' and has_existing_session:
         app.logger.info(f"▶️ Jatketaan simulaatiota")
         return render_template('simulation.html', 
-                              session_data=session['simulation'], 
+                              session_data=sim, 
                               has_existing_session=True,
                               session_info=session_info)
 
     return render_template('simulation.html', 
-                          session_data=session.get('simulation', {}), 
+                          session_data=sim or {}, 
                           has_existing_session=has_existing_session,
                           session_info=session_info)
 
@@ -1589,25 +1585,18 @@ def admin_bulk_delete_duplicates_route():
             flash('⚠️ Ei kelvollisia kysymys-ID:itä.', 'warning')
             return redirect(url_for('admin_find_duplicates_route'))
         
-        # Poistetaan kysymykset
-        deleted_count = 0
-        failed_count = 0
-        
-        for question_id in question_ids:
-            success, error = db_manager.delete_question(question_id)
-            if success:
-                deleted_count += 1
-            else:
-                failed_count += 1
-                app.logger.error(f"Failed to delete question {question_id}: {error}")
+        # Poistetaan kysymykset yhdessä transaktiossa
+        success, result = db_manager.delete_questions(question_ids)
         
         # Näytä tulokset
-        if deleted_count > 0:
-            flash(f'✅ Poistettiin {deleted_count} duplikaattikysymystä onnistuneesti!', 'success')
-            app.logger.info(f"Admin {current_user.username} bulk deleted {deleted_count} duplicate questions")
-        
-        if failed_count > 0:
-            flash(f'⚠️ {failed_count} kysymyksen poisto epäonnistui.', 'warning')
+        if not success:
+            flash(f'❌ Kysymysten poisto epäonnistui: {result}', 'danger')
+            app.logger.error(f"Failed to delete questions {question_ids}: {result}")
+        elif result > 0:
+            flash(f'✅ Poistettiin {result} duplikaattikysymystä onnistuneesti!', 'success')
+            app.logger.info(f"Admin {current_user.username} bulk deleted {result} duplicate questions")
+        else:
+            flash('⚠️ Kysymyksiä ei löytynyt (ne on jo poistettu).', 'warning')
         
     except ValueError as e:
         flash(f'❌ Virheelliset kysymys-ID:t: {str(e)}', 'danger')
@@ -1639,42 +1628,41 @@ def admin_add_question_route():
         if not all([question_text, explanation, category, difficulty]) or not all(options) or not correct_answer_text:
             flash('Kaikki kentät ovat pakollisia.', 'danger')
             categories_for_template = db_manager.get_categories()
-            return render_template("admin_add_question.html", categories=categories_for_template)
+            return render_template("add_question.html", categories=categories_for_template)
 
         if correct_answer_text not in options:
             flash('Oikea vastaus ei löydy vaihtoehdoista!', 'danger')
             categories_for_template = db_manager.get_categories()
-            return render_template("admin_add_question.html", categories=categories_for_template)
+            return render_template("add_question.html", categories=categories_for_template)
         
-        # UUSI: Tarkista duplikaatti
+        # Tarkista sama tai lähes sama kysymys (pysyvä samankaltaisuusindeksi)
         is_duplicate, existing = db_manager.check_question_duplicate(question_text)
         
         if is_duplicate:
             flash(
                 f'⚠️ Vastaava kysymys on jo kannassa!\n'
                 f'ID: {existing["id"]} | Kategoria: {existing["category"]} | '
+                f'Samankaltaisuus: {existing["similarity"]}% | '
                 f'Kysymys: "{existing["question"][:100]}..."',
                 'warning'
             )
             categories_for_template = db_manager.get_categories()
-            return render_template("admin_add_question.html", categories=categories_for_template)
+            return render_template("add_question.html", categories=categories_for_template)
             
         random.shuffle(options)
         correct = options.index(correct_answer_text)
 
-        try:
-            question_normalized = db_manager.normalize_question(question_text)
-            execute_query('''
-                INSERT INTO questions (question, question_normalized, options, correct, explanation, category, difficulty, created_at)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (question_text, question_normalized, json.dumps(options), correct, explanation, category, difficulty, datetime.now()), fetch='none')
-            
+        # Lisäys ja vain uuden rivin indeksointi samassa transaktiossa (ks. DatabaseManager.add_question)
+        success, error = db_manager.add_question({
+            'question': question_text, 'explanation': explanation, 'options': options,
+            'correct': correct, 'category': category, 'difficulty': difficulty,
+        })
+        if success:
             flash('Kysymys lisätty onnistuneesti!', 'success')
             app.logger.info(f"Admin {current_user.username} added new question in category {category}")
             return redirect(url_for('admin_route'))
-        except Exception as e:
-            flash(f'Virhe kysymyksen lisäämisessä: {e}', 'danger')
-            app.logger.error(f"Question add error: {e}")
+        flash(f'Virhe kysymyksen lisäämisessä: {error}', 'danger')
+        app.logger.error(f"Question add error: {error}")
 
     try:
         categories = db_manager.get_categories()
@@ -1684,6 +1672,78 @@ def admin_add_question_route():
 
     return render_template("add_question.html", categories=categories)
 
+
+@app.route("/admin/api/similar_questions")
+@admin_required
+def admin_similar_questions_api():
+    """Lisäyslomakkeen esitarkistus: k samankaltaisinta kysymystä annetulle tekstille."""
+    question_text = request.args.get('q', '').strip()
+    if len(question_text) < 10:
+        return jsonify({'similar': []})
+    k = min(request.args.get('k', 5, type=int), 20)
+    similar = db_manager.find_similar_to(question_text, k=k, min_similarity=0.5)
+    return jsonify({'similar': similar, 'duplicate_threshold': NEAR_DUPLICATE_THRESHOLD * 100})
+
+
+# Taustatöiden otsikot työn sivulla (ks. data_access/job_runner.py)
+JOB_TITLES = {
+    'duplicates': 'Duplikaattihaku',
+    'export_pdf': 'PDF-vienti',
+    'export_word': 'Word-vienti',
+    'bulk_upload': 'Kysymysten massalataus',
+    'merge_categories': 'Kategorioiden yhdistäminen',
+}
+
+
+@app.route("/admin/jobs/<job_id>")
+@admin_required
+def admin_job_route(job_id):
+    """Taustatyön sivu: näyttää edistymisen ja lopuksi tuloksen tai latauslinkin."""
+    job = db_manager.jobs.get(job_id)
+    if not job:
+        flash('Taustatyötä ei löytynyt (päättyneet työt poistetaan vuorokauden jälkeen).', 'warning')
+        return redirect(url_for('admin_route'))
+    return render_template('admin_job.html', job_id=job_id, title=JOB_TITLES.get(job['kind'], job['kind']))
+
+
+@app.route("/admin/api/jobs/<job_id>")
+@admin_required
+def admin_job_status_api(job_id):
+    """Taustatyön tila pollausta varten; tulos palautetaan, kun työ on valmis."""
+    job = db_manager.jobs.get(job_id)
+    if not job:
+        return jsonify({'error': 'Taustatyötä ei löytynyt'}), 404
+    
+    payload = {
+        'id': job['id'],
+        'kind': job['kind'],
+        'status': job['status'],
+        'done': job['progress_done'],
+        'total': job['progress_total'],
+        'message': job['message'],
+        'error': job['error'],
+    }
+    if job['status'] == STATUS_DONE:
+        payload['result'] = job['result']
+        if db_manager.jobs.output_file_path(job):
+            payload['download_url'] = url_for('admin_job_download_route', job_id=job_id)
+        if job['kind'] == 'duplicates':
+            payload['result_url'] = url_for('admin_find_duplicates_route', job=job_id)
+    return jsonify(payload)
+
+
+@app.route("/admin/jobs/<job_id>/download")
+@admin_required
+def admin_job_download_route(job_id):
+    """Lataa valmiin taustatyön tiedoston (PDF/Word-vienti)."""
+    job = db_manager.jobs.get(job_id)
+    path = db_manager.jobs.output_file_path(job) if job else None
+    if not path:
+        flash('Tiedostoa ei löytynyt (päättyneet työt poistetaan vuorokauden jälkeen).', 'warning')
+        return redirect(url_for('admin_route'))
+    return send_file(path, as_attachment=True, download_name=job['output_file'])
+
+
 @app.route("/admin/questions")
 @admin_required
 def admin_questions_route():
@@ -1759,64 +1819,35 @@ def admin_bulk_upload_route():
         return redirect(url_for('admin_route'))
     
     try:
-        content = file.read().decode('utf-8')
-        questions_data = json.loads(content)
-        
-        if not isinstance(questions_data, list):
+        # Tiedosto jäsennetään taustatyössä alkio kerrallaan; tässä tarkistetaan vain alku
+        head = file.stream.read(1024).lstrip(b'\xef\xbb\xbf \t\r\n')
+        file.stream.seek(0)
+        if not head or head == b'[]':
             if is_ajax:
-                return jsonify({'success': False, 'error': 'JSON-tiedoston tulee sisältää lista kysymyksiä.'}), 400
-            flash('JSON-tiedoston tulee sisältää lista kysymyksiä.', 'danger')
+                return jsonify({'success': False, 'error': 'JSON-tiedosto on tyhjä.'}), 400
+            flash('JSON-tiedosto on tyhjä.', 'warning')
             return redirect(url_for('admin_route'))
         
-        if len(questions_data) == 0:
+        if not head.startswith(b'['):
             if is_ajax:
-                return jsonify({'success': False, 'error': 'JSON-tiedosto on tyhjä.'}), 400
-            flash('JSON-tiedosto on tyhjä.', 'warning')
+                return jsonify({'success': False, 'error': 'JSON-tiedoston tulee sisältää lista kysymyksiä.'}), 400
+            flash('JSON-tiedoston tulee sisältää lista kysymyksiä.', 'danger')
             return redirect(url_for('admin_route'))
         
-        success, result = db_manager.bulk_add_questions(questions_data)
+        upload_path = db_manager.jobs.upload_path('.json')
+        file.save(upload_path)
         
-        if success:
-            stats = result
-            
-            # Lokita onnistunut lataus
-            app.logger.info(f"Admin {current_user.username} uploaded {stats['added']} questions from JSON")
-            
-            # Jos AJAX-pyyntö, palauta JSON
-            if is_ajax:
-                return jsonify({
-                    'success': True,
-                    'added': stats.get('added', 0),
-                    'duplicates': stats.get('duplicates', 0),
-                    'skipped': stats.get('skipped', 0),
-                    'errors': stats.get('errors', [])
-                }), 200
-            
-            # Muuten flash-viestit ja redirect (vanha tapa)
-            if stats['added'] > 0:
-                flash(f"✅ Lisättiin {stats['added']} kysymystä onnistuneesti!", 'success')
-            if stats['duplicates'] > 0:
-                flash(f"🔄 Ohitettiin {stats['duplicates']} duplikaattia", 'info')
-            if stats['skipped'] > 0:
-                flash(f"⚠️ Ohitettiin {stats['skipped']} kysymystä muiden virheiden vuoksi", 'warning')
-            if stats['errors']:
-                error_msg = "Virheet:\n" + "\n".join(stats['errors'][:10])
-                if len(stats['errors']) > 10:
-                    error_msg += f"\n... ja {len(stats['errors']) - 10} muuta"
-                flash(error_msg, 'info')
-        else:
-            if is_ajax:
-                return jsonify({'success': False, 'error': f'Virhe kysymysten lataamisessa: {result}'}), 500
-            flash(f'Virhe kysymysten lataamisessa: {result}', 'danger')
-            app.logger.error(f"Bulk upload error: {result}")
-    
-    except json.JSONDecodeError as e:
-        error_msg = f'Virheellinen JSON-tiedosto: {str(e)}'
-        app.logger.error(f"JSON decode error in bulk upload: {e}")
+        # Lisäys taustatyönä: worker vapautuu heti, selain seuraa edistymistä
+        job_id = db_manager.jobs.submit('bulk_upload', run_bulk_upload_job, upload_path, current_user.username,
+                                        user_id=current_user.id)
         if is_ajax:
-            return jsonify({'success': False, 'error': error_msg}), 400
-        flash(error_msg, 'danger')
-        
+            return jsonify({
+                'success': True,
+                'job_id': job_id,
+                'status_url': url_for('admin_job_status_api', job_id=job_id)
+            }), 202
+        return redirect(url_for('admin_job_route', job_id=job_id))
+    
     except Exception as e:
         error_msg = f'Odottamaton virhe: {str(e)}'
         app.logger.error(f"Unexpected error in bulk upload: {e}")
@@ -1827,36 +1858,87 @@ def admin_bulk_upload_route():
     return redirect(url_for('admin_route'))
 
 
+def run_bulk_upload_job(job, upload_path, username):
+    """Taustatyö: tuo ladatun JSON-tiedoston kysymykset erissä (ks. admin_bulk_upload_route)."""
+    try:
+        size = os.path.getsize(upload_path)
+        # SQLitessä edistymistä ei kirjoiteta tuonnin transaktion aikana (ks. import_questions):
+        # ilman kokonaismäärää tilasivu näyttää etenemättömän 0 %:n sijaan käynnissä olevan palkin
+        job.progress(0, size if db_manager.is_postgres else None, 'Tuodaan kysymyksiä')
+        with open(upload_path, 'rb') as f:
+            success, stats = db_manager.import_questions(
+                iter_json_array(f),
+                # Edistyminen tavuina luetusta tiedostosta; viesti pysyy samana, jotta
+                # JobContext.progress harventaa kirjoitukset (ei UPDATEa joka erästä)
+                progress=lambda _processed, _stats: job.progress(f.tell(), size, 'Tuodaan kysymyksiä')
+            )
+    finally:
+        os.remove(upload_path)
+    if not success:
+        raise RuntimeError(f'Virhe kysymysten lataamisessa: {stats}')
+    job.progress(size, size, 'Valmis')
+    app.logger.info(f"Admin {username} uploaded {stats['added']} questions from JSON")
+
+    summary = []
+    if not stats['added'] + stats['duplicates'] + stats['skipped']:
+        summary.append('JSON-tiedosto on tyhjä.')
+    if stats['added'] > 0:
+        summary.append(f"✅ Lisättiin {stats['added']} kysymystä onnistuneesti!")
+    if stats['duplicates'] > 0:
+        summary.append(f"🔄 Ohitettiin {stats['duplicates']} duplikaattia")
+    if stats['skipped'] > 0:
+        summary.append(f"⚠️ Ohitettiin {stats['skipped']} kysymystä muiden virheiden vuoksi")
+    summary.extend(stats['errors'][:10])
+    if len(stats['errors']) > 10:
+        summary.append(f"... ja {len(stats['errors']) - 10} muuta")
+    return {**stats, 'summary': summary}
+
+
 @app.route("/admin/find_duplicates", methods=['GET', 'POST'])
 @admin_required
 def admin_find_duplicates_route():
-    """Etsii duplikaatit ja samankaltaiset kysymykset."""
+    """
+    Etsii duplikaatit ja samankaltaiset kysymykset. POST käynnistää haun
+    taustatyönä; valmiin työn tulokset näytetään osoitteessa ?job=<id>.
+    """
     
     if request.method == 'POST':
         # Hae threshold lomakkeesta (oletuksena 95%)
         similarity_threshold = float(request.form.get('threshold', 95)) / 100
-        
-        try:
-            similar_questions = db_manager.find_similar_questions(similarity_threshold)
-            
-            if not similar_questions:
-                flash(f'✅ Ei löytynyt duplikaatteja tai samankaltaisuus {similarity_threshold*100:.0f}% kysymyksiä!', 'success')
-            else:
-                flash(f'🔍 Löydettiin {len(similar_questions)} samankaltaista kysymysparia (kynnys: {similarity_threshold*100:.0f}%)', 'info')
-            
-            return render_template('admin_duplicates.html', 
-                                   similar_questions=similar_questions, 
-                                   threshold=similarity_threshold*100)
-        
-        except Exception as e:
-            flash(f'Virhe duplikaattien etsinnässä: {str(e)}', 'danger')
-            app.logger.error(f"Duplicate search error: {e}")
-            return redirect(url_for('admin_route'))
+        job_id = db_manager.jobs.submit('duplicates', run_duplicate_scan_job, similarity_threshold,
+                                        user_id=current_user.id)
+        return redirect(url_for('admin_job_route', job_id=job_id))
+    
+    job_id = request.args.get('job')
+    if job_id:
+        job = db_manager.jobs.get(job_id)
+        if not job or job['kind'] != 'duplicates':
+            flash('Duplikaattihakua ei löytynyt (tulokset poistetaan vuorokauden jälkeen).', 'warning')
+            return redirect(url_for('admin_find_duplicates_route'))
+        if job['status'] != STATUS_DONE:
+            return redirect(url_for('admin_job_route', job_id=job_id))
+        result = job['result']
+        return render_template('admin_duplicates.html',
+                               similar_questions=result['pairs'],
+                               threshold=result['threshold'] * 100)
     
     # GET-pyyntö: näytä lomake
     return render_template('admin_duplicates.html', similar_questions=None, threshold=95)
 
 
+def run_duplicate_scan_job(job, similarity_threshold):
+    """Taustatyö: koko pankin duplikaattihaku (ks. admin_find_duplicates_route)."""
+    job.progress(0, 1, 'Verrataan kysymyksiä')
+    similar_questions = db_manager.find_similar_questions(similarity_threshold)
+    job.progress(1, 1, 'Valmis')
+    if not similar_questions:
+        summary = [f'✅ Ei löytynyt duplikaatteja tai samankaltaisuus {similarity_threshold*100:.0f}% kysymyksiä!']
+    else:
+        summary = [f'🔍 Löydettiin {len(similar_questions)} samankaltaista kysymysparia '
+                   f'(kynnys: {similarity_threshold*100:.0f}%)']
+    return {'pairs': similar_questions, 'threshold': similarity_threshold, 'summary': summary}
+
+
 @app.route("/admin/clear_database", methods=['POST'])
 @admin_required
 def admin_clear_database_route():
@@ -1920,6 +2002,18 @@ def admin_route():
 
         return redirect(url_for('dashboard_route'))
 
+@app.route("/admin/db_pool_stats")
+@admin_required
+def admin_db_pool_stats_route():
+    """Palauttaa tämän workerin tietokantayhteyspoolin mittarit."""
+    stats = db_manager.get_pool_stats()
+    stats['pid'] = os.getpid()
+    stats['question_cache'] = db_manager.question_cache.stats()
+    stats['simulation_store'] = simulation_store.stats()
+    stats['user_cache'] = db_manager.user_cache.stats()
+    stats['attempt_log'] = db_manager.attempt_log.stats() if db_manager.attempt_log else None
+    return jsonify(stats)
+
 @app.route("/admin/validation")
 @admin_required
 def admin_validation_route():
@@ -1990,7 +2084,8 @@ def admin_validate_question_route(question_id):
             WHERE id = ?
         """, ('validated', current_user.id, datetime.now(), comment if comment else None, question_id), 
         fetch='none')
-        
+        db_manager.invalidate_question_cache()
+
         app.logger.info(f"Admin {current_user.username} validated question {question_id}")
         
         # Jos AJAX-pyyntö, palauta JSON
@@ -2026,23 +2121,13 @@ def admin_bulk_validate_route():
             flash('Virheelliset kysymys-ID:t.', 'danger')
             return redirect(url_for('admin_validation_route'))
         
-        # Validoidaan kaikki
-        validated_count = 0
-        for question_id in ids:
-            try:
-                db_manager._execute("""
-                    UPDATE questions 
-                    SET status = ?, 
-                        validated_by = ?, 
-                        validated_at = ?,
-                        validation_comment = ?
-                    WHERE id = ?
-                """, ('validated', current_user.id, datetime.now(), comment if comment else None, question_id), 
-                fetch='none')
-                validated_count += 1
-            except Exception as e:
-                app.logger.error(f"Bulk validate error for question {question_id}: {e}")
-        
+        # Validoidaan kaikki yhdellä lauseella
+        success, result = db_manager.validate_questions(ids, current_user.id, comment)
+        if not success:
+            flash(f'Virhe bulk-validoinnissa: {result}', 'danger')
+            return redirect(url_for('admin_validation_route'))
+        validated_count = result
+
         flash(f'✅ Validoitu {validated_count} kysymystä onnistuneesti!', 'success')
         app.logger.info(f"Admin {current_user.username} bulk validated {validated_count} questions")
         
@@ -2066,6 +2151,7 @@ def admin_unvalidate_question_route(question_id):
                 validation_comment = NULL
             WHERE id = ?
         """, ('needs_review', question_id), fetch='none')
+        db_manager.invalidate_question_cache()
         
         flash(f'Validointi poistettu kysymykseltä #{question_id}', 'info')
         app.logger.info(f"Admin {current_user.username} removed validation from question {question_id}")
@@ -2389,7 +2475,7 @@ def admin_export_questions_document_route():
     """Vie kysymykset PDF- tai Word-dokumenttiin ammattimaisessa muodossa."""
     
     if request.method == 'POST':
-        export_format = request.form.get('format', 'pdf')
+        export_format = 'pdf' if request.form.get('format', 'pdf') == 'pdf' else 'word'
         include_answers = request.form.get('include_answers') == 'on'
         sort_by = request.form.get('sort_by', 'id')
         check_duplicates = request.form.get('check_duplicates') == 'on'
@@ -2421,64 +2507,15 @@ def admin_export_questions_document_route():
             }
             query += f" ORDER BY {sort_mapping.get(sort_by, 'id ASC')}"
             
-            questions = execute_query(query, tuple(params), fetch='all')
-                    
-            if not questions:
-                flash('Ei kysymyksiä vietäväksi valituilla suodattimilla.', 'warning')
-                return redirect(url_for('admin_export_questions_document_route'))
-            
-            # Tarkista duplikaatit jos pyydetty
-            duplicate_info = None
-            if check_duplicates:
-                similar = db_manager.find_similar_questions(0.95)
-                if similar:
-                    duplicate_info = f"⚠️ Löydettiin {len(similar)} mahdollista duplikaattia!"
-            
-            # Muunna kysymykset listaksi
-            questions_list = []
-            for q in questions:
-                questions_list.append({
-                    'id': q['id'],
-                    'question': q['question'],
-                    'options': json.loads(q['options']),
-                    'correct': q['correct'],
-                    'explanation': q['explanation'],
-                    'category': q['category'],
-                    'difficulty': q['difficulty']
-                })
-            
-            # Luo dokumentti
-            if export_format == 'pdf':
-                pdf_buffer = create_pdf_document(questions_list, include_answers, duplicate_info)
-                timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                filename = f'LOVe_Kysymykset_{timestamp}.pdf'
-                
-                from flask import make_response
-                response = make_response(pdf_buffer.getvalue())
-                response.headers['Content-Type'] = 'application/pdf'
-                response.headers['Content-Disposition'] = f'attachment; filename={filename}'
-                
-                app.logger.info(f"Admin {current_user.username} exported {len(questions_list)} questions to PDF")
-                return response
-            
-            else:  # Word
-                doc_buffer = create_word_document(questions_list, include_answers, duplicate_info)
-                timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                filename = f'LOVe_Kysymykset_{timestamp}.docx'
-                
-                from flask import make_response
-                response = make_response(doc_buffer.getvalue())
-                response.headers['Content-Type'] = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
-                response.headers['Content-Disposition'] = f'attachment; filename={filename}'
-                
-                app.logger.info(f"Admin {current_user.username} exported {len(questions_list)} questions to Word")
-                return response
+            job_id = db_manager.jobs.submit(
+                f'export_{export_format}', run_export_document_job, query, tuple(params), export_format,
+                include_answers, check_duplicates, current_user.username, user_id=current_user.id
+            )
+            return redirect(url_for('admin_job_route', job_id=job_id))
             
         except Exception as e:
             flash(f'Virhe dokumentin luomisessa: {str(e)}', 'danger')
             app.logger.error(f"Document export error: {e}")
-            import traceback
-            traceback.print_exc()
             return redirect(url_for('admin_export_questions_document_route'))
     
     # GET - Näytä lomake
@@ -2497,6 +2534,60 @@ def admin_export_questions_document_route():
         return redirect(url_for('admin_route'))
 
 
+EXPORT_ALL_QUERY = """
+    SELECT id, question, explanation, options, correct, category, difficulty
+    FROM questions
+    ORDER BY category, id
+"""
+
+
+def run_export_document_job(job, query, params, export_format, include_answers, check_duplicates, username):
+    """Taustatyö: PDF- tai Word-dokumentti kysymyksistä; tiedosto ladataan työn sivulta."""
+    label = 'PDF' if export_format == 'pdf' else 'Word'
+    job.progress(0, 3, 'Haetaan kysymykset')
+    questions = execute_query(query, params, fetch='all')
+    if not questions:
+        raise RuntimeError('Ei kysymyksiä vietäväksi valituilla suodattimilla.')
+    
+    # Tarkista duplikaatit jos pyydetty
+    duplicate_info = None
+    if check_duplicates:
+        job.progress(1, 3, 'Tarkistetaan duplikaatit')
+        similar = db_manager.find_similar_questions(0.95, question_ids=[q['id'] for q in questions])
+        if similar:
+            duplicate_info = f"⚠️ Löydettiin {len(similar)} mahdollista duplikaattia!"
+    
+    questions_list = []
+    for q in questions:
+        questions_list.append({
+            'id': q['id'],
+            'question': q['question'],
+            'options': json.loads(q['options']),
+            'correct': q['correct'],
+            'explanation': q['explanation'],
+            'category': q['category'],
+            'difficulty': q['difficulty']
+        })
+    
+    job.progress(2, 3, f'Luodaan {label}-dokumentti ({len(questions_list)} kysymystä)')
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    if export_format == 'pdf':
+        buffer = create_pdf_document(questions_list, include_answers, duplicate_info)
+        filename = f'LOVe_Kysymykset_{timestamp}.pdf'
+    else:
+        buffer = create_word_document(questions_list, include_answers, duplicate_info)
+        filename = f'LOVe_Kysymykset_{timestamp}.docx'
+    with open(job.output_path(filename), 'wb') as f:
+        f.write(buffer.getvalue())
+    job.progress(3, 3, 'Valmis')
+    
+    app.logger.info(f"Admin {username} exported {len(questions_list)} questions to {label}")
+    summary = [f"📄 {len(questions_list)} kysymystä viety tiedostoon {filename}"]
+    if duplicate_info:
+        summary.append(duplicate_info)
+    return {'count': len(questions_list), 'summary': summary}
+
+
 def create_pdf_document(questions, include_answers, duplicate_info=None):
     """Luo ammattimaisen PDF-dokumentin kysymyksistä."""
     buffer = BytesIO()
@@ -2804,27 +2895,26 @@ def create_word_document(questions, include_answers, duplicate_info=None):
 @app.route("/admin/merge_categories", methods=['POST'])
 @admin_required
 def admin_merge_categories_route():
-    """Yhdistää kategoriat kuuteen pääkategoriaan."""
-    try:
-        success, result = db_manager.merge_categories_to_standard()
-        
-        if success:
-            stats = result
-            flash(f"✅ Kategoriat yhdistetty onnistuneesti! Päivitettiin {stats['updated']} kysymystä.", 'success')
-            
-            category_summary = ", ".join([f"{cat}: {count}" for cat, count in stats['categories'].items()])
-            flash(f"📊 Lopulliset kategoriat: {category_summary}", 'info')
-            
-            app.logger.info(f"Admin {current_user.username} merged categories")
-        else:
-            flash(f'Virhe kategorioiden yhdistämisessä: {result}', 'danger')
-            app.logger.error(f"Category merge error: {result}")
-    
-    except Exception as e:
-        flash(f'Odottamaton virhe: {str(e)}', 'danger')
-        app.logger.error(f"Unexpected error in category merge: {e}")
-    
-    return redirect(url_for('admin_route'))
+    """Yhdistää kategoriat kuuteen pääkategoriaan (taustatyönä)."""
+    job_id = db_manager.jobs.submit('merge_categories', run_merge_categories_job, current_user.username,
+                                    user_id=current_user.id)
+    return redirect(url_for('admin_job_route', job_id=job_id))
+
+
+def run_merge_categories_job(job, username):
+    """Taustatyö: kategorioiden yhdistäminen (ks. admin_merge_categories_route)."""
+    job.progress(0, 1, 'Yhdistetään kategorioita')
+    success, result = db_manager.merge_categories_to_standard()
+    if not success:
+        raise RuntimeError(f'Virhe kategorioiden yhdistämisessä: {result}')
+    job.progress(1, 1, 'Valmis')
+    app.logger.info(f"Admin {username} merged categories")
+    
+    category_summary = ", ".join([f"{cat}: {count}" for cat, count in result['categories'].items()])
+    return {**result, 'summary': [
+        f"✅ Kategoriat yhdistetty onnistuneesti! Päivitettiin {result['updated']} kysymystä.",
+        f"📊 Lopulliset kategoriat: {category_summary}"
+    ]}
 
 @app.route("/admin/export_questions")
 @admin_required
@@ -2891,99 +2981,19 @@ def edit_user_settings(user_id):
 @app.route("/admin/export_pdf", methods=['GET'])
 @admin_required
 def admin_export_pdf_quick():
-    """Vie kaikki kysymykset PDF-tiedostoon."""
-    try:
-        questions = execute_query("""
-            SELECT id, question, explanation, options, correct, category, difficulty
-            FROM questions
-            ORDER BY category, id
-        """, fetch='all')
-        
-        if not questions:
-            flash('Ei kysymyksiä vietäväksi.', 'warning')
-            return redirect(url_for('admin_route'))
-        
-        questions_list = []
-        for q in questions:
-            questions_list.append({
-                'id': q['id'],
-                'question': q['question'],
-                'options': json.loads(q['options']),
-                'correct': q['correct'],
-                'explanation': q['explanation'],
-                'category': q['category'],
-                'difficulty': q['difficulty']
-            })
-        
-        pdf_buffer = create_pdf_document(questions_list, include_answers=True, duplicate_info=None)
-        
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f'LOVe_Kysymykset_{timestamp}.pdf'
-        
-        app.logger.info(f"Admin {current_user.username} exported {len(questions_list)} questions to PDF")
-        
-        from flask import make_response
-        response = make_response(pdf_buffer.getvalue())
-        response.headers['Content-Type'] = 'application/pdf'
-        response.headers['Content-Disposition'] = f'attachment; filename={filename}'
-        
-        return response
-        
-    except Exception as e:
-        flash(f'Virhe PDF-viennissä: {str(e)}', 'danger')
-        app.logger.error(f"PDF export error: {e}")
-        import traceback
-        traceback.print_exc()
-        return redirect(url_for('admin_route'))
+    """Vie kaikki kysymykset PDF-tiedostoon (taustatyönä)."""
+    job_id = db_manager.jobs.submit('export_pdf', run_export_document_job, EXPORT_ALL_QUERY, (), 'pdf',
+                                    True, False, current_user.username, user_id=current_user.id)
+    return redirect(url_for('admin_job_route', job_id=job_id))
 
 
 @app.route("/admin/export_word", methods=['GET'])
 @admin_required
 def admin_export_word_quick():
-    """Vie kaikki kysymykset Word-tiedostoon."""
-    try:
-        questions = execute_query("""
-            SELECT id, question, explanation, options, correct, category, difficulty
-            FROM questions
-            ORDER BY category, id
-        """, fetch='all')
-        
-        if not questions:
-            flash('Ei kysymyksiä vietäväksi.', 'warning')
-            return redirect(url_for('admin_route'))
-        
-        questions_list = []
-        for q in questions:
-            questions_list.append({
-                'id': q['id'],
-                'question': q['question'],
-                'options': json.loads(q['options']),
-                'correct': q['correct'],
-                'explanation': q['explanation'],
-                'category': q['category'],
-                'difficulty': q['difficulty']
-            })
-        
-        doc_buffer = create_word_document(questions_list, include_answers=True, duplicate_info=None)
-        
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f'LOVe_Kysymykset_{timestamp}.docx'
-        
-        app.logger.info(f"Admin {current_user.username} exported {len(questions_list)} questions to Word")
-        
-        from flask import make_response
-        response = make_response(doc_buffer.getvalue())
-        response.headers['Content-Type'] = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
-        response.headers['Content-Disposition'] = f'attachment; filename={filename}'
-        
-        return response
-        
-    except Exception as e:
-        flash(f'Virhe Word-viennissä: {str(e)}', 'danger')
-        app.logger.error(f"Word export error: {e}")
-        import traceback
-        traceback.print_exc()
-        return redirect(url_for('admin_route'))
+    """Vie kaikki kysymykset Word-tiedostoon (taustatyönä)."""
+    job_id = db_manager.jobs.submit('export_word', run_export_document_job, EXPORT_ALL_QUERY, (), 'word',
+                                    True, False, current_user.username, user_id=current_user.id)
+    return redirect(url_for('admin_job_route', job_id=job_id))
 
 
 @app.route("/admin/export_json", methods=['GET'])
@@ -3081,6 +3091,14 @@ def init_database_now():
         return f"❌ Virhe taulujen luomisessa: {str(e)}"
 
 
+@app.cli.command('rebuild-stats')
+@click.option('--user-id', type=int, multiple=True, help='Vain nämä käyttäjät (oletus: kaikki).')
+def rebuild_stats_command(user_id):
+    """Laskee user_stats_summary-koosteet uudelleen historiasta (backfill)."""
+    count = stats_manager.rebuild_all_summaries(list(user_id) or None)
+    click.echo(f"Tilastokoosteet laskettu uudelleen: {count} käyttäjää.")
+
+
 @app.route('/emergency-reset-admin')
 def emergency_reset_admin():
     """
@@ -3179,6 +3197,7 @@ def emergency_reset_admin():
                     ('admin', admin_username),
                     fetch='none'
                 )
+                db_manager.invalidate_user_cache()
                 
                 return f"""
                 <!DOCTYPE html>
@@ -3316,6 +3335,7 @@ def start_test():
     question_count = data.get('question_count', 30)
     difficulty = data.get('difficulty')
     time_limit = data.get('time_limit', 30)
+    seed = data.get('seed')  # Sama siemen -> sama kysymysjoukko (toistettava koe)
     
     if test_type == 'quick' and len(selected_categories) > 2:
         return jsonify({'error': 'Maksimi 2 kategoriaa nopeatestissä'}), 400
@@ -3325,12 +3345,13 @@ def start_test():
     
     try:
         if test_type == 'full':
-            questions = db_manager.get_random_questions(count=50)
+            questions = db_manager.get_random_questions(count=50, seed=seed)
         else:
             questions = db_manager.get_questions_by_categories(
                 categories=selected_categories,
                 count=question_count,
-                difficulty=difficulty
+                difficulty=difficulty,
+                seed=seed
             )
         
         if len(questions) < question_count:
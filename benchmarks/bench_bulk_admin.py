@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# benchmarks/bench_bulk_admin.py
+"""
+Vertailee ylläpidon joukkotoimintoja (1000 ID:n erä) SQLite-kannassa.
+
+  validointi: UPDATE per ID (vanha /admin/bulk_validate)
+              vs. DatabaseManager.validate_questions
+  poisto:     delete_question per ID, jokainen lause omana committinaan
+              (vanha /admin/bulk_delete_duplicates) vs. delete_questions
+  kategoriat: UPDATE per kuvaus (vanha merge_categories_to_standard)
+              vs. remap_categories
+
+Kannassa on --questions kysymystä, ja --users käyttäjällä vastaukset ja
+edistyminen jokaiseen kysymykseen. Jokainen mittaus ajetaan omaan kantaan.
+
+    python benchmarks/bench_bulk_admin.py [--questions 20000] [--batch 1000]
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.pop('DATABASE_URL', None)
+logging.disable(logging.CRITICAL)
+
+from data_access.database_manager import DatabaseManager  # noqa: E402
+
+CATEGORIES = ['Lääkelaskut', 'lääkkeiden jako', 'Potilasturvallisuus', 'ammattietiikka', 'farmakologia', 'laskut']
+MAPPING = {
+    'lääkelaskut': 'laskut',
+    'lääkkeiden jako': 'annosjakelu',
+    'lääkehoidon turvallisuus': 'turvallisuus',
+    'potilasturvallisuus': 'turvallisuus',
+    'ammattietiikka': 'etiikka',
+    'etiikka ja turvallisuus': 'etiikka',
+    'kliininen': 'kliininen farmakologia',
+    'farmakologia': 'kliininen farmakologia'
+}
+
+
+def populate(db, questions, users):
+    now = datetime.now()
+    with db.pool.connection() as conn:
+        conn.executemany(
+            "INSERT INTO questions (id, question, question_normalized, explanation, options, correct, category, "
+            "difficulty) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            [(i, f"Kysymys {i}", f"kysymys {i}", "Selitys", json.dumps(["a", "b", "c", "d"]), 0,
+              CATEGORIES[i % len(CATEGORIES)], 'helppo') for i in range(1, questions + 1)]
+        )
+        for user_id in range(1, users + 1):
+            conn.executemany(
+                "INSERT INTO question_attempts (user_id, question_id, correct, time_taken, timestamp) "
+                "VALUES (?, ?, 1, 5, ?)", [(user_id, i, now) for i in range(1, questions + 1)]
+            )
+            conn.executemany(
+                "INSERT INTO user_question_progress (user_id, question_id, times_shown, times_correct, last_shown) "
+                "VALUES (?, ?, 1, 1, ?)", [(user_id, i, now) for i in range(1, questions + 1)]
+            )
+        conn.commit()
+
+
+def legacy_validate(db, ids):
+    for question_id in ids:
+        db._execute(
+            "UPDATE questions SET status = ?, validated_by = ?, validated_at = ?, validation_comment = ? WHERE id = ?",
+            ('validated', 1, datetime.now(), None, question_id)
+        )
+    db.invalidate_question_cache()
+    return len(ids)
+
+
+def legacy_delete(db, ids):
+    for question_id in ids:
+        db.reset_user_aggregates(question_id=question_id)
+        db._execute("DELETE FROM user_question_progress WHERE question_id = ?", (question_id,))
+        db._execute("DELETE FROM question_attempts WHERE question_id = ?", (question_id,))
+        db._execute("DELETE FROM questions WHERE id = ?", (question_id,))
+        db.similarity_index.remove([question_id])
+        db.invalidate_question_cache()
+    return len(ids)
+
+
+def legacy_remap(db, _ids):
+    for old_cat, new_cat in MAPPING.items():
+        db._execute("UPDATE questions SET category = ? WHERE LOWER(category) = LOWER(?)", (new_cat, old_cat))
+    db.reset_user_aggregates()
+    db.invalidate_question_cache()
+    return None
+
+
+def bulk_validate(db, ids):
+    return db.validate_questions(ids, 1)[1]
+
+
+def bulk_delete(db, ids):
+    return db.delete_questions(ids)[1]
+
+
+def bulk_remap(db, _ids):
+    return db.remap_categories(MAPPING)[1]
+
+
+def measure(tmp, args, func, ids):
+    db = DatabaseManager(os.path.join(tmp, f'bench_{time.monotonic_ns()}.db'))
+    db.init_database()
+    populate(db, args.questions, args.users)
+    started = time.perf_counter()
+    result = func(db, ids)
+    return (time.perf_counter() - started) * 1e3, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--questions', type=int, default=20000)
+    parser.add_argument('--users', type=int, default=5)
+    parser.add_argument('--batch', type=int, default=1000)
+    args = parser.parse_args()
+    ids = random.Random(7).sample(range(1, args.questions + 1), args.batch)
+
+    print(f"{args.questions} kysymystä, {args.users} käyttäjää, erä {args.batch} ID:tä")
+    print(f"{'toiminto':12} {'vanha ms':>10} {'uusi ms':>10} {'nopeutus':>9} {'rivejä':>7}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, legacy, bulk in (('validointi', legacy_validate, bulk_validate),
+                                   ('poisto', legacy_delete, bulk_delete),
+                                   ('kategoriat', legacy_remap, bulk_remap)):
+            old_ms, _ = measure(tmp, args, legacy, ids)
+            new_ms, rows = measure(tmp, args, bulk, ids)
+            print(f"{name:12} {old_ms:10.1f} {new_ms:10.1f} {old_ms / new_ms:8.1f}x {rows:7}")
+
+
+if __name__ == '__main__':
+    main()
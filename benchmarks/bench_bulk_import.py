@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# benchmarks/bench_bulk_import.py
+"""
+Vertailee kysymysten massatuontia (/admin/bulk_upload) SQLite-kannassa.
+
+  rivi kerrallaan: aiempi bulk_add_questions, eli json.load koko
+                   tiedostolle ja jokaiselle kysymykselle oma duplikaattihaku
+                   (check_question_duplicate) ja oma INSERT
+  erissä:          DatabaseManager.import_questions(iter_json_array(tiedosto)),
+                   ks. data_access/question_import.py
+
+Tuotava tiedosto tehdään Kysymykset/-pankista monistamalla (kuten
+bench_duplicates.py). Joka kymmenes kysymys on tarkka kopio, joka
+kahdeskymmenes yhden merkin muutos ja joka viideskymmenes virheellinen.
+Kanta alustetaan joka mittaukselle Kysymykset/-pankilla. Muistista
+mitataan Pythonin huippukäyttö (tracemalloc) tuonnin aikana erillisellä
+ajolla, koska tracemalloc hidastaa ajoa.
+
+    python benchmarks/bench_bulk_import.py [--sizes 2000,10000]
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_duplicates import load_bank, replicate  # noqa: E402
+from data_access.database_manager import DatabaseManager  # noqa: E402
+from data_access.question_import import iter_json_array  # noqa: E402
+
+
+def as_question(text):
+    return {'question': text, 'options': ['a', 'b', 'c', 'd'], 'correct': 0,
+            'explanation': 'selitys', 'category': 'laskut', 'difficulty': 'helppo'}
+
+
+def make_file(path, bank, size, rng):
+    texts, _known = replicate(bank, len(bank) + size, 0.5, rng)
+    questions = []
+    for i, text in enumerate(texts[len(bank):]):
+        if i % 50 == 49:
+            questions.append({'question': text, 'options': 'ei lista'})
+        elif i % 20 == 19:
+            position = rng.randrange(len(text))
+            questions.append(as_question(text[:position] + 'x' + text[position + 1:]))
+        elif i % 10 == 9:
+            questions.append(as_question(questions[rng.randrange(len(questions))]['question']))
+        else:
+            questions.append(as_question(text))
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(questions, f, ensure_ascii=False)
+
+
+def fresh_db(tmp, bank):
+    db = DatabaseManager(os.path.join(tmp, f'bench_{time.monotonic_ns()}.db'))
+    db.init_database()
+    db.import_questions([as_question(text) for text in bank])
+    return db
+
+
+def row_by_row(db, path):
+    """Aiempi bulk_add_questions (kysymys kerrallaan); options tarkistetaan, jotta määrät ovat vertailukelpoisia."""
+    with open(path, encoding='utf-8') as f:
+        questions = json.load(f)
+    stats = {'added': 0, 'duplicates': 0, 'skipped': 0}
+    with db.transaction():
+        for q_data in questions:
+            try:
+                options_json = json.dumps(q_data['options'])
+                normalized = db.normalize_question(q_data['question'])
+                if db.check_question_duplicate(q_data['question'])[0]:
+                    stats['duplicates'] += 1
+                    continue
+                if not isinstance(q_data['options'], list):
+                    raise ValueError('options')
+                with db.transaction():
+                    db._insert_question(q_data, normalized, options_json)
+                stats['added'] += 1
+            except Exception:
+                stats['skipped'] += 1
+    return stats
+
+
+def batched(db, path):
+    with open(path, 'rb') as f:
+        success, stats = db.import_questions(iter_json_array(f))
+    assert success, stats
+    return stats
+
+
+def measure(func, tmp, bank, path):
+    started = time.perf_counter()
+    stats = func(fresh_db(tmp, bank), path)
+    elapsed = time.perf_counter() - started
+
+    db = fresh_db(tmp, bank)
+    tracemalloc.start()
+    func(db, path)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak / 1e6, stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='2000,10000')
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+    rng = random.Random(7)
+    bank = load_bank()
+
+    print(f"{'kysymyksiä':>10} {'tapa':16} {'s':>7} {'kys/s':>7} {'muisti MB':>10} "
+          f"{'lisätty':>8} {'duplik.':>8} {'ohitettu':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in (int(s) for s in args.sizes.split(',')):
+            path = os.path.join(tmp, f'upload_{size}.json')
+            make_file(path, bank, size, rng)
+            for name, func in (('rivi kerrallaan', row_by_row), ('erissä', batched)):
+                elapsed, peak, stats = measure(func, tmp, bank, path)
+                print(f"{size:10} {name:16} {elapsed:7.2f} {size / elapsed:7.0f} {peak:10.1f} "
+                      f"{stats['added']:8} {stats['duplicates']:8} {stats['skipped']:8}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# benchmarks/bench_duplicates.py
+"""
+Vertailee duplikaattihakua (/admin/find_duplicates) Kysymykset/-pankeilla.
+
+  täysi:  vanha find_similar_questions, SequenceMatcher jokaiselle parille
+  indeksi: data_access/similarity.py (kolmikot + MinHash/LSH)
+
+1. Tarkkuus: molemmat ajetaan --verify-size kysymyksen otokselle, ja
+   indeksin löytämiä pareja verrataan täyden vertailun pareihin
+   kynnyksillä 95/90/80/70 %.
+2. Skaalautuvuus: pankit monistetaan --sizes kokoihin. Kopioissa osa
+   sanoista vaihdetaan pankin muihin sanoihin (--mutation), joten kopiot
+   eivät ole toistensa duplikaatteja. Joka sadas kopio on yhden merkin
+   muutos olemassa olevasta kysymyksestä (tunnettu duplikaatti).
+   Täyden vertailun aika arvioidaan parimäärästä ja mitatusta parihinnasta.
+
+    python benchmarks/bench_duplicates.py [--sizes 5000,20000,50000] [--threshold 0.95]
+"""
+import argparse
+import glob
+import json
+import os
+import random
+import sys
+import time
+from difflib import SequenceMatcher
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from data_access.similarity import find_similar_pairs  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_bank():
+    texts = []
+    for path in sorted(glob.glob(os.path.join(ROOT, 'Kysymykset', '*.json'))):
+        try:
+            with open(path, encoding='utf-8-sig') as f:
+                data = json.load(f)
+        except ValueError:
+            continue
+        texts.extend(q['question'] for q in data if isinstance(q, dict) and q.get('question'))
+    return texts
+
+
+def full_scan(questions, threshold):
+    """Vanha find_similar_questions ilman tietokantaa."""
+    pairs = set()
+    for i, q1 in enumerate(questions):
+        for q2 in questions[i + 1:]:
+            if SequenceMatcher(None, q1['question'].lower(), q2['question'].lower()).ratio() >= threshold:
+                pairs.add((q1['id'], q2['id']))
+    return pairs
+
+
+def as_rows(texts):
+    return [{'id': i + 1, 'question': text, 'category': 'laskut'} for i, text in enumerate(texts)]
+
+
+def replicate(texts, size, mutation, rng):
+    """Monistaa pankin; palauttaa (tekstit, tunnetut duplikaattiparit id-muodossa)."""
+    vocabulary = sorted({word for text in texts for word in text.split()})
+    result = list(texts)
+    known = set()
+    while len(result) < size:
+        if len(result) % 100 == 0:
+            source = rng.randrange(len(result))
+            text = result[source]
+            position = rng.randrange(len(text))
+            result.append(text[:position] + rng.choice('abcdefghijklmnopqrstuvwxyzäö') + text[position + 1:])
+            known.add((source + 1, len(result)))
+        else:
+            words = rng.choice(texts).split()
+            result.append(' '.join(rng.choice(vocabulary) if rng.random() < mutation else word for word in words))
+    return result, known
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='5000,20000,50000')
+    parser.add_argument('--threshold', type=float, default=0.95)
+    parser.add_argument('--verify-size', type=int, default=400)
+    parser.add_argument('--mutation', type=float, default=0.5)
+    args = parser.parse_args()
+    rng = random.Random(42)
+
+    texts = load_bank()
+    print(f"Kysymykset/: {len(texts)} kysymystä")
+
+    sample = as_rows(rng.sample(texts, min(args.verify_size, len(texts))))
+    started = time.perf_counter()
+    full_scan(sample, 1.01)
+    pair_us = (time.perf_counter() - started) / (len(sample) * (len(sample) - 1) / 2) * 1e6
+    print(f"täysi vertailu: {pair_us:.1f} µs/pari ({len(sample)} kysymyksen otos)")
+    for threshold in (0.95, 0.9, 0.8, 0.7):
+        expected = full_scan(sample, threshold)
+        found = {(p['id1'], p['id2']) for p in find_similar_pairs(sample, threshold)}
+        assert found <= expected
+        recall = len(found) / len(expected) if expected else 1.0
+        print(f"  kynnys {threshold:.0%}: täysi {len(expected)} paria, indeksi {len(found)} (osuvuus {recall:.1%})")
+
+    print(f"\n{'kysymyksiä':>10} {'indeksi s':>10} {'täysi s (arvio)':>16} {'pareja':>8} {'tunnetut':>9}")
+    for size in (int(s) for s in args.sizes.split(',')):
+        bank, known = replicate(texts, size, args.mutation, rng)
+        rows = as_rows(bank)
+        # Lyhyessä kysymyksessä yksikin merkki voi pudottaa parin kynnyksen alle
+        known = {(a, b) for a, b in known
+                 if SequenceMatcher(None, bank[a - 1].lower(), bank[b - 1].lower()).ratio() >= args.threshold}
+        started = time.perf_counter()
+        pairs = find_similar_pairs(rows, args.threshold)
+        elapsed = time.perf_counter() - started
+        found = {(p['id1'], p['id2']) for p in pairs}
+        estimate = size * (size - 1) / 2 * pair_us / 1e6
+        print(f"{size:10} {elapsed:10.1f} {estimate:16.0f} {len(pairs):8} {len(known & found):4}/{len(known):<4}")
+
+
+if __name__ == '__main__':
+    main()
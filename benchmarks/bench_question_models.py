@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# benchmarks/bench_question_models.py
+"""
+Vertailee kysymysmallien muistinkäyttöä ja luontiaikaa kysymyspankin latauksessa.
+
+  dict-dataclass:   Question ilman __slots__ (vanha malli, jokaisella oma __dict__)
+  Question:         nykyinen Question (@dataclass(slots=True))
+  PracticeQuestion: harjoittelun näkymä välimuistin kysymyksestä (ei validointikenttiä,
+                    options jaetaan välimuistin kanssa)
+  replace:          vanha tapa lisätä edistyminen: dataclasses.replace + options-kopio
+
+Muisti mitataan tracemallocilla ja sisältää vain itse objektit (kentät, joihin
+objektit viittaavat, ovat kaikissa samat). Tietokantaa ei tarvita:
+    python benchmarks/bench_question_models.py [--questions 10000]
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+from dataclasses import dataclass, fields, make_dataclass, replace
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.models import Question, PracticeQuestion  # noqa: E402
+
+# Vanha malli: samat kentät, ei __slots__
+LegacyQuestion = dataclass(make_dataclass(
+    'LegacyQuestion', [(f.name, f.type, f) for f in fields(Question)]
+))
+
+PROGRESS = {'times_shown': 3, 'times_correct': 2, 'last_shown': datetime(2025, 1, 1),
+            'ease_factor': 2.5, 'interval': 6}
+
+
+def make_rows(count):
+    created = datetime(2025, 1, 1)
+    options = [["a", "b", "c", "d"] for _ in range(count)]
+    return [
+        {'id': i, 'question': f"Kysymys {i}?", 'options': options[i], 'correct': i % 4,
+         'explanation': f"Selitys {i}", 'category': 'laskut', 'difficulty': 'helppo',
+         'status': 'validated', 'validated_by': 1, 'validated_at': created,
+         'question_normalized': f"kysymys {i}", 'created_at': created}
+        for i in range(count)
+    ]
+
+
+def with_progress_legacy(question):
+    return replace(
+        question, options=list(question.options),
+        times_shown=PROGRESS['times_shown'] or 0, times_correct=PROGRESS['times_correct'] or 0,
+        last_shown=PROGRESS['last_shown'], ease_factor=PROGRESS['ease_factor'] or 2.5,
+        interval=PROGRESS['interval'] or 1,
+    )
+
+
+def measure(build):
+    """Palauttaa (objektit, ms, tavua/objekti). Aika mitataan ilman tracemallocia."""
+    started = time.perf_counter()
+    build()
+    elapsed_ms = (time.perf_counter() - started) * 1e3
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    objects = build()
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    # Listan oma osoitintaulukko ei kuulu objektien kokoon
+    size -= sys.getsizeof(objects)
+    return objects, elapsed_ms, size / len(objects)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--questions', type=int, default=10000)
+    args = parser.parse_args()
+
+    rows = make_rows(args.questions)
+    legacy, legacy_ms, legacy_bytes = measure(lambda: [LegacyQuestion(**row) for row in rows])
+    questions, question_ms, question_bytes = measure(lambda: [Question(**row) for row in rows])
+    practice, practice_ms, practice_bytes = measure(
+        lambda: [PracticeQuestion.from_question(question, PROGRESS) for question in questions]
+    )
+    _, replace_ms, replace_bytes = measure(lambda: [with_progress_legacy(question) for question in questions])
+    assert legacy[0].__dict__ and not hasattr(questions[0], '__dict__') and not hasattr(practice[0], '__dict__')
+
+    print(f"{args.questions} kysymystä")
+    print(f"{'malli':18} {'luonti ms':>10} {'tavua/objekti':>14}")
+    for name, ms, size in (('dict-dataclass', legacy_ms, legacy_bytes),
+                           ('Question', question_ms, question_bytes),
+                           ('PracticeQuestion', practice_ms, practice_bytes),
+                           ('replace', replace_ms, replace_bytes)):
+        print(f"{name:18} {ms:10.1f} {size:14.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# benchmarks/bench_question_sampling.py
+"""
+Vertailee satunnaisten kysymysten arvontaa eri kokoisilla kysymyspankeilla.
+
+  order_by_random: SELECT * ... ORDER BY RANDOM() LIMIT k (vanha get_random_questions)
+  ids_shuffle:     kaikki ID:t kannasta + random.shuffle (vanha get_questions)
+  sampler:         question_sampler.sample_question_ids välimuistin jaosta
+
+Ajetaan väliaikaista SQLite-tietokantaa vasten:
+    python benchmarks/bench_question_sampling.py [--sizes 1000 10000 100000] [--k 50]
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.pop('DATABASE_URL', None)
+logging.disable(logging.CRITICAL)
+
+from data_access.database_manager import DatabaseManager  # noqa: E402
+from data_access.question_sampler import sample_question_ids, make_rng  # noqa: E402
+
+CATEGORIES = ['laskut', 'turvallisuus', 'annosjakelu', 'etiikka', 'kliininen farmakologia']
+DIFFICULTIES = ['helppo', 'keskivaikea', 'vaikea']
+
+
+def populate(db, size):
+    rows = [
+        (f"Kysymys {i}", f"kysymys {i}", "Selitys", json.dumps(["a", "b", "c", "d"]), i % 4,
+         CATEGORIES[i % len(CATEGORIES)], DIFFICULTIES[i % len(DIFFICULTIES)])
+        for i in range(size)
+    ]
+    with db.pool.connection() as conn:
+        conn.executemany(
+            "INSERT INTO questions (question, question_normalized, explanation, options, correct, category, difficulty) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)", rows
+        )
+        conn.commit()
+
+
+def order_by_random(db, k, categories):
+    placeholders = ','.join(['?'] * len(categories))
+    rows = db._execute(
+        f"SELECT * FROM questions WHERE category IN ({placeholders}) ORDER BY RANDOM() LIMIT ?",
+        (*categories, k), fetch='all'
+    )
+    return [dict(row, options=json.loads(row['options'])) for row in rows]
+
+
+def ids_shuffle(db, k, categories):
+    placeholders = ','.join(['?'] * len(categories))
+    rows = db._execute(f"SELECT id FROM questions WHERE category IN ({placeholders})", tuple(categories), fetch='all')
+    ids = [row['id'] for row in rows]
+    random.shuffle(ids)
+    return ids[:k]
+
+
+def sampler(db, k, categories):
+    snapshot = db.question_cache.snapshot()
+    ids = sample_question_ids(snapshot, k, categories=categories, rng=make_rng())
+    return [snapshot.by_id[question_id] for question_id in ids]
+
+
+def timed(func, *args, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        func(*args)
+    return (time.perf_counter() - started) / repeat * 1e3
+
+
+def snapshot_for_seed_check():
+    from data_access.question_cache import QuestionBankSnapshot
+    from models.models import Question
+    questions = [
+        Question(id=i, question='', options=[], correct=0, explanation='',
+                 category=CATEGORIES[i % len(CATEGORIES)], difficulty=DIFFICULTIES[i % len(DIFFICULTIES)])
+        for i in range(1, 1001)
+    ]
+    return QuestionBankSnapshot(0, questions)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--k', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    categories = CATEGORIES[:2]
+    print(f"k={args.k}, kategoriat={categories}, ms/arvonta (keskiarvo {args.repeat} kierroksesta)")
+    print(f"{'kysymyksiä':>10} {'order_by_random':>16} {'ids_shuffle':>12} {'sampler':>9} {'välimuistin lataus':>19}")
+
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            db = DatabaseManager(os.path.join(tmp, 'bench.db'))
+            db.init_database()
+            populate(db, size)
+            db.invalidate_question_cache()
+
+            started = time.perf_counter()
+            db.question_cache.snapshot()
+            load_ms = (time.perf_counter() - started) * 1e3
+            db.question_cache.check_interval = float('inf')
+
+            results = [timed(func, db, args.k, categories, repeat=args.repeat)
+                       for func in (order_by_random, ids_shuffle, sampler)]
+            db.pool.close_all()
+
+        print(f"{size:>10} {results[0]:>16.3f} {results[1]:>12.3f} {results[2]:>9.3f} {load_ms:>19.1f}")
+
+    # Toistettavuus: sama siemen -> sama arvonta
+    snapshot = snapshot_for_seed_check()
+    assert sample_question_ids(snapshot, 10, rng=make_rng(42)) == sample_question_ids(snapshot, 10, rng=make_rng(42))
+    print("Siemennetty arvonta toistettava: ok")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# benchmarks/bench_question_serialization.py
+"""
+Mittaa /api/questions-vastauksen kysymyskohtaisen käsittelyn hinnan.
+
+  vanha: random.shuffle(q.options) + options.index(oikea teksti) + dataclasses.asdict(q)
+  uusi:  Question.to_dict(shuffle=True) (valmiit permutaatiot, ei syväkopiota)
+
+Kysymykset eivät tarvitse tietokantaa:
+    python benchmarks/bench_question_serialization.py [--questions 50] [--repeat 2000]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from collections import Counter
+from dataclasses import asdict, replace
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.models import Question  # noqa: E402
+
+
+def make_questions(count):
+    return [
+        Question(id=i, question=f"Kysymys {i}?", options=[f"vaihtoehto {j}" for j in range(4)], correct=i % 4,
+                 explanation="Selitys " * 20, category='laskut', difficulty='helppo', times_shown=3,
+                 times_correct=2, last_shown=datetime.now(), status='validated', created_at=datetime.now())
+        for i in range(count)
+    ]
+
+
+def legacy(questions):
+    result = []
+    for q in questions:
+        # Muokkaa kysymyksiä paikallaan kuten vanha polku (get_questions palautti kopiot)
+        if q.options and 0 <= q.correct < len(q.options):
+            original_correct_text = q.options[q.correct]
+            random.shuffle(q.options)
+            q.correct = q.options.index(original_correct_text)
+        result.append(asdict(q))
+    return result
+
+
+def fast(questions):
+    return [q.to_dict(shuffle=True) for q in questions]
+
+
+def timed(func, questions, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        func(questions)
+    return (time.perf_counter() - started) / (repeat * len(questions)) * 1e6
+
+
+def check(questions):
+    """Oikea vastaus säilyy ja kaikki järjestykset ovat yhtä todennäköisiä."""
+    question = questions[1]
+    positions = Counter()
+    for _ in range(24000):
+        data = question.to_dict(shuffle=True)
+        assert data['options'][data['correct']] == question.options[question.correct]
+        assert sorted(data['options']) == sorted(question.options)
+        positions[data['correct']] += 1
+    assert all(5000 < n < 7000 for n in positions.values()), positions
+    # Samansisältöiset vaihtoehdot: vanha .index() saattoi osoittaa väärään, uusi seuraa indeksiä
+    duplicate = replace(question, options=['a', 'a', 'b', 'c'], correct=1)
+    assert all(duplicate.to_dict(shuffle=True)['options'].count('a') == 2 for _ in range(100))
+    assert set(asdict(question)) == set(question.to_dict())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--questions', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=2000)
+    args = parser.parse_args()
+
+    questions = make_questions(args.questions)
+    check(questions)
+    print("Oikea vastaus säilyy, järjestykset tasajakautuneita: ok")
+
+    fast_us = timed(fast, questions, args.repeat)
+    legacy_us = timed(legacy, questions, args.repeat)
+    print(f"vanha {legacy_us:7.2f} µs/kysymys")
+    print(f"uusi  {fast_us:7.2f} µs/kysymys  ({legacy_us / fast_us:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
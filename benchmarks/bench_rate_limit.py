@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# benchmarks/bench_rate_limit.py
+"""
+Mittaa rate limitin hinnan /api/submit_answer-tyyppisessä reitissä ja
+tarkistaa, että laskurit ovat workerien yhteisiä.
+
+  ei rajaa:  Limiter pois päältä (vertailukohta)
+  memory://  workerikohtaiset laskurit (vanha asetus)
+  sqlite://  data_access/rate_limit_storage.py, yhteinen tiedosto
+
+Overhead = pyynnön aika - vertailukohta (paras --rounds kierroksesta). Suurin
+osa siitä on Flask-Limiterin omaa rajojen käsittelyä, joka on sama kaikilla
+tallennuksilla. µs/osuma on pelkän tallennuksen hinta; /api/submit_answer
+tekee yhden osuman (reitin oma raja korvaa oletusrajat). Skripti päättyy
+virhekoodiin, jos sqlite://-osuma ylittää budjetin (--budget-us).
+
+Rinnakkaistesti käynnistää --workers prosessia, jotka kaikki osuvat samaan
+"--limit per minute" -rajaan. Yhteisillä laskureilla sallittuja osumia on
+täsmälleen --limit, memory://-tallennuksella workers × limit.
+
+    python benchmarks/bench_rate_limit.py [--requests 5000] [--budget-us 100] [--workers 4]
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask, jsonify  # noqa: E402
+from flask_limiter import Limiter  # noqa: E402
+from limits import parse  # noqa: E402
+from limits.storage import storage_from_string  # noqa: E402
+from limits.strategies import FixedWindowRateLimiter  # noqa: E402
+
+from data_access.rate_limit_storage import SQLiteRateLimitStorage  # noqa: E402
+
+
+def make_app(storage_uri, enabled=True):
+    app = Flask(__name__)
+    app.config['RATELIMIT_ENABLED'] = enabled
+    limiter = Limiter(lambda: '127.0.0.1', app=app, default_limits=["500 per day", "100 per hour"],
+                      storage_uri=storage_uri)
+
+    @app.route("/api/submit_answer", methods=['POST'])
+    @limiter.limit("1000000 per minute")  # sama kustannus kuin 100 per minute, mutta ei 429-vastauksia
+    def submit_answer_api():
+        return jsonify({'success': True})
+
+    app.limiter = limiter  # Flask-Limiter viittaa itseensä heikosti
+    return app
+
+
+def per_request_us(app, requests, rounds=5):
+    """Paras kierros (µs/pyyntö), jotta satunnainen kohina ei näy overheadina."""
+    client = app.test_client()
+    for _ in range(100):
+        client.post('/api/submit_answer')
+    best = None
+    for _ in range(rounds):
+        started = time.perf_counter()
+        for _ in range(requests // rounds):
+            response = client.post('/api/submit_answer')
+        elapsed = (time.perf_counter() - started) / (requests // rounds) * 1e6
+        assert response.status_code == 200, response.status_code
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def per_hit_us(storage_uri, hits):
+    """Pelkän tallennuksen osuman hinta ilman Flaskia."""
+    limiter = FixedWindowRateLimiter(storage_from_string(storage_uri))
+    item = parse("100 per minute")
+    started = time.perf_counter()
+    for i in range(hits):
+        limiter.hit(item, 'submit_answer', str(i % 50))
+    return (time.perf_counter() - started) / hits * 1e6
+
+
+def _worker(storage_uri, limit, hits, results):
+    limiter = FixedWindowRateLimiter(storage_from_string(storage_uri))
+    item = parse(f"{limit} per minute")
+    results.put(sum(limiter.hit(item, 'submit_answer', '127.0.0.1') for _ in range(hits)))
+
+
+def allowed_across_workers(storage_uri, workers, limit):
+    ctx = multiprocessing.get_context('fork')
+    results = ctx.Queue()
+    processes = [ctx.Process(target=_worker, args=(storage_uri, limit, limit, results)) for _ in range(workers)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    return sum(results.get() for _ in processes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--budget-us', type=float, default=100.0)
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--limit', type=int, default=100)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        sqlite_uri = 'sqlite:///' + os.path.join(tmp, 'rate_limits.db')
+        # Import rekisteröi sqlite://-skeeman; varmistetaan, ettei limits käytä omaa toteutustaan
+        assert isinstance(storage_from_string(sqlite_uri), SQLiteRateLimitStorage)
+
+        baseline = per_request_us(make_app('memory://', enabled=False), args.requests, args.rounds)
+        memory = per_request_us(make_app('memory://'), args.requests, args.rounds)
+        sqlite = per_request_us(make_app(sqlite_uri), args.requests, args.rounds)
+        print(f"{args.requests} pyyntöä /api/submit_answer")
+        print(f"{'tallennus':10} {'µs/pyyntö':>10} {'overhead µs':>12} {'µs/osuma':>9}")
+        print(f"{'ei rajaa':10} {baseline:10.1f} {0:12.1f}")
+        memory_hit = per_hit_us('memory://', args.requests)
+        sqlite_hit = per_hit_us(sqlite_uri, args.requests)
+        for name, us, hit in (('memory://', memory, memory_hit), ('sqlite://', sqlite, sqlite_hit)):
+            print(f"{name:10} {us:10.1f} {us - baseline:12.1f} {hit:9.1f}")
+
+        shared = allowed_across_workers(sqlite_uri, args.workers, args.limit)
+        separate = allowed_across_workers('memory://', args.workers, args.limit)
+        print(f"{args.workers} workeria, raja {args.limit}/min: sallittu sqlite:// {shared}, memory:// {separate}")
+
+    assert shared == args.limit, f"yhteiset laskurit päästivät läpi {shared} osumaa (raja {args.limit})"
+    if sqlite_hit > args.budget_us:
+        print(f"YLITYS: sqlite://-osuma {sqlite_hit:.1f} µs > budjetti {args.budget_us:.0f} µs")
+        sys.exit(1)
+    print(f"sqlite://-osuma {sqlite_hit:.1f} µs ≤ budjetti {args.budget_us:.0f} µs: ok")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# benchmarks/bench_record_answer.py
+"""
+Vertailee vastauksen tallennuksen tietokantakierroksia ja kestoa.
+
+  vanha: update_question_stats (INSERT OR IGNORE + UPDATE + INSERT)
+         + SpacedRepetitionManager.record_review (UPDATE)
+  uusi:  DatabaseManager.record_answer (upsert + yritys; PostgreSQL:ssä yksi CTE)
+
+Ajetaan väliaikaista SQLite-tietokantaa vasten:
+    python benchmarks/bench_record_answer.py [--answers 2000]
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.pop('DATABASE_URL', None)
+logging.disable(logging.CRITICAL)
+
+from data_access.database_manager import DatabaseManager  # noqa: E402
+
+
+class CountingDatabaseManager(DatabaseManager):
+    """Laskee kaikki SQLiteen lähetetyt lauseet (myös BEGIN/COMMIT)."""
+
+    statements = 0
+
+    def get_connection(self):
+        conn = super().get_connection()
+        conn.set_trace_callback(self._count)
+        return conn
+
+    def _count(self, _sql):
+        CountingDatabaseManager.statements += 1
+
+
+def legacy_record(db, user_id, question_id, is_correct, time_taken, interval, ease_factor):
+    """Vanha polku sellaisena kuin app.py sen ajoi."""
+    db._execute(
+        "INSERT OR IGNORE INTO user_question_progress (user_id, question_id) VALUES (?, ?)",
+        (user_id, question_id)
+    )
+    db._execute(
+        "UPDATE user_question_progress SET times_shown = times_shown + 1, times_correct = times_correct + ?, last_shown = ? WHERE user_id = ? AND question_id = ?",
+        (1 if is_correct else 0, datetime.now(), user_id, question_id)
+    )
+    db._execute(
+        "INSERT INTO question_attempts (user_id, question_id, correct, time_taken) VALUES (?, ?, ?, ?)",
+        (user_id, question_id, bool(is_correct), time_taken)
+    )
+    db._execute(
+        "UPDATE user_question_progress SET interval = ?, ease_factor = ? WHERE user_id = ? AND question_id = ?",
+        (interval, ease_factor, user_id, question_id)
+    )
+
+
+def new_record(db, user_id, question_id, is_correct, time_taken, interval, ease_factor):
+    db.record_answer(user_id, question_id, is_correct, time_taken, interval=interval, ease_factor=ease_factor)
+
+
+def run(name, record, answers, question_count):
+    with tempfile.TemporaryDirectory() as tmp:
+        db = CountingDatabaseManager(os.path.join(tmp, 'bench.db'))
+        db.init_database()
+        db.migrate_database()
+
+        CountingDatabaseManager.statements = 0
+        started = time.perf_counter()
+        for i in range(answers):
+            record(db, 1, i % question_count + 1, i % 3 != 0, 10, 6, 2.5)
+        elapsed = time.perf_counter() - started
+        statements = CountingDatabaseManager.statements
+
+        row = db._execute(
+            "SELECT SUM(times_shown) AS shown, COUNT(*) AS rows_ FROM user_question_progress",
+            fetch='one'
+        )
+        attempts = db._execute("SELECT COUNT(*) AS count FROM question_attempts", fetch='one')['count']
+        db.pool.close_all()
+
+    print(f"{name:6} {statements / answers:6.1f} lausetta/vastaus  "
+          f"{elapsed / answers * 1e6:8.1f} µs/vastaus  "
+          f"(shown={row['shown']}, rivejä={row['rows_']}, yrityksiä={attempts})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--answers', type=int, default=2000)
+    parser.add_argument('--questions', type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{args.answers} vastausta, {args.questions} kysymystä (SQLite)")
+    run('vanha', legacy_record, args.answers, args.questions)
+    run('uusi', new_record, args.answers, args.questions)
+    print("PostgreSQL: uusi polku on yksi lause (WITH ... INSERT) eli yksi kierros/vastaus.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# benchmarks/bench_sm2_batch.py
+"""
+Vertailee kertausaikataulun massapäivityksen tallennusta:
+
+  skalaari: record_review (yksi UPDATE) kysymys kerrallaan transaktiossa
+  erä:      DatabaseManager.apply_review_schedule (executemany)
+
+Uudet arvot lasketaan kerran schedule_batchilla ennen mittausta; laskenta on
+molemmilla poluilla sama calculate_next_reviewin kaava, joten sitä ei mitata.
+
+Ajetaan väliaikaista SQLite-tietokantaa vasten:
+    python benchmarks/bench_sm2_batch.py [--rows 10000]
+"""
+import argparse
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.pop('DATABASE_URL', None)
+logging.disable(logging.CRITICAL)
+
+from data_access.database_manager import DatabaseManager  # noqa: E402
+from logic.spaced_repetition import SpacedRepetitionManager, schedule_batch  # noqa: E402
+
+
+def make_states(count, seed=42):
+    rng = random.Random(seed)
+    return [
+        (rng.randint(1, 60), round(rng.uniform(1.3, 3.0), 2), rng.randint(0, 20), rng.randint(0, 5))
+        for _ in range(count)
+    ]
+
+
+def timed(func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    return result, (time.perf_counter() - started) * 1e3
+
+
+def populate(db, states, user_id=1):
+    now = datetime.now()
+    with db.pool.connection() as conn:
+        conn.executemany(
+            "INSERT INTO user_question_progress (user_id, question_id, times_shown, times_correct, last_shown, "
+            "interval, ease_factor) VALUES (?, ?, ?, 0, ?, ?, ?)",
+            [(user_id, i + 1, times_shown, now, interval, ease_factor)
+             for i, (interval, ease_factor, times_shown, _rating) in enumerate(states)]
+        )
+        conn.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=10000)
+    args = parser.parse_args()
+
+    states = make_states(args.rows)
+    intervals, ease_factors = schedule_batch(*zip(*states))
+    schedule = list(zip(intervals, ease_factors))
+    print(f"{args.rows} kysymystä")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = DatabaseManager(os.path.join(tmp, 'bench.db'))
+        db.init_database()
+        manager = SpacedRepetitionManager(db)
+        # Kummallakin polulla oma käyttäjä, jotta molemmat päivittävät samat lähtörivit
+        populate(db, states, user_id=1)
+        populate(db, states, user_id=2)
+
+        def scalar_write():
+            with db.transaction():
+                for i, (interval, ease_factor) in enumerate(schedule):
+                    manager.record_review(1, i + 1, interval, ease_factor)
+
+        def batch_write():
+            success, error = db.apply_review_schedule(
+                (2, i + 1, interval, ease_factor) for i, (interval, ease_factor) in enumerate(schedule)
+            )
+            assert success, error
+
+        _, scalar_ms = timed(scalar_write)
+        _, batch_ms = timed(batch_write)
+        print(f"tallennus   skalaari {scalar_ms:8.1f} ms   erä {batch_ms:8.1f} ms")
+        db.pool.close_all()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+# data_access/attempt_log.py
+"""
+Vastausyritysten (question_attempts) kirjoitus pyynnön ulkopuolella.
+
+Kun ATTEMPT_LOG_WRITE_BEHIND=1, vastauspyyntö lisää yritykset workerin
+muistissa olevaan rajattuun jonoon ja taustasäie kirjoittaa jonon
+monirivisinä INSERTeinä, kun ATTEMPT_LOG_BATCH_SIZE riviä on kertynyt tai
+ATTEMPT_LOG_FLUSH_MS millisekuntia on kulunut. Edistyminen, SR-arvot,
+saavutuslaskurit ja tilastokooste kirjoitetaan edelleen pyynnössä.
+
+Kestävyys:
+- Yritys näkyy kannassa vasta flushin jälkeen (viive enintään noin
+  ATTEMPT_LOG_FLUSH_MS, kun kanta vastaa). flush() odottaa, että jono on
+  kirjoitettu (esim. ennen saavutuslaskureiden uudelleenrakennusta).
+- Hallittu sammutus (atexit, gunicornin worker_exit-hook) tyhjentää jonon.
+  Jos worker kuolee hallitsemattomasti (SIGKILL, OOM, gunicornin timeout),
+  jonossa olleet yritykset menetetään.
+- Epäonnistunut erä yritetään uudelleen kasvavalla viiveellä, eikä sitä
+  pudoteta. Vain sammutuksen aikana erä hylätään (ja kirjataan lokiin)
+  SHUTDOWN_RETRIES epäonnistuneen yrityksen jälkeen.
+- Yritys kirjataan jonoon vasta, kun edistymisen kirjoitus onnistui.
+  Jos pyynnön transaktio perutaan myöhemmin, yritys kirjoitetaan silti.
+
+Vastapaine: kun jono on täynnä (kanta hidas tai alhaalla), append odottaa
+enintään ATTEMPT_LOG_PUT_TIMEOUT sekuntia ja kirjoittaa loput rivit itse
+synkronisesti. Jono ei siis kasva rajatta, ja hidas kanta hidastaa
+vastauksia kuten ennenkin sen sijaan, että rivejä katoaisi. Muistissa on
+enintään ATTEMPT_LOG_QUEUE_SIZE + ATTEMPT_LOG_BATCH_SIZE riviä per worker.
+"""
+import os
+import time
+import queue
+import atexit
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Sammutuksessa epäonnistunutta erää yritetään näin monta kertaa
+SHUTDOWN_RETRIES = 3
+# Uudelleenyritysten viive: alkaa RETRY_DELAY sekunnista ja tuplaantuu enintään RETRY_DELAY_MAX:iin
+RETRY_DELAY = 0.1
+RETRY_DELAY_MAX = 5.0
+
+# Jonoon lisättävä merkki, joka herättää taustasäikeen ja päättää erän heti (flush, close)
+_WAKE = object()
+
+
+def attempt_log_from_env(db_manager):
+    """Palauttaa AttemptLogin, jos write-behind on päällä (ATTEMPT_LOG_WRITE_BEHIND=1), muuten None."""
+    if os.environ.get('ATTEMPT_LOG_WRITE_BEHIND', '0') != '1':
+        return None
+    return AttemptLog(
+        db_manager,
+        batch_size=int(os.environ.get('ATTEMPT_LOG_BATCH_SIZE', 500)),
+        flush_interval=float(os.environ.get('ATTEMPT_LOG_FLUSH_MS', 200)) / 1000,
+        max_queue=int(os.environ.get('ATTEMPT_LOG_QUEUE_SIZE', 10000)),
+        put_timeout=float(os.environ.get('ATTEMPT_LOG_PUT_TIMEOUT', 0.5)),
+    )
+
+
+class AttemptLog:
+    """Rajattu jono + taustasäie, joka kirjoittaa yritykset DatabaseManager.insert_attempts-metodilla."""
+
+    def __init__(self, db_manager, batch_size=500, flush_interval=0.2, max_queue=10000, put_timeout=0.5):
+        self.db_manager = db_manager
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.put_timeout = put_timeout
+
+        self._lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._stopping = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._metrics = {'appended': 0, 'written': 0, 'batches': 0, 'sync_writes': 0,
+                         'write_errors': 0, 'dropped': 0}
+        atexit.register(self.close)
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._metrics[name] += amount
+
+    def _ensure_thread(self):
+        """Käynnistää taustasäikeen laiskasti (myös gunicornin forkin jälkeen)."""
+        with self._lock:
+            if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+                return
+            if self._pid != os.getpid():
+                # Forkattu prosessi: vanhemman jono ja säie eivät kuulu tälle prosessille
+                self._queue = queue.Queue(maxsize=self.max_queue)
+                self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='attempt-log', daemon=True)
+            self._thread.start()
+
+    def append(self, rows):
+        """
+        Lisää yritykset jonoon. rows: (user_id, question_id, correct, time_taken, timestamp).
+        Palauttaa (success, error); virhe on mahdollinen vain synkronisessa kirjoituksessa.
+        """
+        rows = list(rows)
+        if not rows:
+            return True, None
+        if self._stopping.is_set():
+            return self._write_now(rows)
+
+        self._ensure_thread()
+        for i, row in enumerate(rows):
+            try:
+                self._queue.put(row, timeout=self.put_timeout)
+            except queue.Full:
+                self._count('appended', i)
+                logger.warning(f"Yritysjono täynnä ({self.max_queue}), kirjoitetaan {len(rows) - i} riviä synkronisesti")
+                return self._write_now(rows[i:])
+        self._count('appended', len(rows))
+        return True, None
+
+    def _write_now(self, rows):
+        self._count('sync_writes')
+        success, error = self.db_manager.insert_attempts(rows)
+        if success:
+            self._count('written', len(rows))
+        return success, error
+
+    def _collect(self):
+        """Odottaa ensimmäistä riviä ja kerää erää, kunnes se on täynnä tai flush-väli kulunut."""
+        try:
+            batch = [self._queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size and batch[-1] is not _WAKE:
+            remaining = 0 if self._stopping.is_set() else deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write_batch(self, batch):
+        delay, failures = RETRY_DELAY, 0
+        while True:
+            success, error = self.db_manager.insert_attempts(batch)
+            if success:
+                self._count('written', len(batch))
+                self._count('batches')
+                return
+            failures += 1
+            self._count('write_errors')
+            logger.error(f"Virhe yritysten kirjoituksessa ({len(batch)} riviä, yritys {failures}): {error}")
+            if self._stopping.is_set() and failures >= SHUTDOWN_RETRIES:
+                self._count('dropped', len(batch))
+                logger.error(f"Sammutus: {len(batch)} yritystä jäi kirjoittamatta")
+                return
+            time.sleep(delay)
+            delay = min(delay * 2, RETRY_DELAY_MAX)
+
+    def _run(self):
+        while not (self._stopping.is_set() and self._queue.empty()):
+            batch = self._collect()
+            rows = [row for row in batch if row is not _WAKE]
+            try:
+                if rows:
+                    self._write_batch(rows)
+            finally:
+                for _row in batch:
+                    self._queue.task_done()
+
+    def flush(self, timeout=5.0):
+        """
+        Odottaa, että jonoon lisätyt yritykset on kirjoitettu (esim. ennen
+        laskureiden uudelleenrakennusta). Palauttaa False, jos aika loppui.
+        """
+        deadline = time.monotonic() + timeout
+        if self._queue.unfinished_tasks:
+            # Kesken oleva erä kirjoitetaan heti eikä vasta flush-välin päätteeksi
+            try:
+                self._queue.put(_WAKE, timeout=timeout)
+            except queue.Full:
+                pass
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    logger.warning(f"Yritysjonon flush ei valmistunut {timeout} sekunnissa")
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+    def close(self, timeout=10.0):
+        """Tyhjentää jonon ja pysäyttää taustasäikeen (atexit / gunicornin worker_exit)."""
+        self._stopping.set()
+        thread = self._thread
+        if thread is not None and thread.is_alive() and self._pid == os.getpid():
+            try:
+                self._queue.put_nowait(_WAKE)
+            except queue.Full:
+                pass
+            thread.join(timeout)
+            if thread.is_alive():
+                logger.error(f"Yritysjonon tyhjennys ei valmistunut {timeout} sekunnissa ({self._queue.qsize()} riviä)")
+
+    def stats(self):
+        with self._lock:
+            metrics = dict(self._metrics)
+        metrics.update({
+            'queued': self._queue.qsize(),
+            'max_queue': self.max_queue,
+            'batch_size': self.batch_size,
+            'flush_interval_ms': round(self.flush_interval * 1000),
+        })
+        return metrics
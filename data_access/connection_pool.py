@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+# data_access/connection_pool.py
+"""
+Tietokantayhteyksien pooli DatabaseManagerille.
+
+Jokainen gunicorn-worker pitää oman, kokorajoitetun poolinsa. Yhteydet
+tarkistetaan lainattaessa (jos ne ovat olleet käyttämättä pidempään kuin
+DB_POOL_PING_INTERVAL) ja liian kauan joutilaana olleet suljetaan.
+"""
+import os
+import time
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeoutError(Exception):
+    """Poolista ei saatu yhteyttä annetussa ajassa."""
+
+
+def pool_settings_from_env():
+    """Lukee poolin asetukset ympäristömuuttujista."""
+    return {
+        'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', 5)),
+        'timeout': float(os.environ.get('DB_POOL_TIMEOUT', 10)),
+        'idle_timeout': float(os.environ.get('DB_POOL_IDLE_TIMEOUT', 300)),
+        'ping_interval': float(os.environ.get('DB_POOL_PING_INTERVAL', 30)),
+    }
+
+
+class ConnectionPool:
+    """Säieturvallinen, kokorajoitettu yhteyspooli."""
+
+    def __init__(self, connect, health_check=None, max_size=5, timeout=10.0,
+                 idle_timeout=300.0, ping_interval=30.0):
+        """
+        connect: funktio joka avaa uuden yhteyden.
+        health_check: funktio(conn) joka heittää poikkeuksen jos yhteys on rikki.
+        """
+        self._connect = connect
+        self._health_check = health_check
+        self.max_size = max(1, max_size)
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self.ping_interval = ping_interval
+
+        self._cond = threading.Condition()
+        self._reset_state()
+
+    def _reset_state(self):
+        self._pid = os.getpid()
+        self._idle = deque()  # (conn, vapautusaika)
+        self._size = 0
+        self._metrics = {
+            'checkouts': 0,
+            'waits': 0,
+            'wait_time_total': 0.0,
+            'wait_time_max': 0.0,
+            'timeouts': 0,
+            'created': 0,
+            'closed': 0,
+            'failed_health_checks': 0,
+        }
+
+    def _check_pid(self):
+        """Forkin jälkeen (gunicorn --preload) unohdetaan isäprosessin yhteydet."""
+        if self._pid != os.getpid():
+            logger.info("Prosessi vaihtui, alustetaan yhteyspooli uudelleen.")
+            # Yhteyksiä ei suljeta: socket on jaettu isäprosessin kanssa.
+            self._reset_state()
+
+    def _close(self, conn):
+        self._size -= 1
+        self._metrics['closed'] += 1
+        try:
+            conn.close()
+        except Exception as e:
+            logger.debug(f"Virhe yhteyden sulkemisessa: {e}")
+
+    def _reap_idle(self, now):
+        """Sulkee yhteydet, jotka ovat olleet joutilaina yli idle_timeoutin."""
+        while self._idle and now - self._idle[0][1] > self.idle_timeout:
+            conn, _ = self._idle.popleft()
+            self._close(conn)
+
+    def _is_healthy(self, conn, idle_since, now):
+        if getattr(conn, 'closed', 0):
+            return False
+        if self._health_check is None or now - idle_since < self.ping_interval:
+            return True
+        try:
+            self._health_check(conn)
+            return True
+        except Exception as e:
+            logger.warning(f"Yhteyden terveystarkistus epäonnistui: {e}")
+            self._metrics['failed_health_checks'] += 1
+            return False
+
+    def acquire(self):
+        """Lainaa yhteyden poolista, odottaen tarvittaessa enintään timeout-ajan."""
+        started = time.monotonic()
+        deadline = started + self.timeout
+        waited = False
+
+        with self._cond:
+            self._check_pid()
+            while True:
+                now = time.monotonic()
+                self._reap_idle(now)
+
+                while self._idle:
+                    # Uusimmat ensin (LIFO), jolloin vanhat ehtivät vanhentua pois
+                    conn, idle_since = self._idle.pop()
+                    if self._is_healthy(conn, idle_since, now):
+                        self._record_checkout(started, waited)
+                        return conn
+                    self._close(conn)
+
+                if self._size < self.max_size:
+                    self._size += 1
+                    break
+
+                remaining = deadline - now
+                if remaining <= 0:
+                    self._metrics['timeouts'] += 1
+                    raise PoolTimeoutError(
+                        f"Tietokantayhteyttä ei saatu {self.timeout:.1f} sekunnissa "
+                        f"(pool täynnä, koko {self.max_size})."
+                    )
+                waited = True
+                self._cond.wait(remaining)
+
+        # Uusi yhteys avataan lukon ulkopuolella
+        try:
+            conn = self._connect()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+
+        with self._cond:
+            self._metrics['created'] += 1
+            self._record_checkout(started, waited)
+        return conn
+
+    def _record_checkout(self, started, waited):
+        self._metrics['checkouts'] += 1
+        if waited:
+            wait_time = time.monotonic() - started
+            self._metrics['waits'] += 1
+            self._metrics['wait_time_total'] += wait_time
+            self._metrics['wait_time_max'] = max(self._metrics['wait_time_max'], wait_time)
+
+    def release(self, conn, discard=False):
+        """Palauttaa yhteyden pooliin. Keskeneräinen transaktio perutaan."""
+        with self._cond:
+            if self._pid != os.getpid():
+                # Yhteys kuuluu isäprosessin pooliin
+                return
+
+            if not discard and not getattr(conn, 'closed', 0):
+                try:
+                    conn.rollback()
+                except Exception as e:
+                    logger.warning(f"Yhteyden palautus pooliin epäonnistui: {e}")
+                    discard = True
+
+            if discard or getattr(conn, 'closed', 0):
+                self._close(conn)
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        """Lainaa yhteyden with-lohkon ajaksi."""
+        conn = self.acquire()
+        discard = False
+        try:
+            yield conn
+        except Exception:
+            # Katkennut yhteys poistetaan poolista, muut palautetaan normaalisti
+            discard = bool(getattr(conn, 'closed', 0))
+            raise
+        finally:
+            self.release(conn, discard=discard)
+
+    def close_all(self):
+        """Sulkee kaikki joutilaat yhteydet (esim. workerin sammuessa)."""
+        with self._cond:
+            while self._idle:
+                conn, _ = self._idle.popleft()
+                self._close(conn)
+
+    def stats(self):
+        """Palauttaa poolin mittarit."""
+        with self._cond:
+            self._check_pid()
+            metrics = dict(self._metrics)
+            metrics.update({
+                'max_size': self.max_size,
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self._size - len(self._idle),
+                'wait_time_avg': (metrics['wait_time_total'] / metrics['waits']) if metrics['waits'] else 0.0,
+            })
+            return metrics
@@ -5,15 +5,81 @@ import sqlite3
 import json
 import os
 import logging
-from datetime import datetime
-from models.models import Question
+import threading
+from contextlib import contextmanager
+from dataclasses import fields, replace
+from functools import lru_cache
+from datetime import datetime, timedelta
+from models.models import Question, PracticeQuestion
 import random
-from difflib import SequenceMatcher
 import psycopg2
 from psycopg2.extras import DictCursor
+from data_access.connection_pool import ConnectionPool, pool_settings_from_env
+from data_access.statements import StatementRegistry, next_review_sql
+from data_access.migrations import run_migrations, explain_hot_queries
+from data_access.question_cache import QuestionBankCache, PUBLISHED_STATUSES
+from data_access.question_sampler import sample_question_ids, make_rng
+from data_access.attempt_log import attempt_log_from_env
+from data_access.job_runner import JobRunner
+from data_access.user_cache import UserCache
+from data_access.similarity import find_similar_pairs
+from data_access.similarity_index import SimilarityIndex, NEAR_DUPLICATE_THRESHOLD
+from data_access.question_import import QuestionImporter
 
 logger = logging.getLogger(__name__)
 
+# Monirivinen kirjoitus record_answers-metodille; {values} korvataan rivien paikkamerkeillä
+_PROGRESS_BULK_UPSERT = {
+    dialect: f"""
+    INSERT INTO user_question_progress (user_id, question_id, times_shown, times_correct, last_shown, next_review_at)
+    VALUES {{values}}
+    ON CONFLICT (user_id, question_id) DO UPDATE SET
+        times_shown = user_question_progress.times_shown + EXCLUDED.times_shown,
+        times_correct = user_question_progress.times_correct + EXCLUDED.times_correct,
+        last_shown = EXCLUDED.last_shown,
+        next_review_at = {next_review_sql(dialect, 'EXCLUDED.last_shown', 'COALESCE(user_question_progress.interval, 1)')}
+"""
+    for dialect in ('sqlite', 'postgres')
+}
+
+# Monirivinen SR-päivitys apply_review_schedule-metodille (PostgreSQL: UPDATE ... FROM VALUES)
+_REVIEW_BULK_UPDATE = f"""
+    WITH schedule (user_id, question_id, interval, ease_factor) AS (VALUES {{values}})
+    UPDATE user_question_progress SET
+        interval = schedule.interval,
+        ease_factor = schedule.ease_factor,
+        next_review_at = {next_review_sql('postgres', 'user_question_progress.last_shown', 'schedule.interval')}
+    FROM schedule
+    WHERE user_question_progress.user_id = schedule.user_id
+      AND user_question_progress.question_id = schedule.question_id
+"""
+
+_ATTEMPT_BULK_INSERT = """
+    INSERT INTO question_attempts (user_id, question_id, correct, time_taken, timestamp)
+    VALUES {values}
+"""
+
+_QUESTION_FIELDS = {f.name for f in fields(Question)}
+
+
+@lru_cache(maxsize=1024)
+def _translate_placeholders(query, param_style):
+    """?-parametrit murteen muotoon; sama kyselymerkkijono käännetään vain kerran."""
+    return query.replace('?', param_style)
+
+
+class _UnitOfWork:
+    """Yhden säikeen käynnissä oleva transaktio (pyyntö tai with-lohko)."""
+
+    def __init__(self):
+        self.conn = None
+        self.savepoint_counter = 0
+        self.pending_sql = ''
+        self.committed = False
+        # PostgreSQL: edellisen lauseen uow_stmt-savepoint on vielä vapauttamatta
+        self.statement_savepoint = False
+
+
 class DatabaseManager:
     def __init__(self, db_path=None):
         self.database_url = os.environ.get('DATABASE_URL')
@@ -23,6 +89,22 @@ class DatabaseManager:
         if not self.is_postgres:
             self.db_path = db_path if db_path else 'love_enhanced_web.db'
         
+        # Yhteyspooli: kaikki kyselyt käyttävät samoja yhteyksiä uusien avaamisen sijaan
+        self.pool = ConnectionPool(self.get_connection, health_check=self._ping, **pool_settings_from_env())
+        # Säiekohtainen unit of work (ks. transaction() ja begin_unit_of_work())
+        self._local = threading.local()
+        # Nimetyt kyselyt käännettynä tämän kannan murteelle (ks. execute_named())
+        self.statements = StatementRegistry(self.is_postgres)
+        # Kysymyspankki muistissa; admin-muutokset kutsuvat invalidate_question_cache()
+        self.question_cache = QuestionBankCache(self)
+        # load_user-rivit muistissa; käyttäjiä muuttavat metodit kutsuvat invalidate_user_cache()
+        self.user_cache = UserCache(self)
+        self.similarity_index = SimilarityIndex(self)
+        # Yritysten write-behind-jono (ATTEMPT_LOG_WRITE_BEHIND=1), muuten None
+        self.attempt_log = attempt_log_from_env(self)
+        # Pitkät ylläpitotoiminnot taustasäikeissä (ks. data_access/job_runner.py)
+        self.jobs = JobRunner(self)
+        
         # Suoritetaan migraatiot vasta yhteyden ollessa varma
         try:
             self.migrate_database()
@@ -30,39 +112,314 @@ class DatabaseManager:
             logger.error(f"Tietokannan alustus tai migraatio epäonnistui käynnistyksessä: {e}")
 
     def get_connection(self):
-        """Luo ja palauttaa tietokantayhteyden."""
+        """Luo ja palauttaa uuden tietokantayhteyden (poolin ohi)."""
         try:
             if self.is_postgres:
                 if not self.database_url:
                     raise ValueError("DATABASE_URL-ympäristömuuttujaa ei ole asetettu.")
                 return psycopg2.connect(self.database_url)
             else:
-                conn = sqlite3.connect(self.db_path)
+                # Poolin yhteyttä voidaan käyttää eri säikeistä (yksi kerrallaan)
+                conn = sqlite3.connect(self.db_path, check_same_thread=False)
                 conn.row_factory = sqlite3.Row
                 return conn
         except Exception as e:
             logger.error(f"KRIITTINEN VIRHE: Tietokantayhteyden luonti epäonnistui: {e}")
             raise
 
+    def _ping(self, conn):
+        """Poolin terveystarkistus: heittää poikkeuksen, jos yhteys ei vastaa."""
+        cur = conn.cursor()
+        try:
+            cur.execute("SELECT 1")
+            cur.fetchone()
+        finally:
+            cur.close()
+
+    def _cursor(self, conn):
+        """Palauttaa kursorin, joka palauttaa rivit nimettyinä sarakkeina."""
+        if self.is_postgres:
+            return conn.cursor(cursor_factory=DictCursor)
+        return conn.cursor()
+
+    def get_pool_stats(self):
+        """Palauttaa yhteyspoolin mittarit (odotusajat, lainausmäärät)."""
+        return self.pool.stats()
+
     def _execute(self, query, params=(), fetch=None):
         """
         Suorittaa SQL-kyselyn ja palauttaa tulokset.
         Huolehtii parametrien oikeasta muodosta sekä PostgreSQL:lle että SQLite:lle.
+        Jos säikeellä on avoin unit of work, kysely ajetaan sen yhteydellä ilman
+        omaa committia.
+        """
+        return self._run(_translate_placeholders(query, self.param_style), params, fetch)
+
+    def _execute_detached(self, query, params=(), fetch=None):
         """
-        query = query.replace('?', self.param_style)
-        conn = self.get_connection()
+        Kuten _execute, mutta aina omalla yhteydellä ja heti vahvistettuna,
+        vaikka säikeellä olisi avoin unit of work (esim. taustatyön tila, jonka
+        muiden workerien pitää nähdä ennen pyynnön loppua).
+        """
+        with self.pool.connection() as conn:
+            with conn:
+                return self._execute_on(conn, _translate_placeholders(query, self.param_style), params, fetch)
+
+    @contextmanager
+    def detached_transaction(self):
+        """
+        Kuten transaction(), mutta aina omalla yhteydellä ja omana
+        transaktionaan, vaikka säikeellä olisi avoin unit of work: lohkon
+        muutokset vahvistetaan lohkon lopussa, eikä pyynnön peruminen
+        peru niitä (vrt. _execute_detached).
+        """
+        outer = getattr(self._local, 'unit', None)
+        self._local.unit = None
         try:
+            with self.transaction():
+                yield
+        finally:
+            self._local.unit = outer
+
+    def detached_write_blocked(self):
+        """
+        True, jos SQLitessä säikeen unit of workilla on kesken
+        kirjoitustransaktio: toisen yhteyden kirjoitus jäisi odottamaan
+        saman säikeen pitämää lukkoa.
+        """
+        unit = getattr(self._local, 'unit', None)
+        return (not self.is_postgres and unit is not None and unit.conn is not None
+                and unit.conn.in_transaction)
+
+    def execute_named(self, name, params=(), fetch=None):
+        """
+        Suorittaa data_access/statements.py:n nimetyn kyselyn.
+
+        Lause on käännetty murteelle jo käynnistyksessä, ja PostgreSQL:ssä se
+        valmistellaan palvelimelle kerran yhteyttä kohden.
+        """
+        statement = self.statements.get(name)
+        return self._run(statement.sql, params, fetch, statement)
+
+    def _run(self, query, params, fetch, statement=None):
+        unit = getattr(self._local, 'unit', None)
+        if unit is not None:
+            return self._execute_in_unit(unit, query, params, fetch, statement)
+
+        with self.pool.connection() as conn:
             with conn:
-                cursor_factory = DictCursor if self.is_postgres else None
-                with conn.cursor(cursor_factory=cursor_factory) as cur:
-                    cur.execute(query, params)
-                    if fetch == 'one':
-                        return cur.fetchone()
-                    if fetch == 'all':
-                        return cur.fetchall()
+                return self._execute_on(conn, query, params, fetch, statement)
+
+    def _execute_on(self, conn, query, params, fetch, statement=None, prefix=''):
+        """Ajaa kyselyn yhteydellä; prefix lähetetään samassa erässä ennen kyselyä."""
+        server_name = None
+        if statement is not None:
+            setup, query, server_name = self.statements.bind(conn, statement)
+            prefix += setup
+        cur = self._cursor(conn)
+        try:
+            cur.execute(prefix + query, params)
+            if server_name:
+                self.statements.mark_prepared(conn, statement, server_name)
+            if fetch == 'one':
+                return cur.fetchone()
+            if fetch == 'all':
+                return cur.fetchall()
         finally:
-            if conn:
-                conn.close()
+            cur.close()
+
+    def _executemany(self, query, seq_of_params):
+        """
+        Ajaa saman lauseen jokaiselle parametririville yhdellä executemany-kutsulla.
+        Ajetaan transaktiossa (tai avoimen unit of workin savepointissa).
+        """
+        with self.transaction():
+            unit = self._local.unit
+            cur = self._cursor(self._unit_connection(unit))
+            try:
+                if unit.pending_sql:
+                    cur.execute(unit.pending_sql)
+                    unit.pending_sql = ''
+                cur.executemany(_translate_placeholders(query, self.param_style), seq_of_params)
+            finally:
+                cur.close()
+
+    # ------------------------------------------------------------------
+    # Unit of work / transaktiot
+    # ------------------------------------------------------------------
+
+    def _execute_in_unit(self, unit, query, params, fetch, statement=None):
+        """
+        Suorittaa kyselyn avoimessa transaktiossa.
+
+        PostgreSQL:ssä epäonnistunut lause kaataisi koko transaktion, joten
+        jokaisen lauseen eteen lisätään savepoint samaan edestakaiseen matkaan.
+        Virhe perutaan savepointiin ja heitetään kutsujalle, eli virheen
+        nielevät kutsujat toimivat kuten ennenkin. Edellisen lauseen savepoint
+        vapautetaan samalla, jotta sisäkkäisiä alitransaktioita ei kerry.
+        """
+        conn = self._unit_connection(unit)
+        prefix = unit.pending_sql
+        unit.pending_sql = ''
+        if not self.is_postgres:
+            return self._execute_on(conn, query, params, fetch, statement)
+        if unit.statement_savepoint:
+            prefix += "RELEASE SAVEPOINT uow_stmt; "
+        unit.statement_savepoint = True
+        try:
+            return self._execute_on(conn, query, params, fetch, statement,
+                                    prefix=prefix + "SAVEPOINT uow_stmt; ")
+        except Exception:
+            if not getattr(conn, 'closed', 0):
+                cur = conn.cursor()
+                try:
+                    cur.execute("ROLLBACK TO SAVEPOINT uow_stmt")
+                except Exception as e:
+                    logger.error(f"Savepointin palautus epäonnistui: {e}")
+                finally:
+                    cur.close()
+            raise
+
+    def _unit_connection(self, unit):
+        """Lainaa unit of workille yhteyden ensimmäisellä kyselyllä."""
+        if unit.conn is None:
+            unit.conn = self.pool.acquire()
+        return unit.conn
+
+    def _run_sqlite_control(self, conn, statement):
+        cur = conn.cursor()
+        try:
+            cur.execute(statement)
+        finally:
+            cur.close()
+
+    def begin_unit_of_work(self):
+        """
+        Aloittaa säikeelle (esim. Flask-pyynnölle) unit of workin: kaikki
+        seuraavat kyselyt käyttävät samaa yhteyttä ja yhtä committia.
+        Yhteys lainataan vasta ensimmäisellä kyselyllä.
+        """
+        if getattr(self._local, 'unit', None) is None:
+            self._local.unit = _UnitOfWork()
+
+    def commit_unit_of_work(self):
+        """Vahvistaa avoimen unit of workin. Virhe heitetään kutsujalle."""
+        unit = getattr(self._local, 'unit', None)
+        if unit is None or unit.committed:
+            return
+        if unit.conn is not None:
+            unit.conn.commit()
+        unit.committed = True
+
+    def end_unit_of_work(self, error=None):
+        """
+        Päättää unit of workin: perutaan, jos sitä ei vahvistettu tai tuli
+        virhe, ja palautetaan yhteys pooliin.
+        """
+        unit = getattr(self._local, 'unit', None)
+        if unit is None:
+            return
+        self._local.unit = None
+        if unit.conn is None:
+            return
+        discard = False
+        try:
+            if error is None and not unit.committed:
+                unit.conn.commit()
+        except Exception as e:
+            logger.error(f"Transaktion vahvistus epäonnistui: {e}")
+            discard = bool(getattr(unit.conn, 'closed', 0))
+            raise
+        finally:
+            # release() perii vahvistamattoman transaktion
+            self.pool.release(unit.conn, discard=discard)
+
+    @contextmanager
+    def transaction(self):
+        """
+        Suorittaa with-lohkon kyselyt yhdessä transaktiossa:
+
+            with db_manager.transaction():
+                db_manager._execute(...)
+                db_manager._execute(...)
+
+        Jos säikeellä on jo avoin unit of work (esim. pyyntökohtainen),
+        lohko liittyy siihen savepointilla: lohkon virhe perii vain lohkon
+        omat muutokset.
+        """
+        unit = getattr(self._local, 'unit', None)
+        if unit is None:
+            self.begin_unit_of_work()
+            try:
+                yield
+            except BaseException:
+                self.end_unit_of_work(error=True)
+                raise
+            self.end_unit_of_work()
+            return
+
+        unit.savepoint_counter += 1
+        name = f"uow_tx_{unit.savepoint_counter}"
+        marker = f"SAVEPOINT {name}; "
+        if self.is_postgres:
+            # Savepoint lähetetään seuraavan kyselyn mukana (ei omaa edestakaista matkaa).
+            # Ulomman tason lauseen savepoint vapautetaan ensin, muuten sen
+            # myöhempi RELEASE vapauttaisi myös tämän lohkon savepointin.
+            if unit.statement_savepoint:
+                unit.pending_sql += "RELEASE SAVEPOINT uow_stmt; "
+                unit.statement_savepoint = False
+            unit.pending_sql += marker
+        else:
+            conn = self._unit_connection(unit)
+            if not conn.in_transaction:
+                # Ilman avointa transaktiota SAVEPOINT aloittaisi oman, ja sen RELEASE
+                # vahvistaisi lohkon, vaikka unit of work perutaan myöhemmin
+                self._run_sqlite_control(conn, "BEGIN")
+            self._run_sqlite_control(conn, f"SAVEPOINT {name}")
+        try:
+            yield
+        except BaseException:
+            if marker in unit.pending_sql:
+                # Lohko ei ehtinyt ajaa yhtään kyselyä
+                unit.pending_sql = unit.pending_sql.replace(marker, '')
+            else:
+                self._rollback_to_savepoint(unit, name)
+                # Jonossa olleet vapautukset koskivat peruttuja savepointteja;
+                # ROLLBACK TO jättää itse savepointin voimaan, joten se vapautetaan
+                if self.is_postgres:
+                    unit.pending_sql = f"RELEASE SAVEPOINT {name}; "
+                    unit.statement_savepoint = False
+                else:
+                    self._release_sqlite_savepoint(unit, name)
+            raise
+        if self.is_postgres:
+            if marker in unit.pending_sql:
+                unit.pending_sql = unit.pending_sql.replace(marker, '')
+            else:
+                # Vapautus kulkee seuraavan kyselyn mukana; se vapauttaa myös lohkon lauseiden savepointit
+                unit.pending_sql += f"RELEASE SAVEPOINT {name}; "
+                unit.statement_savepoint = False
+        else:
+            self._run_sqlite_control(unit.conn, f"RELEASE SAVEPOINT {name}")
+
+    def _release_sqlite_savepoint(self, unit, name):
+        try:
+            self._run_sqlite_control(unit.conn, f"RELEASE SAVEPOINT {name}")
+        except Exception as e:
+            logger.error(f"Savepointin {name} vapautus epäonnistui: {e}")
+
+    def _rollback_to_savepoint(self, unit, name):
+        try:
+            if self.is_postgres:
+                cur = unit.conn.cursor()
+                try:
+                    cur.execute(f"ROLLBACK TO SAVEPOINT {name}")
+                finally:
+                    cur.close()
+            else:
+                self._run_sqlite_control(unit.conn, f"ROLLBACK TO SAVEPOINT {name}")
+        except Exception as e:
+            logger.error(f"Savepointiin {name} palaaminen epäonnistui: {e}")
 
     def init_database(self):
         """Luo kaikki tarvittavat tietokantataulut."""
@@ -130,62 +487,32 @@ class DatabaseManager:
                 PRIMARY KEY (user_id, achievement_id)
             );
         """
-        conn = self.get_connection()
         try:
-            with conn:
-                with conn.cursor() as cur:
-                    for statement in create_tables_sql.split(';'):
-                        if statement.strip():
-                            cur.execute(statement)
+            with self.pool.connection() as conn:
+                with conn:
+                    cur = conn.cursor()
+                    try:
+                        for statement in create_tables_sql.split(';'):
+                            if statement.strip():
+                                cur.execute(statement)
+                    finally:
+                        cur.close()
         except (psycopg2.Error, sqlite3.Error) as e:
             logger.error(f"Virhe tietokannan alustuksessa: {e}")
             raise
-        finally:
-            conn.close()
+        # Tyhjään kantaan ajetaan samalla kaikki migraatiot
+        self.migrate_database()
 
     def migrate_database(self):
-        """Lisää puuttuvat sarakkeet olemassa oleviin tauluihin."""
-        bool_type = "BOOLEAN DEFAULT false" if self.is_postgres else "INTEGER DEFAULT 0"
-        self._add_column_if_not_exists('user_question_progress', 'mistake_acknowledged', bool_type)
-        self._add_column_if_not_exists('questions', 'status', "TEXT DEFAULT 'validated'")
-        self._add_column_if_not_exists('questions', 'validated_by', 'INTEGER')
-        self._add_column_if_not_exists('questions', 'validated_at', 'TIMESTAMP')
-        self._add_column_if_not_exists('questions', 'validation_comment', 'TEXT')
-
-    # data_access/database_manager.py
-
-    def _add_column_if_not_exists(self, table_name, column_name, column_type):
-        """Apufunktio sarakkeen lisäämiseksi, jos sitä ei ole olemassa."""
-        try:
-            with self.get_connection() as conn:
-                with conn.cursor(cursor_factory=DictCursor if self.is_postgres else None) as cur:
-                    column_exists = False
-                    
-                    # --- TÄMÄ LOGIIKKA ON KORJATTU ---
-                    if self.is_postgres:
-                        # PostgreSQL: Tarkista, palauttaako kysely rivin.
-                        cur.execute("""
-                            SELECT 1 FROM information_schema.columns 
-                            WHERE table_name = %s AND column_name = %s
-                        """, (table_name.lower(), column_name.lower()))
-                        if cur.fetchone():
-                            column_exists = True
-                    else:
-                        # SQLite: Tarkista sarakkeet PRAGMA-lauseella.
-                        cur.execute(f"PRAGMA table_info({table_name})")
-                        columns = [row[1] for row in cur.fetchall()]
-                        if column_name in columns:
-                            column_exists = True
-                    # --- KORJAUKSEN LOPPU ---
-
-                    if not column_exists:
-                        alter_query = f"ALTER TABLE {table_name} ADD COLUMN {column_name} {column_type}"
-                        cur.execute(alter_query)
-                        logger.info(f"Sarake '{column_name}' lisätty tauluun '{table_name}'.")
-                    else:
-                        logger.debug(f"Sarake '{column_name}' on jo olemassa taulussa '{table_name}'.")
-        except Exception as e:
-            logger.error(f"Virhe sarakkeen '{column_name}' lisäämisessä tauluun '{table_name}': {e}")
+        """
+        Ajaa puuttuvat versioidut migraatiot (ks. data_access/migrations.py).
+        Ajan tasalla olevassa kannassa tämä on yksi kysely.
+        """
+        return run_migrations(self)
+
+    def explain_hot_queries(self):
+        """Tarkistaa EXPLAINilla, että kuumat kyselyt käyttävät indeksiä."""
+        return explain_hot_queries(self)
 
     def create_user(self, username, email, hashed_password, expires_at=None):
         """Luo uuden käyttäjän."""
@@ -301,6 +628,7 @@ class DatabaseManager:
         """Päivittää käyttäjän roolin."""
         try:
             self._execute("UPDATE users SET role = ? WHERE id = ?", (new_role, user_id))
+            self.invalidate_user_cache(user_id)
             return True, None
         except Exception as e:
             logger.error(f"Virhe roolin päivityksessä: {e}")
@@ -310,6 +638,7 @@ class DatabaseManager:
         """Päivittää käyttäjän statuksen."""
         try:
             self._execute("UPDATE users SET status = ? WHERE id = ?", (new_status, user_id))
+            self.invalidate_user_cache(user_id)
             return True, None
         except Exception as e:
             logger.error(f"Virhe statuksen päivityksessä: {e}")
@@ -319,6 +648,7 @@ class DatabaseManager:
         """Päivittää käyttäjän vanhentumispäivän."""
         try:
             self._execute("UPDATE users SET expires_at = ? WHERE id = ?", (new_expiration, user_id))
+            self.invalidate_user_cache(user_id)
             return True, None
         except Exception as e:
             logger.error(f"Virhe vanhentumispäivän päivityksessä: {e}")
@@ -335,7 +665,11 @@ class DatabaseManager:
             self._execute("DELETE FROM question_attempts WHERE user_id = ?", (user_id,))
             self._execute("DELETE FROM active_sessions WHERE user_id = ?", (user_id,))
             self._execute("DELETE FROM user_achievements WHERE user_id = ?", (user_id,))
+            self._execute("DELETE FROM user_achievement_counters WHERE user_id = ?", (user_id,))
+            self._execute("DELETE FROM user_category_counters WHERE user_id = ?", (user_id,))
+            self._execute("DELETE FROM user_stats_summary WHERE user_id = ?", (user_id,))
             self._execute("DELETE FROM users WHERE id = ?", (user_id,))
+            self.invalidate_user_cache(user_id)
             return True, None
         except Exception as e:
             logger.error(f"Virhe käyttäjän poistossa: {e}")
@@ -353,87 +687,191 @@ class DatabaseManager:
             logger.error(f"Virhe asetusten päivityksessä: {e}")
             return False, str(e)
 
+    def invalidate_question_cache(self):
+        """Kutsutaan aina, kun questions-taulua muutetaan."""
+        self.question_cache.invalidate()
+
+    def invalidate_user_cache(self, user_id=None):
+        """Kutsutaan aina, kun load_userin lukemia users-sarakkeita muutetaan (None = kaikki)."""
+        self.user_cache.invalidate(user_id)
+
     def get_categories(self):
         """Hakee kaikki kategoriat."""
-        result = self._execute("SELECT DISTINCT category FROM questions ORDER BY category", fetch='all')
-        return [row['category'] for row in result] if result else []
+        return list(self.question_cache.snapshot().categories)
 
     def get_difficulties(self):
         """Hakee kaikki vaikeustasot."""
-        result = self._execute("SELECT DISTINCT difficulty FROM questions ORDER BY difficulty", fetch='all')
-        return [row['difficulty'] for row in result] if result else []
-
-    def get_question_by_id(self, question_id):
-        """Hakee kysymyksen ID:n perusteella."""
-        row = self._execute("SELECT * FROM questions WHERE id = ?", (question_id,), fetch='one')
-        if row:
-            q_dict = dict(row)
-            q_dict['options'] = json.loads(q_dict['options'])
-            return q_dict
-        return None
-
-    def get_random_questions(self, categories=None, difficulties=None, count=20, exclude_ids=None):
-        """Hakee satunnaisia kysymyksiä annetuilla kriteereillä."""
-        try:
-            query_parts = ["SELECT * FROM questions WHERE 1=1"]
-            params = []
+        return list(self.question_cache.snapshot().difficulties)
 
-            if categories:
-                placeholders = ','.join(['?'] * len(categories))
-                query_parts.append(f"AND category IN ({placeholders})")
-                params.extend(categories)
+    def get_question_counts(self):
+        """Kysymysmäärät kategorioittain, vaikeustasoittain ja näiden yhdistelmittäin."""
+        snapshot = self.question_cache.snapshot()
+        category_difficulty_map = {}
+        for (category, difficulty), ids in snapshot.ids_by_category_difficulty.items():
+            category_difficulty_map.setdefault(category, {})[difficulty] = len(ids)
+        return {
+            'categories': {category: len(snapshot.ids_by_category[category]) for category in snapshot.categories},
+            'difficulties': {difficulty: len(ids) for difficulty, ids in snapshot.ids_by_difficulty.items()},
+            'category_difficulty_map': category_difficulty_map,
+            'total': len(snapshot.by_id),
+        }
 
-            if difficulties:
-                placeholders = ','.join(['?'] * len(difficulties))
-                query_parts.append(f"AND difficulty IN ({placeholders})")
-                params.extend(difficulties)
+    def get_question_by_id(self, question_id, user_id=None):
+        """
+        Hakee kysymyksen ID:n perusteella.
 
-            if exclude_ids:
-                placeholders = ','.join(['?'] * len(exclude_ids))
-                query_parts.append(f"AND id NOT IN ({placeholders})")
-                params.extend(exclude_ids)
+        Ilman user_id:tä palauttaa sanakirjan. Kun user_id annetaan, palauttaa
+        PracticeQuestion-näkymän, jossa on mukana käyttäjän edistyminen (SR-arvot).
+        Kysymys luetaan välimuistista; kannasta haetaan vain edistyminen.
+        """
+        try:
+            question_id = int(question_id)
+        except (TypeError, ValueError):
+            return None
+        question = self.question_cache.snapshot().by_id.get(question_id)
+        if question is None:
+            # Toisen workerin juuri lisäämä kysymys, jota välimuisti ei vielä tunne
+            return self._get_question_by_id_uncached(question_id, user_id)
 
-            query = " ".join(query_parts) + " ORDER BY RANDOM() LIMIT ?"
-            params.append(count)
+        if user_id is None:
+            return question.to_dict()
 
-            rows = self._execute(query, tuple(params), fetch='all')
-            
-            questions = []
-            for row in rows:
+        progress = self.execute_named('question_progress', (user_id, question_id), fetch='one')
+        return PracticeQuestion.from_question(question, progress)
+
+    def _get_question_by_id_uncached(self, question_id, user_id=None):
+        if user_id is None:
+            row = self._execute("SELECT * FROM questions WHERE id = ?", (question_id,), fetch='one')
+            if row:
                 q_dict = dict(row)
                 q_dict['options'] = json.loads(q_dict['options'])
-                questions.append(q_dict)
-            
-            return questions
+                return q_dict
+            return None
+
+        row = self.execute_named('question_with_progress', (user_id, question_id), fetch='one')
+        if not row:
+            return None
+        try:
+            return self._question_from_row(row)
+        except (json.JSONDecodeError, TypeError) as e:
+            logger.error(f"Virhe Question-objektin luonnissa ID:llä {question_id}: {e}")
+            return None
+
+    def _question_from_row(self, row):
+        """Muuntaa tietokantarivin Question-objektiksi (ylimääräiset sarakkeet ohitetaan)."""
+        row_dict = dict(row)
+        row_dict['options'] = json.loads(row_dict['options']) if row_dict['options'] else []
+        return Question(**{k: v for k, v in row_dict.items() if k in _QUESTION_FIELDS})
+
+    def _sample_questions(self, count, categories=None, difficulties=None, exclude_ids=None,
+                          published_only=False, seed=None):
+        """Arpoo kysymykset välimuistista (ks. question_sampler.py) ja palauttaa kopiot."""
+        snapshot = self.question_cache.snapshot()
+        ids = sample_question_ids(
+            snapshot, count, categories=categories, difficulties=difficulties,
+            exclude_ids=exclude_ids, published_only=published_only, rng=make_rng(seed)
+        )
+        return [snapshot.by_id[question_id] for question_id in ids]
+
+    def get_random_questions(self, categories=None, difficulties=None, count=20, exclude_ids=None, seed=None):
+        """Hakee satunnaisia kysymyksiä annetuilla kriteereillä."""
+        try:
+            questions = self._sample_questions(count, categories, difficulties, exclude_ids, seed=seed)
+            return [question.to_dict() for question in questions]
         except Exception as e:
             logger.error(f"Virhe kysymysten haussa: {e}")
             return []
 
-    def get_questions_by_category(self, category, difficulty=None, count=20):
-        """Hakee kysymyksiä tietystä kategoriasta."""
+    def get_random_question_ids(self, limit=50, seed=None):
+        """Hakee satunnaisen listan kysymysten ID:itä."""
+        return sample_question_ids(self.question_cache.snapshot(), limit, rng=make_rng(seed))
+
+    def get_questions(self, user_id, categories=None, difficulties=None, limit=10, seed=None):
+        """
+        Hakee satunnaisia kysymyksiä suodattimilla, mukana käyttäjän edistyminen.
+        Kysymykset arvotaan välimuistista; kannasta haetaan vain edistymisrivit.
+        """
         try:
-            if difficulty:
-                query = "SELECT * FROM questions WHERE category = ? AND difficulty = ? ORDER BY RANDOM() LIMIT ?"
-                params = (category, difficulty, count)
-            else:
-                query = "SELECT * FROM questions WHERE category = ? ORDER BY RANDOM() LIMIT ?"
-                params = (category, count)
-            
-            rows = self._execute(query, params, fetch='all')
-            
-            questions = []
+            if categories and 'Kaikki kategoriat' in categories:
+                categories = None
+            questions = self._sample_questions(int(limit), categories, difficulties, seed=seed)
+            if not questions:
+                logger.warning("No question IDs found for the given filters.")
+                return []
+
+            return self._with_progress(questions, user_id)
+        except Exception as e:
+            logger.error(f"Critical error in get_questions: {e}")
+            return []
+
+    def _with_progress(self, questions, user_id):
+        """Palauttaa PracticeQuestion-näkymät käyttäjän edistymisellä (yksi kysely)."""
+        if not questions:
+            return []
+        placeholders = ', '.join(['?'] * len(questions))
+        rows = self._execute(
+            f"""SELECT question_id, times_shown, times_correct, last_shown, ease_factor, interval
+                FROM user_question_progress
+                WHERE user_id = ? AND question_id IN ({placeholders})""",
+            (user_id, *[q.id for q in questions]),
+            fetch='all'
+        ) or []
+        progress = {row['question_id']: row for row in rows}
+        return [PracticeQuestion.from_question(question, progress.get(question.id)) for question in questions]
+
+    def get_questions_by_ids(self, question_ids, user_id=None):
+        """
+        Hakee useamman kysymyksen kerralla annetussa järjestyksessä
+        (puuttuvat ohitetaan). user_id:n kanssa palauttaa PracticeQuestion-
+        näkymät, joiden edistyminen haetaan yhdellä kyselyllä.
+        """
+        snapshot = self.question_cache.snapshot()
+        ids = []
+        for question_id in question_ids:
+            try:
+                ids.append(int(question_id))
+            except (TypeError, ValueError):
+                continue
+
+        missing = [question_id for question_id in ids if question_id not in snapshot.by_id]
+        uncached = {}
+        if missing:
+            # Toisen workerin juuri lisäämät kysymykset
+            placeholders = ', '.join(['?'] * len(missing))
+            rows = self._execute(f"SELECT * FROM questions WHERE id IN ({placeholders})", tuple(missing), fetch='all') or []
             for row in rows:
-                q_dict = dict(row)
-                q_dict['options'] = json.loads(q_dict['options'])
-                questions.append(q_dict)
-            
-            return questions
+                try:
+                    question = self._question_from_row(row)
+                    uncached[question.id] = question
+                except (json.JSONDecodeError, TypeError) as e:
+                    logger.error(f"Virhe Question-objektin luonnissa ID:llä {row['id']}: {e}")
+
+        questions = []
+        for question_id in ids:
+            question = snapshot.by_id.get(question_id) or uncached.get(question_id)
+            if question is not None:
+                questions.append(question)
+
+        if user_id is None:
+            return [replace(question, options=list(question.options)) for question in questions]
+        return self._with_progress(questions, user_id)
+
+    def get_questions_by_category(self, category, difficulty=None, count=20, seed=None):
+        """Hakee kysymyksiä tietystä kategoriasta."""
+        try:
+            questions = self._sample_questions(
+                count, [category], [difficulty] if difficulty else None, seed=seed
+            )
+            return [question.to_dict() for question in questions]
         except Exception as e:
             logger.error(f"Virhe kategorian kysymysten haussa: {e}")
             return []
 
+
     def record_question_attempt(self, user_id, question_id, correct, time_taken):
         """Tallentaa kysymykseen vastaamisen yrityksen."""
+        if self.attempt_log is not None:
+            return self.attempt_log.append([(user_id, question_id, correct, time_taken, datetime.now())])
         try:
             self._execute(
                 "INSERT INTO question_attempts (user_id, question_id, correct, time_taken, timestamp) VALUES (?, ?, ?, ?, ?)", 
@@ -444,6 +882,169 @@ class DatabaseManager:
             logger.error(f"Virhe yrityksen tallennuksessa: {e}")
             return False, str(e)
 
+    def record_answer(self, user_id, question_id, is_correct, time_taken, interval=None, ease_factor=None):
+        """
+        Tallentaa vastauksen: edistymisen laskurit, SR-arvot ja yrityksen.
+
+        Edistyminen päivitetään yhdellä INSERT ... ON CONFLICT DO UPDATE -lauseella.
+        PostgreSQL:ssä myös yritys kirjataan samassa lauseessa (CTE), jolloin
+        vastaus vaatii yhden tietokantakierroksen. SQLitessä lauseita on kaksi.
+        Write-behind-tilassa (attempt_log) yritys kirjoitetaan taustalla.
+        Jos interval/ease_factor jätetään antamatta, vanhat SR-arvot säilyvät
+        ja next_review_at lasketaan rivin nykyisestä intervallista.
+        """
+        now = datetime.now()
+        progress_params = (user_id, question_id, 1 if is_correct else 0, now)
+        upsert = 'progress_upsert'
+        if interval is not None and ease_factor is not None:
+            progress_params += (interval, ease_factor, now + timedelta(days=interval))
+            upsert = 'progress_upsert_sr'
+        else:
+            # Käytetään vain uudelle riville (oletusintervalli 1 päivä)
+            progress_params += (now + timedelta(days=1),)
+        attempt_params = (user_id, question_id, bool(is_correct), time_taken, now)
+
+        try:
+            if self.attempt_log is not None:
+                self.execute_named(upsert, progress_params)
+                return self.attempt_log.append([attempt_params])
+            with self.transaction():
+                if self.is_postgres:
+                    cte = 'answer_cte_sr' if upsert == 'progress_upsert_sr' else 'answer_cte'
+                    self.execute_named(cte, progress_params + attempt_params)
+                else:
+                    self.execute_named(upsert, progress_params)
+                    self.execute_named('attempt_insert', attempt_params)
+            return True, None
+        except Exception as e:
+            logger.error(f"Virhe vastauksen tallennuksessa: {e}")
+            return False, str(e)
+
+    def update_question_stats(self, question_id, is_correct, time_taken, user_id):
+        """Päivittää kysymyksen tilastot käyttäjälle (SR-arvoihin ei kosketa)."""
+        self.record_answer(user_id, question_id, is_correct, time_taken)
+
+    @staticmethod
+    def _multi_row_values(template, rows):
+        """Muodostaa monirivisen VALUES-lauseen: palauttaa (kysely, parametrit) tai (None, ())."""
+        if not rows:
+            return None, ()
+        row_placeholders = '(' + ', '.join(['?'] * len(rows[0])) + ')'
+        query = template.format(values=', '.join([row_placeholders] * len(rows)))
+        return query, tuple(value for row in rows for value in row)
+
+    # Rivejä per monirivinen INSERT (parametrirajat: SQLite 999 vanhoissa versioissa)
+    RECORD_ANSWERS_CHUNK = 100
+
+    def record_answers(self, user_id, results):
+        """
+        Tallentaa monta vastausta kerralla (esim. koko simulaatio).
+
+        results: lista sanakirjoja, joissa question_id, is_correct ja time_taken.
+        Edistyminen päivitetään yhdellä monirivisellä upsertilla ja yritykset
+        yhdellä monirivisellä INSERTillä (PostgreSQL:ssä molemmat yhdessä CTE:ssä),
+        joten kyselyiden määrä ei riipu vastausten määrästä. SR-arvoihin ei kosketa.
+        Write-behind-tilassa (attempt_log) yritykset kirjoitetaan taustalla.
+        """
+        if not results:
+            return True, None
+        now = datetime.now()
+        first_review = now + timedelta(days=1)
+
+        # Sama kysymys voi esiintyä useasti: yksi upsert-rivi per kysymys
+        progress = {}
+        for result in results:
+            shown, correct = progress.get(result['question_id'], (0, 0))
+            progress[result['question_id']] = (shown + 1, correct + (1 if result['is_correct'] else 0))
+
+        progress_rows = [
+            (user_id, question_id, shown, correct, now, first_review)
+            for question_id, (shown, correct) in progress.items()
+        ]
+        attempt_rows = [
+            (user_id, result['question_id'], bool(result['is_correct']), result.get('time_taken', 0), now)
+            for result in results
+        ]
+
+        if self.attempt_log is not None:
+            progress_template = _PROGRESS_BULK_UPSERT['postgres' if self.is_postgres else 'sqlite']
+            try:
+                with self.transaction():
+                    for start in range(0, len(progress_rows), self.RECORD_ANSWERS_CHUNK):
+                        self._execute(*self._multi_row_values(progress_template, progress_rows[start:start + self.RECORD_ANSWERS_CHUNK]))
+            except Exception as e:
+                logger.error(f"Virhe vastausten tallennuksessa: {e}")
+                return False, str(e)
+            return self.attempt_log.append(attempt_rows)
+
+        try:
+            with self.transaction():
+                chunk = self.RECORD_ANSWERS_CHUNK
+                for start in range(0, max(len(progress_rows), len(attempt_rows)), chunk):
+                    upsert, upsert_params = self._multi_row_values(
+                        _PROGRESS_BULK_UPSERT['postgres' if self.is_postgres else 'sqlite'], progress_rows[start:start + chunk]
+                    )
+                    insert, insert_params = self._multi_row_values(_ATTEMPT_BULK_INSERT, attempt_rows[start:start + chunk])
+                    if self.is_postgres and upsert and insert:
+                        self._execute(f"WITH progress AS ({upsert}) {insert}", upsert_params + insert_params)
+                        continue
+                    if upsert:
+                        self._execute(upsert, upsert_params)
+                    if insert:
+                        self._execute(insert, insert_params)
+            return True, None
+        except Exception as e:
+            logger.error(f"Virhe vastausten tallennuksessa: {e}")
+            return False, str(e)
+
+    def insert_attempts(self, rows):
+        """
+        Kirjoittaa yritykset monirivisinä INSERTeinä yhdessä transaktiossa
+        (ks. attempt_log.py). rows: (user_id, question_id, correct, time_taken, timestamp).
+        Palauttaa (success, error).
+        """
+        try:
+            with self.transaction():
+                chunk = self.RECORD_ANSWERS_CHUNK
+                for start in range(0, len(rows), chunk):
+                    self._execute(*self._multi_row_values(_ATTEMPT_BULK_INSERT, rows[start:start + chunk]))
+            return True, None
+        except Exception as e:
+            logger.error(f"Virhe yritysten tallennuksessa: {e}")
+            return False, str(e)
+
+    # Rivejä per monirivinen SR-päivitys (PostgreSQL, 4 parametria/rivi)
+    REVIEW_SCHEDULE_CHUNK = 200
+
+    def apply_review_schedule(self, rows):
+        """
+        Kirjoittaa monen kysymyksen SR-arvot kerralla (ks. spaced_repetition.schedule_batch).
+
+        rows: iteroitava (user_id, question_id, interval, ease_factor) -monikkoja.
+        PostgreSQL:ssä jokainen REVIEW_SCHEDULE_CHUNK rivin erä on yksi
+        UPDATE ... FROM VALUES (yksi kierros). SQLitessä record_review ajetaan
+        executemanylla, joka on prosessin sisällä monirivistä UPDATEa nopeampi.
+        Myös next_review_at päivittyy. Palauttaa (success, error).
+        """
+        rows = list(rows)
+        try:
+            if not self.is_postgres:
+                self._executemany(
+                    self.statements.get('record_review').sql,
+                    [(interval, ease_factor, interval, user_id, question_id)
+                     for user_id, question_id, interval, ease_factor in rows]
+                )
+                return True, None
+            with self.transaction():
+                chunk = self.REVIEW_SCHEDULE_CHUNK
+                for start in range(0, len(rows), chunk):
+                    query, params = self._multi_row_values(_REVIEW_BULK_UPDATE, rows[start:start + chunk])
+                    self._execute(query, params)
+            return True, None
+        except Exception as e:
+            logger.error(f"Virhe kertausaikataulun tallennuksessa: {e}")
+            return False, str(e)
+
     def update_question_progress(self, user_id, question_id, correct):
         """Päivittää käyttäjän edistymisen kysymyksessä."""
         try:
@@ -453,17 +1054,19 @@ class DatabaseManager:
                 fetch='one'
             )
 
+            now = datetime.now()
             if existing:
                 new_times_shown = existing['times_shown'] + 1
                 new_times_correct = existing['times_correct'] + (1 if correct else 0)
+                next_review_at = now + timedelta(days=existing['interval'] or 1)
                 self._execute(
-                    "UPDATE user_question_progress SET times_shown = ?, times_correct = ?, last_shown = ? WHERE user_id = ? AND question_id = ?", 
-                    (new_times_shown, new_times_correct, datetime.now(), user_id, question_id)
+                    "UPDATE user_question_progress SET times_shown = ?, times_correct = ?, last_shown = ?, next_review_at = ? WHERE user_id = ? AND question_id = ?", 
+                    (new_times_shown, new_times_correct, now, next_review_at, user_id, question_id)
                 )
             else:
                 self._execute(
-                    "INSERT INTO user_question_progress (user_id, question_id, times_shown, times_correct, last_shown) VALUES (?, ?, 1, ?, ?)", 
-                    (user_id, question_id, 1 if correct else 0, datetime.now())
+                    "INSERT INTO user_question_progress (user_id, question_id, times_shown, times_correct, last_shown, next_review_at) VALUES (?, ?, 1, ?, ?, ?)", 
+                    (user_id, question_id, 1 if correct else 0, now, now + timedelta(days=1))
                 )
             
             return True, None
@@ -482,34 +1085,25 @@ class DatabaseManager:
     def get_all_questions(self, limit=None, offset=0):
         """Hakee kaikki kysymykset."""
         try:
-            if limit:
-                query = "SELECT * FROM questions ORDER BY id LIMIT ? OFFSET ?"
-                params = (limit, offset)
-            else:
-                query = "SELECT * FROM questions ORDER BY id"
-                params = ()
-            
-            rows = self._execute(query, params, fetch='all')
-            
-            questions = []
-            for row in rows:
-                q_dict = dict(row)
-                q_dict['options'] = json.loads(q_dict['options'])
-                questions.append(q_dict)
-            
-            return questions
+            snapshot = self.question_cache.snapshot()
+            ids = snapshot.ids[offset:offset + limit] if limit else snapshot.ids
+            return [snapshot.by_id[question_id].to_dict() for question_id in ids]
         except Exception as e:
             logger.error(f"Virhe kysymysten haussa: {e}")
             return []
 
     def get_total_question_count(self):
         """Palauttaa kysymysten kokonaismäärän."""
-        result = self._execute("SELECT COUNT(*) as count FROM questions", fetch='one')
-        return result['count'] if result else 0
+        return len(self.question_cache.snapshot().by_id)
 
     def update_question(self, question_id, question_data):
         """Päivittää kysymyksen tiedot."""
         try:
+            previous = self.question_cache.snapshot().by_id.get(int(question_id))
+            if (previous is None or previous.category != question_data['category']
+                    or previous.difficulty != question_data['difficulty']):
+                # Kategoria-/vaikeustasokoosteet muuttuvat: vastanneiden koosteet lasketaan uudelleen
+                self.reset_user_aggregates(question_id=question_id)
             options_json = json.dumps(question_data['options'])
             self._execute(
                 """UPDATE questions SET 
@@ -519,102 +1113,177 @@ class DatabaseManager:
                 (question_data['question'], question_data['explanation'], options_json,
                  question_data['correct'], question_data['category'], question_data['difficulty'], question_id)
             )
+            self.similarity_index.index_questions([(int(question_id), question_data['question'])])
+            self.invalidate_question_cache()
             return True, None
         except Exception as e:
             logger.error(f"Virhe kysymyksen päivityksessä: {e}")
             return False, str(e)
 
+    def normalize_question(self, question_text):
+        """question_normalized-sarakkeen arvo (tarkka duplikaattivertailu)."""
+        return (question_text or '').lower().strip()
+
+    def check_question_duplicate(self, question_text, threshold=NEAR_DUPLICATE_THRESHOLD, exclude_id=None):
+        """
+        Tarkistaa, onko kannassa sama tai lähes sama kysymys.
+        Palauttaa (True, {'id', 'question', 'category', 'similarity'}) tai (False, None).
+        """
+        try:
+            existing = self._execute(
+                "SELECT id, question, category FROM questions WHERE question_normalized = ?",
+                (self.normalize_question(question_text),), fetch='one'
+            )
+            if existing and (exclude_id is None or existing['id'] != int(exclude_id)):
+                return True, {'id': existing['id'], 'question': existing['question'],
+                              'category': existing['category'], 'similarity': 100.0}
+            similar = self.similarity_index.similar_to(question_text, k=1, min_similarity=threshold,
+                                                       exclude_id=exclude_id)
+            if similar:
+                return True, similar[0]
+            return False, None
+        except Exception as e:
+            logger.error(f"Virhe duplikaattitarkistuksessa: {e}")
+            return False, None
+
+    def find_similar_to(self, question_text, k=5, min_similarity=0.5, exclude_id=None):
+        """k samankaltaisinta kysymystä tekstille (pysyvä indeksi, ks. similarity_index.py)."""
+        try:
+            return self.similarity_index.similar_to(question_text, k, min_similarity, exclude_id)
+        except Exception as e:
+            logger.error(f"Virhe samankaltaisten kysymysten haussa: {e}")
+            return []
+
+    def _insert_question(self, question_data, normalized, options_json):
+        """Lisää kysymyksen ja indeksoi sen; palauttaa uuden id:n. Kutsu transaktiossa."""
+        query = """INSERT INTO questions 
+                   (question, question_normalized, explanation, options, correct, category, difficulty, created_at) 
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?)"""
+        if self.is_postgres:
+            query += " RETURNING id"
+        result = self._execute(
+            query,
+            (question_data['question'], normalized, question_data['explanation'], options_json,
+             question_data['correct'], question_data['category'], question_data['difficulty'], datetime.now()),
+            fetch='one' if self.is_postgres else None
+        )
+        if not self.is_postgres:
+            result = self._execute("SELECT last_insert_rowid() as id", fetch='one')
+        question_id = result['id']
+        self.similarity_index.index_questions([(question_id, question_data['question'])])
+        return question_id
+
     def add_question(self, question_data):
         """Lisää uuden kysymyksen."""
         try:
             options_json = json.dumps(question_data['options'])
-            normalized = question_data['question'].lower().strip()
+            normalized = self.normalize_question(question_data['question'])
             
-            self._execute(
-                """INSERT INTO questions 
-                   (question, question_normalized, explanation, options, correct, category, difficulty, created_at) 
-                   VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
-                (question_data['question'], normalized, question_data['explanation'], options_json,
-                 question_data['correct'], question_data['category'], question_data['difficulty'], datetime.now())
-            )
+            with self.transaction():
+                self._insert_question(question_data, normalized, options_json)
+            self.invalidate_question_cache()
             return True, None
         except Exception as e:
             logger.error(f"Virhe kysymyksen lisäämisessä: {e}")
             return False, str(e)
 
-    def bulk_add_questions(self, questions_list):
-        """Lisää useita kysymyksiä kerralla."""
-        stats = {'added': 0, 'skipped': 0, 'errors': []}
-        
-        for q_data in questions_list:
-            try:
-                options_json = json.dumps(q_data['options'])
-                normalized = q_data['question'].lower().strip()
-                
-                existing = self._execute(
-                    "SELECT id FROM questions WHERE question_normalized = ?", 
-                    (normalized,), 
-                    fetch='one'
-                )
-                
-                if existing:
-                    stats['skipped'] += 1
-                    continue
-                
-                self._execute(
-                    """INSERT INTO questions 
-                       (question, question_normalized, explanation, options, correct, category, difficulty, created_at) 
-                       VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
-                    (q_data['question'], normalized, q_data['explanation'], options_json, 
-                     q_data['correct'], q_data['category'], q_data['difficulty'], datetime.now())
-                )
-                stats['added'] += 1
-                
-            except Exception as e:
-                stats['skipped'] += 1
-                stats['errors'].append(f"Virhe kysymyksessä '{q_data.get('question', 'N/A')[:30]}': {str(e)}")
-                logger.error(f"Bulk add error: {e}")
-        
+    def import_questions(self, questions, progress=None):
+        """
+        Tuo kysymykset erissä (ks. data_access/question_import.py). questions voi
+        olla lista tai virta, esim. iter_json_array(tiedosto). Koko tuonti on yksi
+        transaktio: tietokantavirhe perii kaikki erät ja palauttaa (False, virhe).
+        Virheelliset kysymykset ohitetaan, ja sama tai lähes sama kysymys
+        (NEAR_DUPLICATE_THRESHOLD) lasketaan duplikaatiksi.
+        progress(käsitelty, tilastot) kutsutaan jokaisen erän jälkeen. Huom. SQLitessä
+        taustatyön edistymistä ei voi kirjoittaa admin_jobs-tauluun tuonnin aikana,
+        koska tuonnin transaktio pitää kirjoituslukkoa (ks. JobContext.progress);
+        tila päivittyy vasta tuonnin päätyttyä. PostgreSQL:ssä edistyminen näkyy erä erältä.
+        Palauttaa (True, {'added', 'duplicates', 'skipped', 'errors'}).
+        """
+        try:
+            with self.transaction():
+                stats = QuestionImporter(self).run(questions, progress)
+        except Exception as e:
+            logger.error(f"Virhe kysymysten tuonnissa (kaikki muutokset peruttu): {e}")
+            return False, str(e)
+        if stats['added']:
+            self.invalidate_question_cache()
         return True, stats
 
-    def find_similar_questions(self, threshold=0.95):
-        """Etsii samankaltaiset kysymykset."""
+    def bulk_add_questions(self, questions_list, progress=None):
+        """Lisää useita kysymyksiä kerralla (ks. import_questions)."""
+        return self.import_questions(questions_list, progress)
+
+    def find_similar_questions(self, threshold=0.95, question_ids=None):
+        """
+        Etsii samankaltaiset kysymysparit. question_ids rajaa haun pareihin, joiden
+        molemmat kysymykset ovat listassa (esim. vietävät kysymykset).
+        Ehdokasparit lasketaan muistissa kynnyksen mukaan (ks. data_access/similarity.py).
+        """
         try:
             all_questions = self._execute("SELECT id, question, category FROM questions ORDER BY id", fetch='all')
+            if question_ids is not None:
+                wanted = {int(question_id) for question_id in question_ids}
+                all_questions = [q for q in all_questions or [] if q['id'] in wanted]
             if not all_questions:
                 return []
-            
-            similar_pairs = []
-            questions_list = list(all_questions)
-            
-            for i, q1 in enumerate(questions_list):
-                for q2 in questions_list[i+1:]:
-                    similarity = SequenceMatcher(None, q1['question'].lower(), q2['question'].lower()).ratio()
-                    if similarity >= threshold:
-                        similar_pairs.append({
-                            'id1': q1['id'],
-                            'question1': q1['question'],
-                            'category1': q1['category'],
-                            'id2': q2['id'],
-                            'question2': q2['question'],
-                            'category2': q2['category'],
-                            'similarity': round(similarity * 100, 1)
-                        })
-            
-            return similar_pairs
+            return find_similar_pairs(all_questions, threshold)
         except Exception as e:
             logger.error(f"Virhe samankaltaisuushaussa: {e}")
             return []
 
     def delete_question(self, question_id):
         """Poistaa kysymyksen ja siihen liittyvät tiedot."""
+        success, result = self.delete_questions([question_id])
+        return (True, None) if success else (False, result)
+
+    def delete_questions(self, question_ids):
+        """
+        Poistaa kysymykset ja niihin liittyvät tiedot yhdellä lauseella per taulu
+        yhdessä transaktiossa. Palauttaa (True, poistettujen määrä) tai (False, virhe).
+        """
+        question_ids = sorted({int(question_id) for question_id in question_ids})
+        if not question_ids:
+            return True, 0
+        placeholders = ', '.join(['?'] * len(question_ids))
         try:
-            self._execute("DELETE FROM user_question_progress WHERE question_id = ?", (question_id,))
-            self._execute("DELETE FROM question_attempts WHERE question_id = ?", (question_id,))
-            self._execute("DELETE FROM questions WHERE id = ?", (question_id,))
-            return True, None
+            with self.transaction():
+                self.reset_user_aggregates(question_ids=question_ids)
+                self._execute(f"DELETE FROM user_question_progress WHERE question_id IN ({placeholders})",
+                              tuple(question_ids))
+                self._execute(f"DELETE FROM question_attempts WHERE question_id IN ({placeholders})",
+                              tuple(question_ids))
+                deleted = self._execute(f"DELETE FROM questions WHERE id IN ({placeholders}) RETURNING id",
+                                        tuple(question_ids), fetch='all') or []
+                self.similarity_index.remove(question_ids)
+            if deleted:
+                self.invalidate_question_cache()
+            return True, len(deleted)
+        except Exception as e:
+            logger.error(f"Virhe kysymysten poistossa: {e}")
+            return False, str(e)
+
+    def validate_questions(self, question_ids, validated_by, comment=None):
+        """
+        Merkitsee kysymykset validoiduiksi yhdellä UPDATE-lauseella.
+        Palauttaa (True, päivitettyjen määrä) tai (False, virhe).
+        """
+        question_ids = sorted({int(question_id) for question_id in question_ids})
+        if not question_ids:
+            return True, 0
+        placeholders = ', '.join(['?'] * len(question_ids))
+        try:
+            with self.transaction():
+                updated = self._execute(
+                    f"UPDATE questions SET status = ?, validated_by = ?, validated_at = ?, validation_comment = ? "
+                    f"WHERE id IN ({placeholders}) RETURNING id",
+                    ('validated', validated_by, datetime.now(), comment or None, *question_ids), fetch='all'
+                ) or []
+            if updated:
+                self.invalidate_question_cache()
+            return True, len(updated)
         except Exception as e:
-            logger.error(f"Virhe kysymyksen poistossa: {e}")
+            logger.error(f"Virhe kysymysten validoinnissa: {e}")
             return False, str(e)
 
     def clear_all_questions(self):
@@ -625,7 +1294,10 @@ class DatabaseManager:
             
             self._execute("DELETE FROM question_attempts")
             self._execute("DELETE FROM user_question_progress")
+            self.reset_user_aggregates()
             self._execute("DELETE FROM questions")
+            self.similarity_index.clear()
+            self.invalidate_question_cache()
             
             return True, {'deleted_count': count}
         except Exception as e:
@@ -645,56 +1317,108 @@ class DatabaseManager:
             'farmakologia': 'kliininen farmakologia'
         }
         
+        success, result = self.remap_categories(category_mapping)
+        if not success:
+            return False, result
+        category_counts = self.question_cache.snapshot().category_counts()
+        return True, {'updated': result, 'categories': category_counts}
+
+    def remap_categories(self, mapping):
+        """
+        Vaihtaa kategoriat {vanha: uusi} (vanha ilman kirjainkoon eroa) yhdellä
+        UPDATE ... CASE -lauseella. Muunnokset eivät ketjuudu (a->b, b->c ei
+        tee a:sta c:tä). Palauttaa (True, päivitettyjen määrä) tai (False, virhe).
+        """
+        mapping = {old.lower(): new for old, new in mapping.items()}
+        if not mapping:
+            return True, 0
         try:
-            updated_count = 0
-            for old_cat, new_cat in category_mapping.items():
-                result = self._execute(
-                    "UPDATE questions SET category = ? WHERE LOWER(category) = LOWER(?)", 
-                    (new_cat, old_cat)
-                )
-            
-            categories = self.get_categories()
-            category_counts = {}
-            for cat in categories:
-                count_result = self._execute("SELECT COUNT(*) as count FROM questions WHERE category = ?", (cat,), fetch='one')
-                category_counts[cat] = count_result['count'] if count_result else 0
-            
-            return True, {'updated': sum(category_counts.values()), 'categories': category_counts}
+            with self.transaction():
+                # SQLiten LOWER() ei muunna ä/ö-kirjaimia, joten nykyiset arvot sovitetaan Pythonissa
+                rows = self._execute("SELECT DISTINCT category FROM questions", fetch='all') or []
+                targets = {row['category']: mapping[row['category'].lower()] for row in rows
+                           if row['category'] and row['category'].lower() in mapping}
+                if not targets:
+                    return True, 0
+                cases = ' '.join(['WHEN ? THEN ?'] * len(targets))
+                placeholders = ', '.join(['?'] * len(targets))
+                params = [value for pair in targets.items() for value in pair] + list(targets)
+                updated = self._execute(
+                    f"UPDATE questions SET category = CASE category {cases} END "
+                    f"WHERE category IN ({placeholders}) RETURNING id",
+                    tuple(params), fetch='all'
+                ) or []
+                if updated:
+                    self.reset_user_aggregates()
+            if updated:
+                self.invalidate_question_cache()
+            return True, len(updated)
         except Exception as e:
             logger.error(f"Virhe kategorioiden yhdistämisessä: {e}")
             return False, str(e)
 
-    def save_or_update_session(self, user_id, session_type, question_ids, answers, current_index, time_remaining):
+    def save_or_update_session(self, user_id, session_type, question_ids, answers, current_index, time_remaining,
+                               session_id=None, start_time=None):
         """Tallentaa tai päivittää aktiivisen session."""
         try:
             if self.is_postgres:
                 query = """
                     INSERT INTO active_sessions 
-                        (user_id, session_type, question_ids, answers, current_index, time_remaining, last_updated)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s)
+                        (user_id, session_type, question_ids, answers, current_index, time_remaining, last_updated,
+                         session_id, start_time)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
                     ON CONFLICT(user_id) DO UPDATE SET
                         session_type = EXCLUDED.session_type, 
                         question_ids = EXCLUDED.question_ids, 
                         answers = EXCLUDED.answers, 
                         current_index = EXCLUDED.current_index, 
                         time_remaining = EXCLUDED.time_remaining, 
-                        last_updated = EXCLUDED.last_updated
+                        last_updated = EXCLUDED.last_updated,
+                        session_id = EXCLUDED.session_id,
+                        start_time = EXCLUDED.start_time
                 """
             else:
                 query = """
                     INSERT OR REPLACE INTO active_sessions 
-                        (user_id, session_type, question_ids, answers, current_index, time_remaining, last_updated)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                        (user_id, session_type, question_ids, answers, current_index, time_remaining, last_updated,
+                         session_id, start_time)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
                 """
             self._execute(
                 query, 
-                (user_id, session_type, json.dumps(question_ids), json.dumps(answers), current_index, time_remaining, datetime.now())
+                (user_id, session_type, json.dumps(question_ids), json.dumps(answers), current_index, time_remaining,
+                 datetime.now(), session_id, start_time)
             )
             return True, None
         except Exception as e:
             logger.error(f"Virhe session tallennuksessa: {e}")
             return False, str(e)
 
+    # Kentät, joita update_active_session saa muuttaa (sarakkeiden nimet menevät kyselyyn)
+    _SESSION_UPDATE_FIELDS = ('answers', 'current_index', 'time_remaining')
+
+    def update_active_session(self, user_id, session_id, changes):
+        """
+        Päivittää vain annetut kentät käyttäjän aktiiviseen sessioon, jos
+        session_id täsmää. Palauttaa (True, None), (False, 'not_found') tai (False, virhe).
+        """
+        columns = [name for name in self._SESSION_UPDATE_FIELDS if name in changes]
+        if not columns:
+            return True, None
+        values = [json.dumps(changes[name]) if name == 'answers' else changes[name] for name in columns]
+        assignments = ', '.join(f"{name} = ?" for name in columns)
+        try:
+            updated = self._execute(
+                f"UPDATE active_sessions SET {assignments}, last_updated = ? "
+                f"WHERE user_id = ? AND session_id = ? RETURNING user_id",
+                (*values, datetime.now(), user_id, session_id),
+                fetch='one'
+            )
+            return (True, None) if updated else (False, 'not_found')
+        except Exception as e:
+            logger.error(f"Virhe session päivityksessä: {e}")
+            return False, str(e)
+
     def get_active_session(self, user_id):
         """Hakee aktiivisen session."""
         try:
@@ -718,6 +1442,31 @@ class DatabaseManager:
             logger.error(f"Virhe session poistossa: {e}")
             return False, str(e)
 
+    # Vastauksista johdetut käyttäjäkohtaiset koosteet; puuttuva rivi lasketaan uudelleen
+    # historiasta (ks. achievement_manager.py ja stats_manager.py)
+    USER_AGGREGATE_TABLES = ('user_achievement_counters', 'user_stats_summary')
+
+    def reset_user_aggregates(self, user_id=None, question_id=None, tables=USER_AGGREGATE_TABLES, question_ids=None):
+        """
+        Poistaa käyttäjien koosterivit, jolloin ne lasketaan question_attempts-
+        ja user_question_progress-tauluista uudelleen seuraavalla käytöllä.
+        question_id / question_ids: kysymyksiin vastanneet; ilman rajausta kaikki käyttäjät.
+        """
+        if question_id is not None:
+            question_ids = [question_id]
+        for table in tables:
+            if user_id is not None:
+                self._execute(f"DELETE FROM {table} WHERE user_id = ?", (user_id,))
+            elif question_ids is not None:
+                placeholders = ', '.join(['?'] * len(question_ids))
+                self._execute(
+                    f"DELETE FROM {table} WHERE user_id IN "
+                    f"(SELECT DISTINCT user_id FROM question_attempts WHERE question_id IN ({placeholders}))",
+                    tuple(question_ids)
+                )
+            else:
+                self._execute(f"DELETE FROM {table}")
+
     def get_user_achievements(self, user_id):
         """Hakee käyttäjän saavutukset."""
         return self._execute(
@@ -748,33 +1497,14 @@ class DatabaseManager:
     # UUDET KATEGORIATESTIT METODIT v1.1.0
     # ============================================================================
 
-    def get_questions_by_categories(self, categories, count=30, difficulty=None):
-        """Hae kysymyksiä valituista kategorioista"""
+    def get_questions_by_categories(self, categories, count=30, difficulty=None, seed=None):
+        """Hae julkaistuja kysymyksiä valituista kategorioista"""
         try:
-            placeholders = ','.join(['?'] * len(categories))
-            query = f"""
-                SELECT * FROM questions
-                WHERE category IN ({placeholders})
-                AND status = 'approved'
-            """
-            params = list(categories)
-            
-            if difficulty:
-                query += " AND difficulty = ?"
-                params.append(difficulty)
-            
-            query += " ORDER BY RANDOM() LIMIT ?"
-            params.append(count)
-            
-            rows = self._execute(query, tuple(params), fetch='all')
-            
-            questions = []
-            for row in rows:
-                q_dict = dict(row)
-                q_dict['options'] = json.loads(q_dict['options'])
-                questions.append(q_dict)
-            
-            return questions
+            questions = self._sample_questions(
+                count, categories, [difficulty] if difficulty else None,
+                published_only=True, seed=seed
+            )
+            return [question.to_dict() for question in questions]
         except Exception as e:
             logger.error(f"Virhe kategorioiden kysymysten haussa: {e}")
             return []
@@ -871,17 +1601,8 @@ class DatabaseManager:
     def get_all_categories(self):
         """Hae kaikki kategoriat kysymysmäärien kanssa"""
         try:
-            rows = self._execute("""
-                SELECT 
-                    category as name,
-                    COUNT(*) as question_count
-                FROM questions
-                WHERE status = 'approved' OR status = 'validated'
-                GROUP BY category
-                ORDER BY category
-            """, fetch='all')
-            
-            return [dict(row) for row in rows] if rows else []
+            counts = self.question_cache.snapshot().category_counts(PUBLISHED_STATUSES)
+            return [{'name': category, 'question_count': counts[category]} for category in sorted(counts)]
             
         except Exception as e:
             logger.error(f"Virhe kategorioiden haussa: {e}")
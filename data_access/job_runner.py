@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+# data_access/job_runner.py
+"""
+Pitkät ylläpitotoiminnot taustalla ilman erillistä välittäjää (broker).
+
+Duplikaattihaku, PDF/Word-vienti, massalataus ja kategorioiden
+yhdistäminen varasivat ennen gunicornin sync-workerin koko ajoksi. Nyt
+reitti kutsuu submit(), joka kirjaa työn admin_jobs-tauluun ja antaa sen
+workerin säiepoolille (JOB_WORKERS säiettä per worker). Reitti palaa
+heti, ja selain kysyy tilaa reitiltä /admin/jobs/<id>. Tila on taulussa,
+joten kysely voi osua mihin tahansa workeriin.
+
+- Työfunktio saa ensimmäisenä argumenttina JobContextin. progress(done,
+  total, message) päivittää edistymisen (enintään PROGRESS_INTERVAL
+  sekunnin välein), ja output_path(nimi) antaa polun tulostiedostolle
+  (JOB_OUTPUT_DIR, oletuksena järjestelmän tmp-hakemistossa). Funktion
+  paluuarvo tallennetaan JSON-muodossa tulokseksi; poikkeus merkitsee
+  työn epäonnistuneeksi.
+- Tila kirjoitetaan omalla yhteydellä pyynnön unit of workin ohi, joten
+  se näkyy muille workereille heti eikä vasta pyynnön lopussa.
+- SQLitessä edistymistä ei kirjoiteta, kun työsäikeellä on avoin
+  transaktio (kirjoituslukko on sillä itsellään); PostgreSQL:ssä kyllä.
+- Säikeet jakavat workerin GILin: CPU-raskas työ hidastaa saman workerin
+  muita pyyntöjä, mutta ei varaa workeria kokonaan.
+
+Kestävyys: työ elää workerin muistissa. Hallittu sammutus (atexit,
+gunicornin worker_exit) merkitsee jonossa odottaneet työt
+epäonnistuneiksi. Jos worker kuolee kesken, työ merkitään
+epäonnistuneeksi, kun sen tila on ollut päivittämättä JOB_STALE_SECONDS
+sekuntia. Päättyneet työt tiedostoineen poistetaan JOB_RETENTION_HOURS
+tunnin jälkeen.
+"""
+import os
+import json
+import time
+import atexit
+import shutil
+import logging
+import secrets
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+STATUS_QUEUED = 'queued'
+STATUS_RUNNING = 'running'
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+ACTIVE_STATUSES = (STATUS_QUEUED, STATUS_RUNNING)
+
+# Edistyminen kirjoitetaan kantaan enintään näin usein (sekuntia)
+PROGRESS_INTERVAL = 0.5
+
+
+class JobContext:
+    """Työfunktion kahva: edistymisen raportointi ja tulostiedoston polku."""
+
+    def __init__(self, runner, job_id):
+        self.runner = runner
+        self.job_id = job_id
+        self.output_file = None
+        self._written_at = 0.0
+        self._message = None
+
+    def progress(self, done, total=None, message=None):
+        """
+        Päivittää edistymisen. Saman vaiheen (message) välikutsut harvennetaan
+        PROGRESS_INTERVAL-väliin; vaiheen vaihto ja viimeinen kutsu kirjoitetaan aina.
+        """
+        now = time.monotonic()
+        if (message == self._message and now - self._written_at < PROGRESS_INTERVAL
+                and (total is None or done < total)):
+            return
+        db = self.runner.db_manager
+        if not db.is_postgres and getattr(db._local, 'unit', None) is not None:
+            return
+        self._written_at, self._message = now, message
+        self.runner._update(self.job_id, progress_done=done, progress_total=total, message=message)
+
+    def output_path(self, filename):
+        """Polku työn tulostiedostolle; /admin/jobs/<id>/download palauttaa sen."""
+        directory = os.path.join(self.runner.output_dir, self.job_id)
+        os.makedirs(directory, exist_ok=True)
+        self.output_file = os.path.basename(filename)
+        return os.path.join(directory, self.output_file)
+
+
+class JobRunner:
+    """admin_jobs-taulu + workerikohtainen säiepooli."""
+
+    def __init__(self, db_manager, max_workers=None, output_dir=None, stale_seconds=None, retention_hours=None):
+        self.db_manager = db_manager
+        if max_workers is None:
+            max_workers = int(os.environ.get('JOB_WORKERS', 2))
+        if output_dir is None:
+            output_dir = os.environ.get('JOB_OUTPUT_DIR') or os.path.join(tempfile.gettempdir(), 'love_jobs')
+        if stale_seconds is None:
+            stale_seconds = float(os.environ.get('JOB_STALE_SECONDS', 1800))
+        if retention_hours is None:
+            retention_hours = float(os.environ.get('JOB_RETENTION_HOURS', 24))
+        self.max_workers = max(1, max_workers)
+        self.output_dir = output_dir
+        self.stale_seconds = stale_seconds
+        self.retention_hours = retention_hours
+
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+        # job_id -> Future tämän prosessin töille
+        self._futures = {}
+        atexit.register(self.close)
+
+    def _ensure_executor(self):
+        """Luo säiepoolin laiskasti (myös gunicornin forkin jälkeen)."""
+        with self._lock:
+            if self._pid != os.getpid() or self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='admin-job')
+                self._futures = {}
+                self._pid = os.getpid()
+            return self._executor
+
+    def upload_path(self, suffix=''):
+        """Polku pyynnön mukana tulleelle tiedostolle, jonka taustatyö käsittelee ja poistaa."""
+        os.makedirs(self.output_dir, exist_ok=True)
+        fd, path = tempfile.mkstemp(suffix=suffix, prefix='upload_', dir=self.output_dir)
+        os.close(fd)
+        return path
+
+    def submit(self, kind, func, *args, user_id=None):
+        """Kirjaa työn ja antaa sen säiepoolille: func(JobContext, *args). Palauttaa työn id:n."""
+        self.cleanup()
+        job_id = secrets.token_urlsafe(12)
+        now = datetime.now()
+        self.db_manager._execute_detached(
+            "INSERT INTO admin_jobs (id, kind, status, progress_done, created_by, created_at, updated_at) "
+            "VALUES (?, ?, ?, 0, ?, ?, ?)",
+            (job_id, kind, STATUS_QUEUED, user_id, now, now)
+        )
+        executor = self._ensure_executor()
+        with self._lock:
+            self._futures[job_id] = executor.submit(self._run, job_id, func, args)
+        return job_id
+
+    def _update(self, job_id, **fields):
+        fields['updated_at'] = datetime.now()
+        assignments = ', '.join(f"{name} = ?" for name in fields)
+        try:
+            self.db_manager._execute_detached(
+                f"UPDATE admin_jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id)
+            )
+        except Exception as e:
+            logger.error(f"Virhe taustatyön {job_id} tilan päivityksessä: {e}")
+
+    def _run(self, job_id, func, args):
+        context = JobContext(self, job_id)
+        self._update(job_id, status=STATUS_RUNNING)
+        try:
+            result = func(context, *args)
+        except Exception as e:
+            logger.error(f"Virhe taustatyössä {job_id}: {e}")
+            self._update(job_id, status=STATUS_FAILED, error=str(e), finished_at=datetime.now())
+        else:
+            self._update(job_id, status=STATUS_DONE, result=json.dumps(result, ensure_ascii=False, default=str),
+                         output_file=context.output_file, finished_at=datetime.now())
+        finally:
+            with self._lock:
+                self._futures.pop(job_id, None)
+
+    def get(self, job_id):
+        """
+        Palauttaa työn tilan sanakirjana tai None. Työ, jonka tila on ollut
+        päivittämättä stale_seconds sekuntia, merkitään epäonnistuneeksi.
+        """
+        # Vanhentuneisuus luetaan ensin: SQLitessä UPDATE odottaisi käynnissä olevan
+        # tuonnin kirjoituslukkoa, ja tilakysely kaatuisi "database is locked"
+        cutoff = datetime.now() - timedelta(seconds=self.stale_seconds)
+        row = self._select(job_id, cutoff)
+        if row and row['stale']:
+            self.db_manager._execute_detached(
+                "UPDATE admin_jobs SET status = ?, error = ?, finished_at = ? "
+                "WHERE id = ? AND status IN (?, ?) AND updated_at < ?",
+                (STATUS_FAILED, 'Työ keskeytyi (worker sammui tai käynnistyi uudelleen)', datetime.now(),
+                 job_id, *ACTIVE_STATUSES, cutoff)
+            )
+            row = self._select(job_id, cutoff)
+        if not row:
+            return None
+        job = dict(row)
+        del job['stale']
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        return job
+
+    def _select(self, job_id, stale_before):
+        return self.db_manager._execute_detached(
+            "SELECT id, kind, status, progress_done, progress_total, message, result, output_file, error, "
+            "created_by, created_at, updated_at, finished_at, "
+            "CASE WHEN status IN (?, ?) AND updated_at < ? THEN 1 ELSE 0 END AS stale "
+            "FROM admin_jobs WHERE id = ?",
+            (*ACTIVE_STATUSES, stale_before, job_id), fetch='one'
+        )
+
+    def output_file_path(self, job):
+        """Valmiin työn tulostiedoston polku tai None."""
+        if job['status'] != STATUS_DONE or not job.get('output_file'):
+            return None
+        path = os.path.join(self.output_dir, job['id'], job['output_file'])
+        return path if os.path.isfile(path) else None
+
+    def cleanup(self):
+        """Poistaa yli retention_hours tuntia sitten päättyneet työt ja niiden tiedostot."""
+        cutoff = datetime.now() - timedelta(hours=self.retention_hours)
+        try:
+            rows = self.db_manager._execute_detached(
+                "SELECT id FROM admin_jobs WHERE status NOT IN (?, ?) AND updated_at < ?",
+                (*ACTIVE_STATUSES, cutoff), fetch='all'
+            ) or []
+            if not rows:
+                return
+            job_ids = [row['id'] for row in rows]
+            placeholders = ', '.join(['?'] * len(job_ids))
+            self.db_manager._execute_detached(f"DELETE FROM admin_jobs WHERE id IN ({placeholders})", tuple(job_ids))
+            for job_id in job_ids:
+                shutil.rmtree(os.path.join(self.output_dir, job_id), ignore_errors=True)
+        except Exception as e:
+            logger.error(f"Virhe vanhojen taustatöiden siivouksessa: {e}")
+
+    def close(self):
+        """Peruu jonossa odottavat työt (atexit / gunicornin worker_exit); käynnissä olevat jatkuvat."""
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                return
+            executor, futures = self._executor, dict(self._futures)
+            self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+        for job_id, future in futures.items():
+            if future.cancelled():
+                self._update(job_id, status=STATUS_FAILED, error='Worker sammutettiin ennen työn alkua',
+                             finished_at=datetime.now())
@@ -0,0 +1,407 @@
+# -*- coding: utf-8 -*-
+# data_access/migrations.py
+"""
+Versioidut tietokantamigraatiot.
+
+Jokainen migraatio ajetaan kerran; ajetut versiot kirjataan tauluun
+schema_version. Uusi migraatio lisätään MIGRATIONS-listan loppuun
+seuraavalla versionumerolla, eikä jo julkaistuja migraatioita muuteta.
+Migraatioiden pitää olla idempotentteja (IF NOT EXISTS).
+
+run_migrations() tekee lämpimässä käynnistyksessä yhden kyselyn
+(MAX(version)). Vain jos migraatioita puuttuu, otetaan lukko
+(PostgreSQL: advisory lock, SQLite: BEGIN IMMEDIATE), jotta useampi
+gunicorn-worker ei aja samoja migraatioita yhtä aikaa.
+"""
+import logging
+from collections import namedtuple
+
+from data_access.statements import next_review_sql
+
+logger = logging.getLogger(__name__)
+
+Migration = namedtuple('Migration', ['version', 'name', 'apply'])
+
+# pg_advisory_lock-avain migraatioille (mielivaltainen, sovelluskohtainen vakio)
+MIGRATION_LOCK_KEY = 7207310001
+
+
+def _column_exists(db, cur, table_name, column_name):
+    if db.is_postgres:
+        cur.execute("""
+            SELECT 1 FROM information_schema.columns
+            WHERE table_name = %s AND column_name = %s
+        """, (table_name.lower(), column_name.lower()))
+        return cur.fetchone() is not None
+    cur.execute(f"PRAGMA table_info({table_name})")
+    return column_name in [row[1] for row in cur.fetchall()]
+
+
+def _add_column(db, cur, table_name, column_name, column_type):
+    if not _column_exists(db, cur, table_name, column_name):
+        cur.execute(f"ALTER TABLE {table_name} ADD COLUMN {column_name} {column_type}")
+
+
+def _validation_columns(db, cur):
+    """Sarakkeet, joita migrate_database aiemmin tarkisti joka käynnistyksessä."""
+    bool_type = "BOOLEAN DEFAULT false" if db.is_postgres else "INTEGER DEFAULT 0"
+    _add_column(db, cur, 'user_question_progress', 'mistake_acknowledged', bool_type)
+    _add_column(db, cur, 'questions', 'status', "TEXT DEFAULT 'validated'")
+    _add_column(db, cur, 'questions', 'validated_by', 'INTEGER')
+    _add_column(db, cur, 'questions', 'validated_at', 'TIMESTAMP')
+    _add_column(db, cur, 'questions', 'validation_comment', 'TEXT')
+
+
+# Indeksit kuumille kyselyille. Sama syntaksi toimii SQLitessä ja PostgreSQL:ssä.
+HOT_PATH_INDEXES = [
+    # Saavutukset, tilastot, viikkovertailu, putket: WHERE user_id = ? [AND timestamp ...] ORDER BY timestamp
+    "CREATE INDEX IF NOT EXISTS idx_attempts_user_time ON question_attempts (user_id, timestamp)",
+    # Virheet ja kysymyskohtainen historia
+    "CREATE INDEX IF NOT EXISTS idx_attempts_user_question ON question_attempts (user_id, question_id)",
+    # Kysymyksen poisto ja kysymyskohtaiset tilastot
+    "CREATE INDEX IF NOT EXISTS idx_attempts_question ON question_attempts (question_id)",
+    "CREATE INDEX IF NOT EXISTS idx_progress_question ON user_question_progress (question_id)",
+    # Kertausjono: vain jo näytetyt kysymykset
+    "CREATE INDEX IF NOT EXISTS idx_progress_user_due ON user_question_progress (user_id, last_shown) "
+    "WHERE last_shown IS NOT NULL",
+    # Harjoittelun suodattimet
+    "CREATE INDEX IF NOT EXISTS idx_questions_category_difficulty ON questions (category, difficulty)",
+    "CREATE INDEX IF NOT EXISTS idx_questions_difficulty ON questions (difficulty)",
+    # Validointinäkymä
+    "CREATE INDEX IF NOT EXISTS idx_questions_status ON questions (status, category)",
+    # Duplikaattitarkistus
+    "CREATE INDEX IF NOT EXISTS idx_questions_normalized ON questions (question_normalized) "
+    "WHERE question_normalized IS NOT NULL",
+]
+
+
+def _hot_path_indexes(db, cur):
+    for statement in HOT_PATH_INDEXES:
+        cur.execute(statement)
+
+
+def _cache_versions(db, cur):
+    """Versiolaskurit prosessinsisäisille välimuisteille (ks. question_cache.py)."""
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS cache_versions (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    cur.execute("INSERT INTO cache_versions (name, version) VALUES ('questions', 0) ON CONFLICT (name) DO NOTHING")
+
+
+def _simulation_sessions(db, cur):
+    """Simulaation tila palvelimella: cookie sisältää vain session_id:n (ks. SimulationStore)."""
+    _add_column(db, cur, 'active_sessions', 'session_id', 'TEXT')
+    _add_column(db, cur, 'active_sessions', 'start_time', 'TEXT')
+
+
+def _achievement_counters(db, cur):
+    """Saavutusten laskurit: päivitetään vastausten yhteydessä (ks. achievement_manager.py)."""
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS user_achievement_counters (
+            user_id INTEGER PRIMARY KEY,
+            total_attempts INTEGER NOT NULL DEFAULT 0,
+            fast_answers INTEGER NOT NULL DEFAULT 0,
+            speed_answers INTEGER NOT NULL DEFAULT 0,
+            early_answers INTEGER NOT NULL DEFAULT 0,
+            late_answers INTEGER NOT NULL DEFAULT 0,
+            correct_run INTEGER NOT NULL DEFAULT 0,
+            day_streak INTEGER NOT NULL DEFAULT 0,
+            last_practice_date TEXT,
+            unlocked TEXT NOT NULL DEFAULT '[]',
+            updated_at TIMESTAMP
+        )
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS user_category_counters (
+            user_id INTEGER NOT NULL,
+            category TEXT NOT NULL,
+            correct INTEGER NOT NULL DEFAULT 0,
+            total INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, category)
+        )
+    """)
+
+
+def _stats_summary(db, cur):
+    """Käyttäjän oppimistilastot yhtenä JSON-rivinä (ks. stats_manager.py)."""
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS user_stats_summary (
+            user_id INTEGER PRIMARY KEY,
+            summary TEXT NOT NULL,
+            updated_at TIMESTAMP
+        )
+    """)
+
+
+def _next_review_at(db, cur):
+    """
+    Seuraavan kertauksen ajankohta tallennettuna sarakkeena, jotta
+    kertausjono ja erääntyneiden määrä luetaan indeksistä eikä
+    DATE(last_shown, '+' || interval || ' days') -lauseketta lasketa joka riville.
+    """
+    _add_column(db, cur, 'user_question_progress', 'next_review_at', 'TIMESTAMP')
+    dialect = 'postgres' if db.is_postgres else 'sqlite'
+    cur.execute(f"""
+        UPDATE user_question_progress
+        SET next_review_at = {next_review_sql(dialect, 'last_shown', 'COALESCE(interval, 1)')}
+        WHERE last_shown IS NOT NULL AND next_review_at IS NULL
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_progress_user_next_review ON user_question_progress "
+                "(user_id, next_review_at) WHERE next_review_at IS NOT NULL")
+    # Korvautuu yllä olevalla: kertausjono ei enää suodata last_shown-sarakkeella
+    cur.execute("DROP INDEX IF EXISTS idx_progress_user_due")
+
+
+def _user_cache_version(db, cur):
+    """Versiolaskuri käyttäjävälimuistille (ks. user_cache.py)."""
+    cur.execute("INSERT INTO cache_versions (name, version) VALUES ('users', 0) ON CONFLICT (name) DO NOTHING")
+
+
+def _question_similarity_index(db, cur):
+    """Pysyvä LSH-indeksi lähes samoille kysymyksille (ks. similarity_index.py); rakennetaan heti."""
+    from data_access.similarity_index import bucket_rows
+
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS question_lsh (
+            question_id INTEGER NOT NULL,
+            band INTEGER NOT NULL,
+            bucket BIGINT NOT NULL,
+            PRIMARY KEY (question_id, band)
+        )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_question_lsh_bucket ON question_lsh (bucket)")
+    cur.execute("DELETE FROM question_lsh")
+    cur.execute("SELECT id, question FROM questions")
+    rows = bucket_rows((row[0], row[1]) for row in cur.fetchall())
+    if rows:
+        p = db.param_style
+        cur.executemany(f"INSERT INTO question_lsh (question_id, band, bucket) VALUES ({p}, {p}, {p})", rows)
+
+
+
+def _admin_jobs(db, cur):
+    """Taustatöiden tila, edistyminen ja tulos (ks. job_runner.py)."""
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS admin_jobs (
+            id TEXT PRIMARY KEY,
+            kind TEXT NOT NULL,
+            status TEXT NOT NULL,
+            progress_done INTEGER NOT NULL DEFAULT 0,
+            progress_total INTEGER,
+            message TEXT,
+            result TEXT,
+            output_file TEXT,
+            error TEXT,
+            created_by INTEGER,
+            created_at TIMESTAMP NOT NULL,
+            updated_at TIMESTAMP NOT NULL,
+            finished_at TIMESTAMP
+        )
+    """)
+
+
+MIGRATIONS = [
+    Migration(1, 'validation_columns', _validation_columns),
+    Migration(2, 'hot_path_indexes', _hot_path_indexes),
+    Migration(3, 'cache_versions', _cache_versions),
+    Migration(4, 'simulation_sessions', _simulation_sessions),
+    Migration(5, 'achievement_counters', _achievement_counters),
+    Migration(6, 'stats_summary', _stats_summary),
+    Migration(7, 'next_review_at', _next_review_at),
+    Migration(8, 'user_cache_version', _user_cache_version),
+    Migration(9, 'question_similarity_index', _question_similarity_index),
+    Migration(10, 'admin_jobs', _admin_jobs),
+]
+
+LATEST_VERSION = MIGRATIONS[-1].version
+
+_CREATE_SCHEMA_VERSION = """
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+"""
+
+
+def _read_version(conn, cur):
+    """Palauttaa skeeman version tai None, jos schema_version-taulua ei ole."""
+    try:
+        cur.execute("SELECT MAX(version) FROM schema_version")
+        return cur.fetchone()[0] or 0
+    except Exception:
+        conn.rollback()
+        return None
+
+
+def _record(db, cur, migration):
+    cur.execute(
+        f"INSERT INTO schema_version (version, name) VALUES ({db.param_style}, {db.param_style})",
+        (migration.version, migration.name)
+    )
+
+
+def _pending(version):
+    return [m for m in MIGRATIONS if m.version > version]
+
+
+def _run_postgres(db, conn, cur):
+    cur.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK_KEY,))
+    conn.commit()
+    try:
+        cur.execute(_CREATE_SCHEMA_VERSION)
+        conn.commit()
+        # Toinen worker on voinut ajaa migraatiot sillä välin, kun odotimme lukkoa
+        version = _read_version(conn, cur)
+        for migration in _pending(version):
+            try:
+                migration.apply(db, cur)
+                _record(db, cur, migration)
+                conn.commit()
+                logger.info(f"Migraatio {migration.version} ({migration.name}) ajettu.")
+                version = migration.version
+            except Exception as e:
+                conn.rollback()
+                logger.error(f"Virhe migraatiossa {migration.version} ({migration.name}): {e}")
+                break
+    finally:
+        conn.rollback()
+        cur.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK_KEY,))
+        conn.commit()
+    return version
+
+
+def _run_sqlite(db, conn, cur):
+    cur.execute(_CREATE_SCHEMA_VERSION)
+    conn.commit()
+    # Kirjoituslukko koko ajon ajaksi; SQLitessä myös DDL on transaktionaalista
+    cur.execute("BEGIN IMMEDIATE")
+    try:
+        version = _read_version(conn, cur)
+        for migration in _pending(version):
+            cur.execute("SAVEPOINT migration")
+            try:
+                migration.apply(db, cur)
+                _record(db, cur, migration)
+                cur.execute("RELEASE SAVEPOINT migration")
+                logger.info(f"Migraatio {migration.version} ({migration.name}) ajettu.")
+                version = migration.version
+            except Exception as e:
+                cur.execute("ROLLBACK TO SAVEPOINT migration")
+                cur.execute("RELEASE SAVEPOINT migration")
+                logger.error(f"Virhe migraatiossa {migration.version} ({migration.name}): {e}")
+                break
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return version
+
+
+def run_migrations(db):
+    """
+    Ajaa puuttuvat migraatiot ja palauttaa skeeman version.
+
+    Migraatio, joka epäonnistuu (esim. taulut puuttuvat vielä), jätetään
+    kirjaamatta ja yritetään uudelleen seuraavalla kerralla.
+    """
+    with db.pool.connection() as conn:
+        cur = conn.cursor()
+        try:
+            version = _read_version(conn, cur)
+            if version is not None and version >= LATEST_VERSION:
+                logger.debug(f"Tietokannan skeema ajan tasalla (versio {version}).")
+                return version
+            if db.is_postgres:
+                return _run_postgres(db, conn, cur)
+            return _run_sqlite(db, conn, cur)
+        finally:
+            cur.close()
+
+
+# Kyselyt, joiden pitää käyttää indeksiä: nimi -> (taulu, kysely, esimerkkiparametrit)
+HOT_QUERIES = {
+    'attempt_count': (
+        'question_attempts',
+        "SELECT COUNT(*) FROM question_attempts WHERE user_id = ?", (1,)),
+    'recent_attempts': (
+        'question_attempts',
+        "SELECT correct FROM question_attempts WHERE user_id = ? ORDER BY timestamp DESC LIMIT 20", (1,)),
+    'accuracy_since': (
+        'question_attempts',
+        "SELECT AVG(CASE WHEN correct THEN 1.0 ELSE 0.0 END) FROM question_attempts "
+        "WHERE user_id = ? AND timestamp >= ?", (1, '2000-01-01')),
+    'attempts_for_question': (
+        'question_attempts',
+        "SELECT correct FROM question_attempts WHERE user_id = ? AND question_id = ?", (1, 1)),
+    'delete_question_attempts': (
+        'question_attempts',
+        "SELECT id FROM question_attempts WHERE question_id = ?", (1,)),
+    'progress_for_question': (
+        'user_question_progress',
+        "SELECT user_id FROM user_question_progress WHERE question_id = ?", (1,)),
+    'due_progress': (
+        'user_question_progress',
+        "SELECT question_id FROM user_question_progress WHERE user_id = ? AND next_review_at <= ? "
+        "ORDER BY next_review_at", (1, '2000-01-01')),
+    'questions_by_filters': (
+        'questions',
+        "SELECT id FROM questions WHERE category = ? AND difficulty = ?", ('a', 'helppo')),
+    'questions_by_difficulty': (
+        'questions',
+        "SELECT id FROM questions WHERE difficulty = ?", ('helppo',)),
+    'questions_by_status': (
+        'questions',
+        "SELECT * FROM questions WHERE status = ? ORDER BY category", ('needs_review',)),
+    'duplicate_check': (
+        'questions',
+        "SELECT id FROM questions WHERE question_normalized = ?", ('x',)),
+}
+
+
+def _plan_uses_index(db, plan, table_name):
+    """Päättelee EXPLAIN-tulosteesta, luetaanko taulu indeksin kautta."""
+    if db.is_postgres:
+        def walk(node):
+            if node.get('Relation Name') == table_name:
+                yield node['Node Type']
+            for child in node.get('Plans', []):
+                yield from walk(child)
+        node_types = list(walk(plan[0]['Plan']))
+        return bool(node_types) and all('Index' in node_type for node_type in node_types)
+
+    # SQLite: "SEARCH taulu USING INDEX ..." vs. "SCAN taulu" (koko taulu tai indeksi läpi)
+    details = [row[3] for row in plan if f" {table_name} " in f" {row[3]} "]
+    return bool(details) and all(detail.startswith('SEARCH') for detail in details)
+
+
+def explain_hot_queries(db, queries=None):
+    """
+    Ajaa EXPLAINin jokaiselle HOT_QUERIES-kyselylle.
+
+    Palauttaa {nimi: (käyttääkö indeksiä, suunnitelma)}. PostgreSQL valitsee
+    pienille tauluille aina seq scanin, joten siellä tarkistetaan, että
+    indeksiä *voidaan* käyttää (enable_seqscan = off).
+    """
+    results = {}
+    with db.pool.connection() as conn:
+        cur = conn.cursor()
+        try:
+            if db.is_postgres:
+                cur.execute("SET enable_seqscan = off")
+            for name, (table_name, query, params) in (queries or HOT_QUERIES).items():
+                if db.is_postgres:
+                    cur.execute("EXPLAIN (FORMAT JSON) " + query.replace('?', '%s'), params)
+                    plan = cur.fetchone()[0]
+                else:
+                    cur.execute("EXPLAIN QUERY PLAN " + query, params)
+                    plan = [tuple(row) for row in cur.fetchall()]
+                results[name] = (_plan_uses_index(db, plan, table_name), plan)
+        finally:
+            if db.is_postgres:
+                cur.execute("RESET enable_seqscan")
+            cur.close()
+    return results
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+# data_access/question_cache.py
+"""
+Prosessinsisäinen välimuisti kysymyspankille.
+
+Kysymyksiä on muutamasta sadasta muutamaan tuhanteen ja niitä muutetaan
+vain admin-näkymistä, joten jokainen worker pitää koko pankin muistissa
+valmiiksi jäsennettyinä Question-objekteina. Muutokset kasvattavat
+cache_versions-taulun versiolaskuria (samassa transaktiossa kuin itse
+muutos), ja workerit vertaavat omaa versiotaan siihen enintään
+QUESTION_CACHE_CHECK_INTERVAL sekunnin välein.
+"""
+import os
+import time
+import logging
+import threading
+from collections import defaultdict
+
+logger = logging.getLogger(__name__)
+
+CACHE_NAME = 'questions'
+
+# Näissä tiloissa olevat kysymykset näytetään harjoittelussa (ks. get_all_categories)
+PUBLISHED_STATUSES = ('approved', 'validated')
+
+
+class QuestionBankSnapshot:
+    """Yhden version kysymyspankki. Objekteja ei muuteta luonnin jälkeen."""
+
+    def __init__(self, version, questions):
+        self.version = version
+        self.by_id = {}
+        self.ids_by_category = defaultdict(list)
+        self.ids_by_difficulty = defaultdict(list)
+        self.ids_by_category_difficulty = defaultdict(list)
+        # Sama jako vain julkaistuille kysymyksille (ks. question_sampler.py)
+        self.published_ids_by_category_difficulty = defaultdict(list)
+
+        for question in questions:
+            self.by_id[question.id] = question
+            self.ids_by_category[question.category].append(question.id)
+            self.ids_by_difficulty[question.difficulty].append(question.id)
+            key = (question.category, question.difficulty)
+            self.ids_by_category_difficulty[key].append(question.id)
+            if question.status in PUBLISHED_STATUSES:
+                self.published_ids_by_category_difficulty[key].append(question.id)
+
+        self.ids = sorted(self.by_id)
+        self.categories = sorted(self.ids_by_category)
+        self.difficulties = sorted(self.ids_by_difficulty)
+
+    def category_counts(self, statuses=None):
+        """Kysymysmäärät kategorioittain, valinnaisesti vain annetuissa tiloissa."""
+        if statuses is None:
+            return {category: len(ids) for category, ids in self.ids_by_category.items()}
+        counts = defaultdict(int)
+        for question in self.by_id.values():
+            if question.status in statuses:
+                counts[question.category] += 1
+        return dict(counts)
+
+
+class QuestionBankCache:
+    """Säieturvallinen, versioitu välimuisti DatabaseManagerin kysymyksille."""
+
+    def __init__(self, db_manager, check_interval=None):
+        self.db_manager = db_manager
+        if check_interval is None:
+            check_interval = float(os.environ.get('QUESTION_CACHE_CHECK_INTERVAL', 2.0))
+        self.check_interval = check_interval
+
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._checked_at = 0.0
+        self._stats = {'hits': 0, 'reloads': 0, 'version_checks': 0, 'invalidations': 0}
+
+    def _read_version(self):
+        row = self.db_manager._execute(
+            "SELECT version FROM cache_versions WHERE name = ?", (CACHE_NAME,), fetch='one'
+        )
+        return row['version'] if row else 0
+
+    def _load(self, version):
+        rows = self.db_manager._execute("SELECT * FROM questions ORDER BY id", fetch='all') or []
+        questions = []
+        for row in rows:
+            try:
+                questions.append(self.db_manager._question_from_row(row))
+            except (ValueError, TypeError) as e:
+                logger.error(f"Virheellinen kysymys ID:llä {row['id']} ohitettiin välimuistissa: {e}")
+        return QuestionBankSnapshot(version, questions)
+
+    def snapshot(self):
+        """
+        Palauttaa ajantasaisen kysymyspankin.
+
+        Versio tarkistetaan enintään check_interval sekunnin välein; jos se on
+        muuttunut (tai välimuisti on tyhjä), pankki ladataan uudelleen.
+        """
+        now = time.monotonic()
+        snapshot = self._snapshot
+        if snapshot is not None and now - self._checked_at < self.check_interval:
+            self._stats['hits'] += 1
+            return snapshot
+
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is not None and now - self._checked_at < self.check_interval:
+                self._stats['hits'] += 1
+                return snapshot
+
+            self._stats['version_checks'] += 1
+            version = self._read_version()
+            if snapshot is None or snapshot.version != version:
+                # Versio luetaan ennen rivejä: samanaikainen muutos näkyy seuraavalla tarkistuksella
+                snapshot = self._load(version)
+                self._snapshot = snapshot
+                self._stats['reloads'] += 1
+                logger.info(f"Kysymysvälimuisti ladattu: {len(snapshot.by_id)} kysymystä (versio {version}).")
+            else:
+                self._stats['hits'] += 1
+            self._checked_at = time.monotonic()
+            return snapshot
+
+    def invalidate(self):
+        """
+        Kasvattaa versiolaskuria, jolloin kaikki workerit lataavat pankin
+        uudelleen. Kutsu kysymyksiä muuttavan kyselyn jälkeen samassa
+        transaktiossa (esim. pyynnön unit of work).
+        """
+        try:
+            self.db_manager._execute(
+                "UPDATE cache_versions SET version = version + 1 WHERE name = ?", (CACHE_NAME,)
+            )
+        except Exception as e:
+            logger.error(f"Virhe kysymysvälimuistin version päivityksessä: {e}")
+        with self._lock:
+            self._snapshot = None
+            self._stats['invalidations'] += 1
+
+    def stats(self):
+        snapshot = self._snapshot
+        stats = dict(self._stats)
+        stats.update({
+            'version': snapshot.version if snapshot else None,
+            'questions': len(snapshot.by_id) if snapshot else 0,
+            'check_interval': self.check_interval,
+        })
+        return stats
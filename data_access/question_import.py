@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+# data_access/question_import.py
+"""
+Kysymysten massatuonti JSON-tiedostosta erissä (/admin/bulk_upload).
+
+Tiedostoa ei lueta muistiin kerralla:
+
+1. iter_json_array() jäsentää taulukon alkio kerrallaan READ_SIZE tavun
+   paloista, joten muistissa on kerrallaan vain yksi pala ja yksi erä.
+2. validate_question() tarkistaa kentät; virheellinen kysymys ohitetaan
+   ja virhe raportoidaan (enintään MAX_REPORTED_ERRORS viestiä).
+3. QuestionImporter käsittelee IMPORT_CHUNK kysymyksen erän:
+   - tarkat duplikaatit yhdellä question_normalized IN (...) -kyselyllä,
+   - lähes samat (NEAR_DUPLICATE_THRESHOLD) yhdellä question_lsh-kyselyllä
+     (SimilarityIndex.near_duplicates),
+   - lisäys yhdellä monirivisellä INSERT ... RETURNING -lauseella ja
+     kaistat samoin (similarity_index).
+   Saman erän kopiot tunnistetaan muistissa; aiempien erien rivit näkyvät
+   kyselyille, koska kaikki erät ajetaan samassa transaktiossa.
+
+DatabaseManager.import_questions ajaa koko tuonnin yhdessä transaktiossa:
+tietokantavirhe perii kaikki erät. progress(käsitelty, tilastot)
+kutsutaan jokaisen erän jälkeen.
+"""
+import codecs
+import json
+import logging
+from collections import Counter, defaultdict
+from datetime import datetime
+
+from data_access.similarity import similarity
+from data_access.similarity_index import NEAR_DUPLICATE_THRESHOLD, min_shared_bands, question_buckets
+
+logger = logging.getLogger(__name__)
+
+# Kysymyksiä per erä (8 parametria per rivi monirivisessä INSERTissä)
+IMPORT_CHUNK = 200
+# Tiedostosta luetaan kerralla näin monta tavua
+READ_SIZE = 64 * 1024
+# Virheviestejä tallennetaan enintään näin monta (ohitetut lasketaan kaikki)
+MAX_REPORTED_ERRORS = 100
+
+_WHITESPACE = ' \t\n\r'
+_NUMBER_CHARS = '0123456789.eE+-'
+_REQUIRED_TEXT_FIELDS = ('question', 'explanation', 'category', 'difficulty')
+
+
+def iter_json_array(stream, read_size=READ_SIZE):
+    """
+    Palauttaa JSON-taulukon alkiot yksi kerrallaan binäärivirrasta (UTF-8, BOM sallittu).
+    Heittää ValueErrorin, jos juuri ei ole taulukko tai JSON on virheellinen.
+    """
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder('utf-8-sig')()
+    buffer, pos, eof = '', 0, False
+
+    def fill():
+        nonlocal buffer, pos, eof
+        data = stream.read(read_size)
+        eof = not data
+        buffer = buffer[pos:] + text_decoder.decode(data, final=eof)
+        pos = 0
+
+    def next_char():
+        """Seuraava ei-tyhjä merkki (siirtää pos:n sen kohdalle) tai '' tiedoston lopussa."""
+        nonlocal pos
+        while True:
+            while pos < len(buffer) and buffer[pos] in _WHITESPACE:
+                pos += 1
+            if pos < len(buffer) or eof:
+                return buffer[pos] if pos < len(buffer) else ''
+            fill()
+
+    fill()
+    if next_char() != '[':
+        raise ValueError('JSON-tiedoston tulee sisältää lista kysymyksiä.')
+    pos += 1
+    if next_char() == ']':
+        pos += 1
+        if next_char():
+            raise ValueError('Virheellinen JSON-tiedosto: taulukon perässä on ylimääräistä dataa')
+        return
+
+    while True:
+        if not next_char():
+            raise ValueError('Virheellinen JSON-tiedosto: taulukko päättyi kesken')
+        # Palan rajalle osunut luku ("1." + "5") jäsentyisi lyhyempänä: arvo hyväksytään
+        # vasta, kun sen perässä on merkki, joka ei voi jatkaa lukua
+        while True:
+            try:
+                value, end = decoder.raw_decode(buffer, pos)
+                if eof or (end < len(buffer) and buffer[end] not in _NUMBER_CHARS):
+                    break
+            except json.JSONDecodeError as e:
+                if eof:
+                    raise ValueError(f'Virheellinen JSON-tiedosto: {e.msg}') from e
+            fill()
+        pos = end
+        yield value
+
+        char = next_char()
+        if char == ']':
+            pos += 1
+            if next_char():
+                raise ValueError('Virheellinen JSON-tiedosto: taulukon perässä on ylimääräistä dataa')
+            return
+        if not char:
+            raise ValueError('Virheellinen JSON-tiedosto: taulukko päättyi kesken')
+        if char != ',':
+            raise ValueError('Virheellinen JSON-tiedosto: odotettiin "," tai "]"')
+        pos += 1
+
+
+def validate_question(data):
+    """Palauttaa virheviestin tai None, jos kysymyksen kentät kelpaavat lisättäviksi."""
+    if not isinstance(data, dict):
+        return 'kysymyksen tulee olla JSON-objekti'
+    for field in _REQUIRED_TEXT_FIELDS:
+        if not isinstance(data.get(field), str) or (field == 'question' and not data[field].strip()):
+            return f"kenttä '{field}' puuttuu tai ei ole tekstiä"
+    options = data.get('options')
+    if not isinstance(options, list) or len(options) < 2 or not all(isinstance(o, str) for o in options):
+        return "kentässä 'options' tulee olla vähintään kaksi tekstivaihtoehtoa"
+    correct = data.get('correct')
+    if isinstance(correct, bool) or not isinstance(correct, int) or not 0 <= correct < len(options):
+        return "kentän 'correct' tulee olla vaihtoehdon indeksi"
+    return None
+
+
+def _chunks(items, size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class QuestionImporter:
+    """Erissä tehtävä tuonti; kutsu transaktiossa (ks. DatabaseManager.import_questions)."""
+
+    def __init__(self, db_manager, chunk_size=IMPORT_CHUNK, threshold=NEAR_DUPLICATE_THRESHOLD):
+        self.db_manager = db_manager
+        self.chunk_size = max(1, chunk_size)
+        self.threshold = threshold
+        self.min_shared = min_shared_bands(threshold)
+        self.stats = {'added': 0, 'duplicates': 0, 'skipped': 0, 'errors': []}
+        self.processed = 0
+
+    def _skip(self, data, error):
+        self.stats['skipped'] += 1
+        if len(self.stats['errors']) < MAX_REPORTED_ERRORS:
+            text = data.get('question') if isinstance(data, dict) else None
+            label = text[:30] if isinstance(text, str) else 'N/A'
+            self.stats['errors'].append(f"Virhe kysymyksessä '{label}': {error}")
+
+    def run(self, questions, progress=None):
+        """Tuo iteroitavan kysymykset; palauttaa tilastot {'added', 'duplicates', 'skipped', 'errors'}."""
+        for chunk in _chunks(questions, self.chunk_size):
+            self._import_chunk(chunk)
+            self.processed += len(chunk)
+            if progress is not None:
+                progress(self.processed, self.stats)
+        return self.stats
+
+    def _import_chunk(self, chunk):
+        db = self.db_manager
+
+        # 1. Kentät ja saman erän tarkat kopiot
+        candidates, seen = [], set()
+        for data in chunk:
+            error = validate_question(data)
+            if error:
+                self._skip(data, error)
+                continue
+            normalized = db.normalize_question(data['question'])
+            if normalized in seen:
+                self.stats['duplicates'] += 1
+                continue
+            seen.add(normalized)
+            candidates.append((data, normalized))
+        if not candidates:
+            return
+
+        # 2. Kannan tarkat duplikaatit yhdellä kyselyllä
+        placeholders = ', '.join(['?'] * len(candidates))
+        existing = {
+            row['question_normalized'] for row in db._execute(
+                f"SELECT question_normalized FROM questions WHERE question_normalized IN ({placeholders})",
+                tuple(normalized for _data, normalized in candidates), fetch='all'
+            ) or []
+        }
+        self.stats['duplicates'] += sum(1 for _data, normalized in candidates if normalized in existing)
+        candidates = [(data, normalized) for data, normalized in candidates if normalized not in existing]
+        if not candidates:
+            return
+
+        # 3. Lähes samat: kanta yhdellä kyselyllä, saman erän aiemmat muistissa
+        texts = [data['question'] for data, _normalized in candidates]
+        buckets = [question_buckets(text) for text in texts]
+        matches = db.similarity_index.near_duplicates(texts, buckets, self.threshold, self.min_shared)
+        accepted, by_bucket = [], defaultdict(list)
+        for position, match in enumerate(matches):
+            if match is None and not self._duplicate_in_chunk(position, texts, buckets, by_bucket):
+                for bucket in buckets[position]:
+                    by_bucket[bucket].append(position)
+                accepted.append(position)
+        self.stats['duplicates'] += len(candidates) - len(accepted)
+        if not accepted:
+            return
+
+        # 4. Monirivinen INSERT ja kaistat
+        now = datetime.now()
+        rows = []
+        for position in accepted:
+            data, normalized = candidates[position]
+            rows.append((data['question'], normalized, data['explanation'], json.dumps(data['options']),
+                         data['correct'], data['category'], data['difficulty'], now))
+        query, params = db._multi_row_values(
+            "INSERT INTO questions (question, question_normalized, explanation, options, correct, category, "
+            "difficulty, created_at) VALUES {values} RETURNING id, question_normalized",
+            rows
+        )
+        ids = {row['question_normalized']: row['id'] for row in db._execute(query, params, fetch='all')}
+        db.similarity_index.add_buckets(
+            (ids[candidates[position][1]], buckets[position]) for position in accepted
+        )
+        self.stats['added'] += len(accepted)
+
+    def _duplicate_in_chunk(self, position, texts, buckets, by_bucket):
+        """Onko erässä aiemmin hyväksytty kysymys, joka on kynnystä samankaltaisempi."""
+        shared = Counter(other for bucket in buckets[position] for other in by_bucket.get(bucket, ()))
+        return any(
+            similarity(texts[other], texts[position], self.threshold) is not None
+            for other, hits in shared.items() if hits >= self.min_shared
+        )
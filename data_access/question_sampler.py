@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+# data_access/question_sampler.py
+"""
+Satunnaisten kysymysten arvonta ilman ORDER BY RANDOM() -kyselyä.
+
+Arvonta tehdään kysymysvälimuistin (question_cache.py) valmiista
+(kategoria, vaikeustaso) -> [id] -jaosta. Valitut lohkot käsitellään
+yhtenä virtuaalisena listana, josta arvotaan k eri indeksiä, joten työ
+on O(k) eikä koko suodatettua joukkoa järjestetä tai kopioida.
+
+Antamalla seed saadaan toistettava arvonta (esim. sama koe uudelleen).
+"""
+import random
+from bisect import bisect_right
+
+from data_access.question_cache import PUBLISHED_STATUSES
+
+_default_rng = random.Random()
+
+
+def make_rng(seed=None):
+    """Palauttaa siemennetyn generaattorin tai prosessin yhteisen generaattorin."""
+    return random.Random(seed) if seed is not None else _default_rng
+
+
+def _select_buckets(index, categories=None, difficulties=None):
+    categories = set(categories) if categories else None
+    difficulties = set(difficulties) if difficulties else None
+    # Lajiteltu järjestys: sama siemen antaa saman tuloksen joka workerissa
+    return [
+        index[key] for key in sorted(index)
+        if (categories is None or key[0] in categories)
+        and (difficulties is None or key[1] in difficulties)
+        and index[key]
+    ]
+
+
+def sample_question_ids(snapshot, count, categories=None, difficulties=None,
+                        exclude_ids=None, published_only=False, rng=None):
+    """
+    Arpoo enintään count eri kysymys-ID:tä annetuilla suodattimilla.
+
+    categories/difficulties: None tai tyhjä = kaikki.
+    published_only: vain approved/validated-tilaiset kysymykset.
+    """
+    rng = rng or _default_rng
+    index = snapshot.published_ids_by_category_difficulty if published_only else snapshot.ids_by_category_difficulty
+    buckets = _select_buckets(index, categories, difficulties)
+
+    # Kumulatiiviset koot: indeksi j kuuluu lohkoon bisect_right(ends, j)
+    ends = []
+    total = 0
+    for bucket in buckets:
+        total += len(bucket)
+        ends.append(total)
+
+    exclude = set(exclude_ids) if exclude_ids else set()
+    excluded_in_pool = 0
+    if exclude:
+        categories_set = set(categories) if categories else None
+        difficulties_set = set(difficulties) if difficulties else None
+        for question_id in exclude:
+            question = snapshot.by_id.get(question_id)
+            if question is None:
+                continue
+            in_pool = ((categories_set is None or question.category in categories_set)
+                       and (difficulties_set is None or question.difficulty in difficulties_set))
+            if in_pool and (not published_only or question.status in PUBLISHED_STATUSES):
+                excluded_in_pool += 1
+
+    available = total - excluded_in_pool
+    count = min(max(int(count), 0), available)
+    if count == 0:
+        return []
+
+    if 2 * count >= available or 2 * excluded_in_pool >= total:
+        # Tiheä arvonta: ehdokkaita on korkeintaan ~2k (tai poissulkuja paljon)
+        candidates = [qid for bucket in buckets for qid in bucket if qid not in exclude]
+        return rng.sample(candidates, count)
+
+    # Harva arvonta: hylkäysotanta, hyväksymistodennäköisyys > 1/2 joka kierroksella
+    seen = set()
+    result = []
+    while len(result) < count:
+        j = rng.randrange(total)
+        if j in seen:
+            continue
+        seen.add(j)
+        b = bisect_right(ends, j)
+        question_id = buckets[b][j - (ends[b - 1] if b else 0)]
+        if question_id in exclude:
+            continue
+        result.append(question_id)
+    return result
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+# data_access/rate_limit_storage.py
+"""
+Flask-Limiterin laskurit SQLite-tiedostossa.
+
+memory://-tallennuksessa jokaisella gunicorn-workerilla on omat laskurinsa,
+joten "100 per minute" on käytännössä workers × 100, ja laskurit nollautuvat
+uudelleenkäynnistyksessä. Tämä tallennus pitää laskurit yhdessä
+SQLite-tiedostossa, jota kaikki saman koneen workerit käyttävät ilman
+erillistä palvelua (Redis tms.).
+
+Rekisteröi limits-kirjastoon skeeman sqlite://, joten käyttöönotto on
+    Limiter(..., storage_uri="sqlite:////polku/rate_limits.db")
+Moduuli on tuotava ennen Limiterin luontia. Tukee kiinteän ikkunan
+strategiaa (Flask-Limiterin oletus).
+
+Yksi osuma on yksi UPSERT ... RETURNING -lause säiekohtaisella
+yhteydellä (WAL, synchronous=OFF), joten pyyntö ei odota levyä.
+synchronous=OFF voi käyttöjärjestelmän kaatuessa hukata viimeisimmät
+osumat, mikä laskureille riittää. Vanhentuneet rivit poistetaan
+CLEANUP_EVERY osuman välein.
+"""
+import os
+import time
+import sqlite3
+import logging
+import threading
+
+from limits.storage import Storage
+
+logger = logging.getLogger(__name__)
+
+# Vanhentuneet laskurit poistetaan näin monen osuman välein (per prosessi)
+CLEANUP_EVERY = 1000
+# Millisekuntia odotetaan toisen workerin kirjoituslukkoa
+BUSY_TIMEOUT_MS = 5000
+
+_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS rate_limits (
+        key TEXT PRIMARY KEY,
+        count INTEGER NOT NULL,
+        expires_at REAL NOT NULL
+    ) WITHOUT ROWID
+"""
+
+# Vanhentunut ikkuna aloitetaan alusta, muuten laskuria kasvatetaan.
+# Parametrit: (key, amount, expires_at, now, amount, now, expires_at)
+_INCR = """
+    INSERT INTO rate_limits (key, count, expires_at) VALUES (?, ?, ?)
+    ON CONFLICT (key) DO UPDATE SET
+        count = CASE WHEN expires_at <= ? THEN ? ELSE count + excluded.count END,
+        expires_at = CASE WHEN expires_at <= ? THEN ? ELSE expires_at END
+    RETURNING count
+"""
+
+
+def default_rate_limit_uri():
+    """RATELIMIT_STORAGE_URI tai sqlite-tiedosto järjestelmän tmp-hakemistossa."""
+    uri = os.environ.get('RATELIMIT_STORAGE_URI')
+    if uri:
+        return uri
+    import tempfile
+    return 'sqlite:///' + os.path.join(tempfile.gettempdir(), 'love_rate_limits.db')
+
+
+class SQLiteRateLimitStorage(Storage):
+    """limits-tallennus, jonka laskurit ovat kaikille workereille yhteisessä SQLite-tiedostossa."""
+
+    STORAGE_SCHEME = ['sqlite']
+
+    def __init__(self, uri=None, wrap_exceptions=False, **options):
+        # sqlite:////abs/polku.db tai sqlite:///suhteellinen.db kuten SQLAlchemyssä
+        self.path = uri[len('sqlite:///'):] if uri else ':memory:'
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._hits = 0
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+
+    @property
+    def base_exceptions(self):
+        return sqlite3.Error
+
+    def _connection(self):
+        """Säiekohtainen yhteys; forkin jälkeen avataan uusi."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT_MS / 1000, isolation_level=None,
+                               check_same_thread=False)
+        conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = OFF")
+        conn.execute(_SCHEMA)
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def _maybe_cleanup(self, conn, now):
+        with self._lock:
+            self._hits += 1
+            if self._hits % CLEANUP_EVERY:
+                return
+        try:
+            conn.execute("DELETE FROM rate_limits WHERE expires_at <= ?", (now,))
+        except sqlite3.Error as e:
+            logger.error(f"Virhe vanhentuneiden rate limit -laskurien poistossa: {e}")
+
+    def incr(self, key, expiry, elastic_expiry=False, amount=1):
+        """Kasvattaa laskuria ja palauttaa uuden arvon (ikkuna alkaa ensimmäisestä osumasta)."""
+        conn = self._connection()
+        now = time.time()
+        expires_at = now + expiry
+        if elastic_expiry:
+            row = conn.execute(
+                "INSERT INTO rate_limits (key, count, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET "
+                "count = CASE WHEN expires_at <= ? THEN ? ELSE count + excluded.count END, "
+                "expires_at = excluded.expires_at RETURNING count",
+                (key, amount, expires_at, now, amount)
+            ).fetchone()
+        else:
+            row = conn.execute(_INCR, (key, amount, expires_at, now, amount, now, expires_at)).fetchone()
+        self._maybe_cleanup(conn, now)
+        return row[0]
+
+    def get(self, key):
+        row = self._connection().execute(
+            "SELECT count FROM rate_limits WHERE key = ? AND expires_at > ?", (key, time.time())
+        ).fetchone()
+        return row[0] if row else 0
+
+    def get_expiry(self, key):
+        row = self._connection().execute(
+            "SELECT expires_at FROM rate_limits WHERE key = ?", (key,)
+        ).fetchone()
+        return row[0] if row else time.time()
+
+    def check(self):
+        try:
+            self._connection().execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def reset(self):
+        return self._connection().execute("DELETE FROM rate_limits").rowcount
+
+    def clear(self, key):
+        self._connection().execute("DELETE FROM rate_limits WHERE key = ?", (key,))
@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+# data_access/similarity.py
+"""
+Lähes samojen kysymysten haku ilman kaikkien parien vertailua.
+
+Samankaltaisuus on sama kuin ennen: SequenceMatcher(None, a, b).ratio()
+pienillä kirjaimilla, a = pienemmän ID:n kysymys (asteikko 0-100 %
+admin_duplicates.html:ssä). Vain ehdokasparit pisteytetään:
+
+1. Jokainen kysymys pilkotaan merkkikolmikoiksi (3-gram shingles).
+2. Kynnysarvosta johdetaan Jaccard-alaraja candidate_jaccard(threshold).
+3. Kolmikkojoukoista lasketaan MinHash-allekirjoitus (NUM_PERM lokeroa),
+   joka jaetaan LSH-kaistoihin. Parit, joilla jokin kaista on sama,
+   ovat ehdokkaita; kaistan leveys valitaan niin, että Jaccard-rajan
+   ylittävä pari löytyy vähintään LSH_RECALL todennäköisyydellä.
+   Työ kasvaa lähes lineaarisesti pankin koon mukaan.
+4. Ehdokkaan tarkka Jaccard tarkistetaan, ja lopuksi pari pisteytetään
+   SequenceMatcherilla (real_quick_ratio ja quick_ratio karsivat ensin).
+
+Jaccard-raja on kokeellinen: Kysymykset/-pankkien kaikista pareista
+(ratio >= kynnys) pienin Jaccard oli 0.78 (95 %), 0.58 (90 %) ja
+0.40 (80 %), ja raja (1 - 3(1 - t))^2 jää niiden alle marginaalilla.
+Kun raja on alle MIN_LSH_JACCARD (kynnys alle noin 85 %), LSH ei enää
+karsi, ja verrataan kaikki parit kuten ennen. LSH on todennäköisyyspohjainen:
+rajan tuntumassa oleva pari voi jäädä löytymättä (enintään 1 - LSH_RECALL),
+selvät duplikaatit (Jaccard lähellä 1) löytyvät käytännössä aina.
+benchmarks/bench_duplicates.py mittaa osumatarkkuuden täyteen vertailuun nähden.
+"""
+import random
+import zlib
+from collections import defaultdict
+from difflib import SequenceMatcher
+
+SHINGLE_SIZE = 3
+NUM_PERM = 64
+# Todennäköisyys, jolla Jaccard-rajalla oleva pari päätyy ehdokkaaksi
+LSH_RECALL = 0.99
+# Tätä pienemmillä Jaccard-rajoilla verrataan kaikki parit
+MIN_LSH_JACCARD = 0.3
+
+_MERSENNE_PRIME = (1 << 61) - 1
+
+
+def normalize(text):
+    """Pienet kirjaimet ja yhtenäiset välilyönnit (kolmikoita varten)."""
+    return ' '.join((text or '').lower().split())
+
+
+def shingles(text):
+    """Tekstin merkkikolmikot joukkona; lyhyt teksti on yksi kolmikko."""
+    text = normalize(text)
+    if len(text) <= SHINGLE_SIZE:
+        return {text}
+    return {text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+
+
+def candidate_jaccard(threshold):
+    """Jaccard-alaraja, jonka alle jäävät parit eivät (käytännössä) ylitä kynnystä."""
+    return max(0.0, 1.0 - 3.0 * (1.0 - threshold)) ** 2
+
+
+def jaccard(tokens1, tokens2):
+    common = len(tokens1 & tokens2)
+    return common / (len(tokens1) + len(tokens2) - common)
+
+
+def lsh_bands(min_jaccard, num_perm=NUM_PERM):
+    """
+    Palauttaa (kaistoja, rivejä kaistassa): kapein mahdollinen kaista, jolla
+    min_jaccard-parin todennäköisyys 1 - (1 - j^r)^b on vähintään LSH_RECALL.
+    """
+    for rows in range(num_perm, 0, -1):
+        bands = num_perm // rows
+        if 1.0 - (1.0 - min_jaccard ** rows) ** bands >= LSH_RECALL:
+            return bands, rows
+    return num_perm, 1
+
+
+def similarity(text1, text2, threshold=0.0):
+    """SequenceMatcher-ratio pienillä kirjaimilla tai None, jos ylärajat jäävät alle kynnyksen."""
+    matcher = SequenceMatcher(None, text1.lower(), text2.lower())
+    if matcher.real_quick_ratio() < threshold or matcher.quick_ratio() < threshold:
+        return None
+    ratio = matcher.ratio()
+    return ratio if ratio >= threshold else None
+
+
+class MinHasher:
+    """
+    MinHash-allekirjoitukset kolmikkojoukoille yhdellä hajautuksella
+    (one permutation hashing): kolmikon hajautusarvo valitsee lokeron ja
+    lokeroon jää pienin arvo. Tyhjät lokerot täytetään seuraavasta
+    ei-tyhjästä lokerosta (rotation densification), jotta lyhyetkin
+    kysymykset saavat täyden allekirjoituksen. Allekirjoitus maksaa yhden
+    kierroksen kolmikoiden yli NUM_PERM hajautuksen sijaan.
+    """
+
+    def __init__(self, num_perm=NUM_PERM, seed=1):
+        rng = random.Random(seed)
+        self.num_perm = num_perm
+        self._a = rng.randrange(1, _MERSENNE_PRIME)
+        self._b = rng.randrange(_MERSENNE_PRIME)
+        # Täytetyt arvot erotetaan aidoista lisäämällä etäisyys * _offset
+        self._offset = _MERSENNE_PRIME // num_perm + 1
+        self._hashes = {}
+
+    def _hash(self, token):
+        """(lokero, arvo) kolmikolle; lasketaan kerran per kolmikko."""
+        cached = self._hashes.get(token)
+        if cached is None:
+            value = (self._a * zlib.crc32(token.encode('utf-8')) + self._b) % _MERSENNE_PRIME
+            cached = self._hashes[token] = divmod(value, self.num_perm)[::-1]
+        return cached
+
+    def signature(self, tokens):
+        num_perm = self.num_perm
+        values = [None] * num_perm
+        for bin_, value in map(self._hash, tokens):
+            current = values[bin_]
+            if current is None or value < current:
+                values[bin_] = value
+        # Tyhjä lokero saa seuraavan (kehällä oikealle) ei-tyhjän lokeron arvon + etäisyys * _offset
+        filled = list(values)
+        following, position = None, None
+        for i in range(2 * num_perm - 1, -1, -1):
+            value = values[i % num_perm]
+            if value is not None:
+                following, position = value, i
+            elif i < num_perm and following is not None:
+                filled[i] = following + (position - i) * self._offset
+        return tuple(filled)
+
+
+def _candidate_pairs(shingle_sets, min_jaccard, hasher=None):
+    """Indeksiparit (i, j), i < j, joiden Jaccard >= min_jaccard (LSH:llä todennäköisesti kaikki)."""
+    count = len(shingle_sets)
+    if min_jaccard < MIN_LSH_JACCARD:
+        for i in range(count):
+            for j in range(i + 1, count):
+                yield i, j
+        return
+
+    hasher = hasher or MinHasher()
+    bands, rows = lsh_bands(min_jaccard, hasher.num_perm)
+    buckets = [defaultdict(list) for _ in range(bands)]
+    for i, tokens in enumerate(shingle_sets):
+        signature = hasher.signature(tokens)
+        # Kaistan lokerot lomitetaan: vierekkäiset tyhjät lokerot saavat saman täyttöarvon
+        for band, bucket in enumerate(buckets):
+            bucket[signature[band:bands * rows:bands]].append(i)
+
+    seen = set()
+    for bucket in buckets:
+        for members in bucket.values():
+            for a, i in enumerate(members):
+                for j in members[a + 1:]:
+                    if (i, j) in seen:
+                        continue
+                    seen.add((i, j))
+                    if jaccard(shingle_sets[i], shingle_sets[j]) >= min_jaccard:
+                        yield i, j
+
+
+def find_similar_pairs(questions, threshold):
+    """
+    Palauttaa samankaltaiset parit (id1 < id2) kuten DatabaseManager.find_similar_questions.
+
+    questions: rivit/sanakirjat, joissa id, question ja category.
+    """
+    questions = sorted(questions, key=lambda q: q['id'])
+    shingle_sets = [shingles(q['question']) for q in questions]
+    pairs = []
+    for i, j in _candidate_pairs(shingle_sets, candidate_jaccard(threshold)):
+        q1, q2 = questions[i], questions[j]
+        ratio = similarity(q1['question'], q2['question'], threshold)
+        if ratio is not None:
+            pairs.append({
+                'id1': q1['id'],
+                'question1': q1['question'],
+                'category1': q1['category'],
+                'id2': q2['id'],
+                'question2': q2['question'],
+                'category2': q2['category'],
+                'similarity': round(ratio * 100, 1)
+            })
+    pairs.sort(key=lambda pair: (pair['id1'], pair['id2']))
+    return pairs
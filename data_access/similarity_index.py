@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+# data_access/similarity_index.py
+"""
+Pysyvä samankaltaisuusindeksi kysymyksille (taulu question_lsh).
+
+Jokaisen kysymyksen MinHash-allekirjoitus (ks. similarity.py) tallennetaan
+INDEX_BANDS LSH-kaistana: yksi rivi (question_id, band, bucket) per kaista.
+bucket on kaistan arvojen 63-bittinen tiiviste, johon kaistan numero on
+sekoitettu, joten haku on yksi indeksoitu bucket IN (...) -kysely.
+
+- similar_to(teksti, k): uuden kysymyksen k samankaltaisinta olemassa
+  olevaa. Ehdokkaat ovat kysymykset, joilla on eniten yhteisiä kaistoja;
+  ne pisteytetään SequenceMatcherilla (sama asteikko kuin duplikaattihaussa).
+
+Indeksi rakennetaan kerran migraatiossa 9 ja päivitetään kysymystä
+lisättäessä, muokattaessa ja poistettaessa. index_missing() lisää
+kysymykset, jotka on lisätty indeksin ohi (esim. skripteillä).
+
+Kaistat on mitoitettu INDEX_THRESHOLD-kynnykselle, joten kapeat kaistat
+tuottavat paljon ehdokkaita: koko pankin parihaku (find_similar_questions)
+laskee kaistat muistissa pyydetylle kynnykselle, mikä on taulun
+itseliitosta selvästi nopeampaa.
+"""
+import logging
+from collections import defaultdict
+from math import comb
+
+from data_access.similarity import (
+    MinHasher, candidate_jaccard, lsh_bands, shingles, similarity, LSH_RECALL, NUM_PERM,
+)
+
+logger = logging.getLogger(__name__)
+
+# Pienin kynnys, jolle indeksin kaistat on mitoitettu (32 kaistaa × 2 riviä)
+INDEX_THRESHOLD = 0.9
+INDEX_BANDS, INDEX_ROWS = lsh_bands(candidate_jaccard(INDEX_THRESHOLD), NUM_PERM)
+# Lisäyslomake ja massalataus hylkäävät tätä samankaltaisemmat kysymykset
+NEAR_DUPLICATE_THRESHOLD = 0.95
+# similar_to pisteyttää enintään näin monta eniten kaistoja jakavaa ehdokasta
+CANDIDATE_LIMIT = 50
+# Rivejä per monirivinen INSERT (INDEX_BANDS riviä per kysymys)
+INSERT_CHUNK = 500
+
+_MASK63 = (1 << 63) - 1
+_hasher = MinHasher()
+
+
+def question_buckets(text):
+    """INDEX_BANDS kaistatiivistettä kysymystekstille (sama kaikissa prosesseissa)."""
+    signature = _hasher.signature(shingles(text))
+    buckets = []
+    for band in range(INDEX_BANDS):
+        value = band + 1
+        for part in signature[band:INDEX_BANDS * INDEX_ROWS:INDEX_BANDS]:
+            value = ((value * 1000003) ^ part) & _MASK63
+        buckets.append(value)
+    return buckets
+
+
+def min_shared_bands(threshold):
+    """
+    Pienin yhteisten kaistojen määrä, joka vaaditaan ehdokkaalta: kynnyksen
+    ylittävä pari (Jaccard >= candidate_jaccard) jakaa vähintään näin monta
+    kaistaa LSH_RECALL todennäköisyydellä (binomijakauma, 95 %:lle 10/32).
+    """
+    p = candidate_jaccard(threshold) ** INDEX_ROWS
+    below = 0.0
+    for hits in range(INDEX_BANDS + 1):
+        below += comb(INDEX_BANDS, hits) * p ** hits * (1 - p) ** (INDEX_BANDS - hits)
+        if below > 1 - LSH_RECALL:
+            return max(1, hits)
+    return 1
+
+
+def bucket_rows(questions):
+    """(question_id, band, bucket) -rivit (id, teksti) -pareille."""
+    return [
+        (question_id, band, bucket)
+        for question_id, text in questions
+        for band, bucket in enumerate(question_buckets(text))
+    ]
+
+
+class SimilarityIndex:
+    """question_lsh-taulun ylläpito ja haut DatabaseManagerin kautta."""
+
+    def __init__(self, db_manager):
+        self.db_manager = db_manager
+
+    def _insert(self, rows):
+        db = self.db_manager
+        for start in range(0, len(rows), INSERT_CHUNK):
+            db._execute(*db._multi_row_values(
+                "INSERT INTO question_lsh (question_id, band, bucket) VALUES {values}",
+                rows[start:start + INSERT_CHUNK]
+            ))
+
+    def index_questions(self, questions):
+        """Indeksoi (id, teksti) -parit; aiemmat rivit korvataan (muokattu kysymys)."""
+        questions = list(questions)
+        if not questions:
+            return
+        with self.db_manager.transaction():
+            self.remove([question_id for question_id, _text in questions])
+            self._insert(bucket_rows(questions))
+
+    def add_buckets(self, questions):
+        """Lisää valmiiksi lasketut kaistat (id, question_buckets(teksti)) -pareille; uusille kysymyksille."""
+        self._insert([
+            (question_id, band, bucket)
+            for question_id, buckets in questions
+            for band, bucket in enumerate(buckets)
+        ])
+
+    def index_missing(self):
+        """Indeksoi kysymykset, joilla ei ole rivejä (lisätty indeksin ohi). Palauttaa määrän."""
+        rows = self.db_manager._execute(
+            "SELECT id, question FROM questions q "
+            "WHERE NOT EXISTS (SELECT 1 FROM question_lsh l WHERE l.question_id = q.id)",
+            fetch='all'
+        ) or []
+        self.index_questions((row['id'], row['question']) for row in rows)
+        return len(rows)
+
+    def remove(self, question_ids):
+        question_ids = [int(question_id) for question_id in question_ids]
+        if not question_ids:
+            return
+        placeholders = ', '.join(['?'] * len(question_ids))
+        self.db_manager._execute(
+            f"DELETE FROM question_lsh WHERE question_id IN ({placeholders})", tuple(question_ids)
+        )
+
+    def clear(self):
+        self.db_manager._execute("DELETE FROM question_lsh")
+
+    def rebuild(self):
+        """Rakentaa koko indeksin uudelleen (esim. kaistojen mitoituksen muuttuessa)."""
+        with self.db_manager.transaction():
+            self.clear()
+            return self.index_missing()
+
+    def similar_to(self, text, k=5, min_similarity=0.0, exclude_id=None):
+        """
+        Palauttaa enintään k samankaltaisinta kysymystä laskevassa järjestyksessä:
+        [{'id', 'question', 'category', 'similarity' (0-100)}].
+        """
+        buckets = question_buckets(text)
+        placeholders = ', '.join(['?'] * len(buckets))
+        candidates = self.db_manager._execute(
+            f"""SELECT l.question_id, COUNT(*) AS hits, q.question, q.category
+                FROM question_lsh l JOIN questions q ON q.id = l.question_id
+                WHERE l.bucket IN ({placeholders})
+                GROUP BY l.question_id, q.question, q.category
+                ORDER BY hits DESC, l.question_id
+                LIMIT ?""",
+            (*buckets, CANDIDATE_LIMIT + (1 if exclude_id is not None else 0)),
+            fetch='all'
+        ) or []
+
+        results = []
+        for row in candidates:
+            if exclude_id is not None and row['question_id'] == int(exclude_id):
+                continue
+            ratio = similarity(row['question'], text, min_similarity)
+            if ratio is not None:
+                results.append({
+                    'id': row['question_id'],
+                    'question': row['question'],
+                    'category': row['category'],
+                    'similarity': round(ratio * 100, 1)
+                })
+        results.sort(key=lambda result: (-result['similarity'], result['id']))
+        return results[:k]
+
+    def near_duplicates(self, texts, buckets, threshold, min_shared=None):
+        """
+        Samankaltaisin kannan kysymys jokaiselle tekstille tai None, jos mikään ei
+        ylitä kynnystä. buckets: question_buckets(teksti) per teksti. Ehdokkaat
+        (vähintään min_shared yhteistä kaistaa) haetaan kaikille teksteille
+        yhdellä kyselyllä ja niiden tekstit toisella.
+        """
+        if not texts:
+            return []
+        if min_shared is None:
+            min_shared = min_shared_bands(threshold)
+        db = self.db_manager
+        probe = [(position, bucket) for position, text_buckets in enumerate(buckets) for bucket in text_buckets]
+        query, params = db._multi_row_values(
+            "WITH probe (pos, bucket) AS (VALUES {values}) "
+            "SELECT p.pos, l.question_id, COUNT(*) AS hits "
+            "FROM probe p JOIN question_lsh l ON l.bucket = p.bucket "
+            "GROUP BY p.pos, l.question_id HAVING COUNT(*) >= ?",
+            probe
+        )
+        hits = db._execute(query, params + (min_shared,), fetch='all') or []
+        if not hits:
+            return [None] * len(texts)
+
+        by_position = defaultdict(list)
+        for row in hits:
+            by_position[row['pos']].append((row['hits'], row['question_id']))
+        question_ids = sorted({row['question_id'] for row in hits})
+        placeholders = ', '.join(['?'] * len(question_ids))
+        questions = {
+            row['id']: row for row in db._execute(
+                f"SELECT id, question, category FROM questions WHERE id IN ({placeholders})",
+                tuple(question_ids), fetch='all'
+            ) or []
+        }
+
+        results = []
+        for position, text in enumerate(texts):
+            best = None
+            candidates = sorted(by_position.get(position, ()), key=lambda hit: (-hit[0], hit[1]))
+            for _hits, question_id in candidates[:CANDIDATE_LIMIT]:
+                row = questions.get(question_id)
+                ratio = similarity(row['question'], text, threshold) if row else None
+                if ratio is not None and (best is None or ratio * 100 > best['similarity']):
+                    best = {'id': question_id, 'question': row['question'], 'category': row['category'],
+                            'similarity': round(ratio * 100, 1)}
+            results.append(best)
+        return results
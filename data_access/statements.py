@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+# data_access/statements.py
+"""
+Nimetyt SQL-lauseet ja niiden rekisteri.
+
+Kuumien polkujen kyselyt kirjoitetaan tänne kerran. StatementRegistry
+kääntää ne käynnistyksessä valmiiksi kannan murteelle, joten
+DatabaseManager.execute_named() tekee kutsuttaessa vain sanakirjahaun.
+PostgreSQL:ssä lauseet valmistellaan (PREPARE) yhteyskohtaisesti
+ensimmäisellä käyttökerralla, jolloin palvelin ei suunnittele niitä
+joka kutsulla uudelleen.
+
+Lause on joko murteesta riippumaton merkkijono (?-parametrit) tai
+sanakirja {'sqlite': ..., 'postgres': ...}.
+"""
+import os
+import itertools
+import threading
+import weakref
+
+# Seuraava kertaus = viimeisin näyttö + interval päivää (next_review_at, ks. migraatio 7)
+_NEXT_REVIEW = {
+    'sqlite': "datetime({last_shown}, '+' || {interval} || ' days')",
+    'postgres': "{last_shown} + {interval} * INTERVAL '1 day'",
+}
+
+
+def next_review_sql(dialect, last_shown, interval):
+    """SQL-lauseke, joka laskee next_review_at-arvon annetuista sarakkeista/lausekkeista."""
+    return _NEXT_REVIEW[dialect].format(last_shown=last_shown, interval=interval)
+
+
+def _by_dialect(build):
+    return {dialect: build(dialect) for dialect in _NEXT_REVIEW}
+
+
+# SR-arvot säilyvät, joten seuraava kertaus lasketaan rivin nykyisestä intervallista
+_PROGRESS_UPSERT = _by_dialect(lambda d: f"""
+    INSERT INTO user_question_progress (user_id, question_id, times_shown, times_correct, last_shown, next_review_at)
+    VALUES (?, ?, 1, ?, ?, ?)
+    ON CONFLICT (user_id, question_id) DO UPDATE SET
+        times_shown = user_question_progress.times_shown + 1,
+        times_correct = user_question_progress.times_correct + EXCLUDED.times_correct,
+        last_shown = EXCLUDED.last_shown,
+        next_review_at = {next_review_sql(d, 'EXCLUDED.last_shown', 'COALESCE(user_question_progress.interval, 1)')}
+""")
+
+_PROGRESS_UPSERT_SR = """
+    INSERT INTO user_question_progress
+        (user_id, question_id, times_shown, times_correct, last_shown, interval, ease_factor, next_review_at)
+    VALUES (?, ?, 1, ?, ?, ?, ?, ?)
+    ON CONFLICT (user_id, question_id) DO UPDATE SET
+        times_shown = user_question_progress.times_shown + 1,
+        times_correct = user_question_progress.times_correct + EXCLUDED.times_correct,
+        last_shown = EXCLUDED.last_shown,
+        interval = EXCLUDED.interval,
+        ease_factor = EXCLUDED.ease_factor,
+        next_review_at = EXCLUDED.next_review_at
+"""
+
+_ATTEMPT_INSERT = """
+    INSERT INTO question_attempts (user_id, question_id, correct, time_taken, timestamp)
+    VALUES (?, ?, ?, ?, ?)
+"""
+
+STATEMENTS = {
+    # --- Vastausten tallennus (record_answer) ---
+    'progress_upsert': _PROGRESS_UPSERT,
+    'progress_upsert_sr': _PROGRESS_UPSERT_SR,
+    'attempt_insert': _ATTEMPT_INSERT,
+    # PostgreSQL: datan muokkaava CTE suoritetaan aina, vaikka sen tulosta ei lueta
+    'answer_cte': {'postgres': f"WITH progress AS ({_PROGRESS_UPSERT['postgres']}) {_ATTEMPT_INSERT}"},
+    'answer_cte_sr': {'postgres': f"WITH progress AS ({_PROGRESS_UPSERT_SR}) {_ATTEMPT_INSERT}"},
+
+    # --- Kysymykset ---
+    'question_with_progress': """
+        SELECT q.*,
+               COALESCE(p.times_shown, 0) as times_shown,
+               COALESCE(p.times_correct, 0) as times_correct,
+               p.last_shown,
+               COALESCE(p.ease_factor, 2.5) as ease_factor,
+               COALESCE(p.interval, 1) as interval
+        FROM questions q
+        LEFT JOIN user_question_progress p ON q.id = p.question_id AND p.user_id = ?
+        WHERE q.id = ?
+    """,
+
+    'question_progress': """
+        SELECT times_shown, times_correct, last_shown, ease_factor, interval
+        FROM user_question_progress
+        WHERE user_id = ? AND question_id = ?
+    """,
+
+    # --- Spaced repetition ---
+    # Erääntyneet: indeksi (user_id, next_review_at), ks. migraatio 7
+    'due_questions': """
+        SELECT
+            q.*,
+            p.times_shown, p.times_correct, p.last_shown, p.ease_factor, p.interval
+        FROM user_question_progress p
+        JOIN questions q ON q.id = p.question_id
+        WHERE p.user_id = ? AND p.next_review_at <= ?
+        ORDER BY p.next_review_at ASC
+        LIMIT ?
+    """,
+    'due_count': """
+        SELECT COUNT(*) as count
+        FROM user_question_progress
+        WHERE user_id = ? AND next_review_at <= ?
+    """,
+    # Nyt / tämän päivän loppuun / viikon loppuun erääntyvät yhdellä indeksin välihaulla
+    'due_counts': """
+        SELECT
+            SUM(CASE WHEN next_review_at <= ? THEN 1 ELSE 0 END) as due_now,
+            SUM(CASE WHEN next_review_at < ? THEN 1 ELSE 0 END) as due_today,
+            COUNT(*) as due_week
+        FROM user_question_progress
+        WHERE user_id = ? AND next_review_at < ?
+    """,
+    'record_review': _by_dialect(lambda d: f"""
+        UPDATE user_question_progress
+        SET interval = ?, ease_factor = ?,
+            next_review_at = {next_review_sql(d, 'last_shown', 'CAST(? AS INTEGER)')}
+        WHERE user_id = ? AND question_id = ?
+    """),
+
+    # --- Saavutukset (ks. logic/achievement_manager.py) ---
+    # correct_run: jos kaikki uudet vastaukset oikein, putki jatkuu, muuten se on
+    # viimeisten oikeiden määrä. day_streak: sama päivä / eilinen / katkennut.
+    'achievement_counters_bump': """
+        UPDATE user_achievement_counters SET
+            total_attempts = total_attempts + ?,
+            fast_answers = fast_answers + ?,
+            speed_answers = speed_answers + ?,
+            early_answers = early_answers + ?,
+            late_answers = late_answers + ?,
+            correct_run = CASE WHEN ? THEN correct_run + ? ELSE ? END,
+            day_streak = CASE
+                WHEN last_practice_date = ? THEN day_streak
+                WHEN last_practice_date = ? THEN day_streak + 1
+                ELSE 1
+            END,
+            last_practice_date = ?,
+            updated_at = ?
+        WHERE user_id = ?
+        RETURNING total_attempts, fast_answers, speed_answers, early_answers, late_answers,
+                  correct_run, day_streak, unlocked
+    """,
+
+    # --- Käyttäjät ---
+    'load_user': """
+        SELECT id, username, email, role, distractors_enabled, distractor_probability, expires_at
+        FROM users WHERE id = ?
+    """,
+
+    # --- Tilastot ---
+    'accuracy_since': """
+        SELECT AVG(CASE WHEN correct THEN 1.0 ELSE 0.0 END) as avg_rate
+        FROM question_attempts
+        WHERE user_id = ? AND timestamp >= ?
+    """,
+    'accuracy_between': """
+        SELECT AVG(CASE WHEN correct THEN 1.0 ELSE 0.0 END) as avg_rate
+        FROM question_attempts
+        WHERE user_id = ? AND timestamp >= ? AND timestamp < ?
+    """,
+}
+
+
+class Statement:
+    """Yhdelle murteelle käännetty nimetty lause."""
+
+    __slots__ = ('name', 'sql', 'prepare_body', 'param_count')
+
+    def __init__(self, name, sql, prepare_body=None, param_count=0):
+        self.name = name
+        self.sql = sql
+        self.prepare_body = prepare_body
+        self.param_count = param_count
+
+
+class StatementRegistry:
+    """Kääntää STATEMENTS-lauseet kerran ja pitää kirjaa valmistelluista lauseista."""
+
+    def __init__(self, is_postgres, statements=None, prepare=None):
+        self.is_postgres = is_postgres
+        dialect = 'postgres' if is_postgres else 'sqlite'
+        if prepare is None:
+            prepare = os.environ.get('DB_PREPARED_STATEMENTS', '1') != '0'
+        # PgBouncerin transaktiotilassa valmistellut lauseet eivät toimi: DB_PREPARED_STATEMENTS=0
+        self.prepare = is_postgres and prepare
+
+        self._statements = {}
+        for name, sql in (statements or STATEMENTS).items():
+            if isinstance(sql, dict):
+                sql = sql.get(dialect)
+                if sql is None:
+                    continue
+            self._statements[name] = self._compile(name, sql)
+
+        self._prepared = weakref.WeakKeyDictionary()  # yhteys -> {nimi: (palvelinnimi, EXECUTE-lause)}
+        self._lock = threading.Lock()
+        self._counter = itertools.count(1)
+
+    def _compile(self, name, sql):
+        sql = sql.strip()
+        if not self.is_postgres:
+            return Statement(name, sql)
+
+        parts = sql.split('?')
+        param_count = len(parts) - 1
+        # psycopg2 muotoilee koko lähetettävän merkkijonon, joten %-merkit tuplataan
+        body = parts[0].replace('%', '%%')
+        for i, part in enumerate(parts[1:], start=1):
+            body += f"${i}" + part.replace('%', '%%')
+        return Statement(name, sql.replace('?', '%s'), prepare_body=body, param_count=param_count)
+
+    def get(self, name):
+        """Palauttaa käännetyn lauseen. Tuntematon nimi heittää KeyErrorin."""
+        try:
+            return self._statements[name]
+        except KeyError:
+            raise KeyError(f"Tuntematon SQL-lause: {name}") from None
+
+    def __contains__(self, name):
+        return name in self._statements
+
+    def bind(self, conn, statement):
+        """
+        Palauttaa (valmistelu-SQL, suoritettava SQL, palvelinnimi).
+
+        Valmistelu-SQL on tyhjä, jos lause on jo valmisteltu tällä yhteydellä
+        tai valmistelu ei ole käytössä. Palvelinnimi annetaan mark_prepared():lle
+        vasta kun lause on onnistuneesti suoritettu.
+        """
+        if not self.prepare or statement.prepare_body is None:
+            return '', statement.sql, None
+
+        with self._lock:
+            prepared = self._prepared.get(conn)
+            entry = prepared.get(statement.name) if prepared else None
+        if entry is not None:
+            return '', entry[1], None
+
+        # Uusi nimi joka yrityksellä: epäonnistunut erä on voinut jättää lauseen palvelimelle
+        server_name = f"{statement.name}_{next(self._counter)}"
+        setup = f"PREPARE {server_name} AS {statement.prepare_body}; "
+        return setup, self._execute_sql(server_name, statement.param_count), server_name
+
+    def mark_prepared(self, conn, statement, server_name):
+        execute_sql = self._execute_sql(server_name, statement.param_count)
+        with self._lock:
+            self._prepared.setdefault(conn, {})[statement.name] = (server_name, execute_sql)
+
+    @staticmethod
+    def _execute_sql(server_name, param_count):
+        if not param_count:
+            return f"EXECUTE {server_name}"
+        return f"EXECUTE {server_name} ({', '.join(['%s'] * param_count)})"
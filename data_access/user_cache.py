@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+# data_access/user_cache.py
+"""
+Prosessinsisäinen välimuisti Flask-Loginin load_userille.
+
+Jokainen kirjautunut pyyntö lataa käyttäjän, joten ilman välimuistia
+jokainen pyyntö (myös simulaation kysymysten selaus) tekee users-kyselyn.
+Rivit pidetään muistissa enintään USER_CACHE_TTL sekuntia.
+
+Käyttäjää muuttavat DatabaseManagerin metodit kutsuvat invalidate(), joka
+poistaa rivin tästä workerista heti ja kasvattaa cache_versions-taulun
+'users'-laskuria samassa transaktiossa kuin muutos. Muut workerit
+vertaavat laskuria enintään USER_CACHE_CHECK_INTERVAL sekunnin välein ja
+tyhjentävät välimuistinsa, kun se on muuttunut.
+"""
+import os
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+CACHE_NAME = 'users'
+
+
+class UserCache:
+    """Säieturvallinen, versioitu välimuisti load_user-riveille."""
+
+    def __init__(self, db_manager, ttl=None, check_interval=None, max_size=None):
+        self.db_manager = db_manager
+        if ttl is None:
+            ttl = float(os.environ.get('USER_CACHE_TTL', 60.0))
+        if check_interval is None:
+            check_interval = float(os.environ.get('USER_CACHE_CHECK_INTERVAL', 2.0))
+        if max_size is None:
+            max_size = int(os.environ.get('USER_CACHE_MAX_SIZE', 10000))
+        self.ttl = ttl
+        self.check_interval = check_interval
+        self.max_size = max(1, max_size)
+
+        self._lock = threading.Lock()
+        # user_id -> (rivi sanakirjana, latausaika)
+        self._rows = {}
+        self._version = None
+        self._checked_at = 0.0
+        self._stats = {'hits': 0, 'misses': 0, 'version_checks': 0, 'flushes': 0, 'invalidations': 0}
+
+    def _read_version(self):
+        row = self.db_manager._execute(
+            "SELECT version FROM cache_versions WHERE name = ?", (CACHE_NAME,), fetch='one'
+        )
+        return row['version'] if row else 0
+
+    def _check_version(self, now):
+        """Tyhjentää välimuistin, jos jokin worker on muuttanut käyttäjiä."""
+        if now - self._checked_at < self.check_interval:
+            return
+        with self._lock:
+            if now - self._checked_at < self.check_interval:
+                return
+            self._stats['version_checks'] += 1
+            version = self._read_version()
+            if self._version is not None and version != self._version:
+                self._rows.clear()
+                self._stats['flushes'] += 1
+            self._version = version
+            self._checked_at = time.monotonic()
+
+    def get(self, user_id):
+        """Palauttaa load_user-rivin sanakirjana tai None, jos käyttäjää ei ole."""
+        user_id = int(user_id)
+        now = time.monotonic()
+        self._check_version(now)
+
+        entry = self._rows.get(user_id)
+        if entry is not None and now - entry[1] < self.ttl:
+            self._stats['hits'] += 1
+            return entry[0]
+
+        self._stats['misses'] += 1
+        row = self.db_manager.execute_named('load_user', (user_id,), fetch='one')
+        if not row:
+            return None
+        row = dict(row)
+        with self._lock:
+            self._rows.pop(user_id, None)
+            if len(self._rows) >= self.max_size:
+                # Vanhin lisätty pois (dict säilyttää lisäysjärjestyksen)
+                self._rows.pop(next(iter(self._rows)))
+            self._rows[user_id] = (row, now)
+        return row
+
+    def invalidate(self, user_id=None):
+        """
+        Poistaa käyttäjän (tai kaikki, jos user_id on None) välimuistista ja
+        kasvattaa versiolaskuria, jolloin muut workerit tyhjentävät omansa.
+        Kutsu käyttäjää muuttavan kyselyn jälkeen samassa transaktiossa.
+        """
+        try:
+            self.db_manager._execute(
+                "UPDATE cache_versions SET version = version + 1 WHERE name = ?", (CACHE_NAME,)
+            )
+        except Exception as e:
+            logger.error(f"Virhe käyttäjävälimuistin version päivityksessä: {e}")
+        with self._lock:
+            if user_id is None:
+                self._rows.clear()
+            else:
+                self._rows.pop(int(user_id), None)
+            self._stats['invalidations'] += 1
+
+    def stats(self):
+        stats = dict(self._stats)
+        stats.update({
+            'version': self._version,
+            'users': len(self._rows),
+            'ttl': self.ttl,
+            'check_interval': self.check_interval,
+        })
+        return stats
@@ -1,6 +1,7 @@
 """
 Achievement Manager - Saavutusten hallinta ja tarkistus
 """
+import json
 from datetime import datetime, date, timedelta
 from models.models import Achievement
 
@@ -105,191 +106,302 @@ ENHANCED_ACHIEVEMENTS = {
 }
 
 
+# Kategoriamestaruus: vähintään 20 vastausta ja 90 % oikein
+CATEGORY_MASTER_MIN_ANSWERS = 20
+CATEGORY_MASTER_RATE = 0.9
+
+# Nopeat vastaukset (quick_learner) ja salamannopeat oikeat vastaukset (speed_demon), sekunteina
+FAST_ANSWER_SECONDS = 10
+SPEED_ANSWER_SECONDS = 5
+
+# Oikeiden vastausten putki lasketaan uudelleenrakennuksessa enintään näin pitkältä
+CORRECT_RUN_SCAN_LIMIT = 100
+
+_COUNTER_FIELDS = ('total_attempts', 'fast_answers', 'speed_answers', 'early_answers', 'late_answers',
+                   'correct_run', 'day_streak')
+
+
+def _category_mastered(counters, category):
+    correct, total = counters['categories'].get(category, (0, 0))
+    return total >= CATEGORY_MASTER_MIN_ANSWERS and correct / total >= CATEGORY_MASTER_RATE
+
+
+# Jokainen saavutus on ehto käyttäjän laskureille ja tapahtuman kontekstille
+ACHIEVEMENT_RULES = {
+    'first_steps': lambda c, ctx: c['total_attempts'] >= 1,
+    'quick_learner': lambda c, ctx: c['fast_answers'] >= 10,
+    'perfectionist': lambda c, ctx: c['correct_run'] >= 20,
+    'dedicated': lambda c, ctx: c['total_attempts'] >= 100,
+    'expert': lambda c, ctx: c['total_attempts'] >= 500,
+    'master': lambda c, ctx: c['total_attempts'] >= 1000,
+    'streak_3': lambda c, ctx: c['day_streak'] >= 3,
+    'streak_7': lambda c, ctx: c['day_streak'] >= 7,
+    'streak_30': lambda c, ctx: c['day_streak'] >= 30,
+    'category_master_farmakologia': lambda c, ctx: _category_mastered(c, 'Farmakologia'),
+    'category_master_annosjakelu': lambda c, ctx: _category_mastered(c, 'Annosjakelu'),
+    'simulation_complete': lambda c, ctx: bool(ctx.get('simulation_complete')),
+    'simulation_perfect': lambda c, ctx: bool(ctx.get('simulation_perfect')),
+    'early_bird': lambda c, ctx: c['early_answers'] >= 1,
+    'night_owl': lambda c, ctx: c['late_answers'] >= 1,
+    'speed_demon': lambda c, ctx: c['speed_answers'] >= 1 or (ctx.get('fast_answer') is not None
+                                                             and ctx['fast_answer'] < SPEED_ANSWER_SECONDS),
+}
+
+
 class EnhancedAchievementManager:
-    """Saavutusten hallinta ja tarkistus."""
+    """
+    Saavutusten hallinta ja tarkistus.
+
+    Vastaukset päivittävät käyttäjän laskurit (user_achievement_counters ja
+    user_category_counters) vakiomäärällä kyselyitä, ja saavutukset
+    tarkistetaan ehtoina päivitetyille laskureille ilman lisäkyselyitä.
+    Puuttuvat laskurit (uusi käyttäjä, reset_user_aggregates) lasketaan
+    question_attempts-taulusta uudelleen.
+    """
     
     def __init__(self, db_manager):
         self.db_manager = db_manager
         self.ENHANCED_ACHIEVEMENTS = ENHANCED_ACHIEVEMENTS
     
-    def check_achievements(self, user_id, context=None):
+    def record_answers(self, user_id, answers, context=None):
         """
-        Tarkistaa ja avaa uudet saavutukset tietylle käyttäjälle.
+        Päivittää laskurit juuri tallennetuilla vastauksilla ja palauttaa
+        uudet saavutukset. Kutsu record_answer/record_answers-kutsun jälkeen
+        samassa transaktiossa.
+
+        answers: lista sanakirjoja, joissa question_id, is_correct ja time_taken
+        (valinnaisesti category; muuten se haetaan kysymysvälimuistista).
         """
-        new_achievements = []
         context = context or {}
-        
+        if not answers:
+            return self.check_achievements(user_id, context)
         try:
-            # Hae jo avatut saavutukset
-            unlocked_rows = self.db_manager._execute(
-                "SELECT achievement_id FROM user_achievements WHERE user_id = ?", 
-                (user_id,),
-                fetch='all'
-            )
-            unlocked_ids = {row['achievement_id'] for row in unlocked_rows} if unlocked_rows else set()
-            
-            # Lista tarkistettavista saavutuksista ja niiden funktioista
-            achievements_to_check = [
-                ('first_steps', self.check_first_steps),
-                ('quick_learner', self.check_quick_learner),
-                ('perfectionist', self.check_perfectionist),
-                ('dedicated', self.check_dedicated),
-                ('expert', self.check_expert),
-                ('master', self.check_master),
-                ('streak_3', self.check_streak_3),
-                ('streak_7', self.check_streak_7),
-                ('streak_30', self.check_streak_30),
-                ('category_master_farmakologia', lambda uid: self.check_category_master(uid, 'Farmakologia')),
-                ('category_master_annosjakelu', lambda uid: self.check_category_master(uid, 'Annosjakelu')),
-                ('simulation_complete', self.check_simulation_complete),
-                ('early_bird', self.check_early_bird),
-                ('night_owl', self.check_night_owl),
-            ]
-            
-            # Konteksti-riippuvaiset saavutukset
-            if context.get('simulation_perfect'):
-                achievements_to_check.append(('simulation_perfect', lambda uid: True))
-            
-            if context.get('fast_answer') and context['fast_answer'] < 5:
-                achievements_to_check.append(('speed_demon', lambda uid: True))
-            
-            # Tarkista jokainen saavutus
-            for achievement_id, check_func in achievements_to_check:
-                if achievement_id not in unlocked_ids:
-                    try:
-                        if check_func(user_id):
-                            self.unlock_achievement(user_id, achievement_id)
-                            new_achievements.append(achievement_id)
-                            print(f"✅ Saavutus avattu: {achievement_id} (käyttäjä: {user_id})")
-                    except Exception as e:
-                        print(f"❌ Virhe saavutuksen {achievement_id} tarkistuksessa: {e}")
-        
+            counters = self._bump_counters(user_id, answers, datetime.now())
+            return self._unlock_new(user_id, counters, context)
         except Exception as e:
             print(f"CRITICAL ERROR checking achievements: {e}")
+            return []
 
-        return new_achievements
+    def record_answer(self, user_id, question_id, is_correct, time_taken, context=None):
+        """Yhden vastauksen versio record_answersista."""
+        answer = {'question_id': question_id, 'is_correct': is_correct, 'time_taken': time_taken}
+        return self.record_answers(user_id, [answer], context)
 
-    # ========== SAAVUTUSTARKISTUKSET ==========
-
-    def check_first_steps(self, user_id):
-        """Vastasi ensimmäiseen kysymykseen."""
-        result = self.db_manager._execute("SELECT COUNT(*) as count FROM question_attempts WHERE user_id = ?", (user_id,), fetch='one')
-        return result and result['count'] >= 1
-
-    def check_quick_learner(self, user_id):
-        """Vastasi 10 kysymykseen alle 10 sekunnissa."""
-        result = self.db_manager._execute("SELECT COUNT(*) as count FROM question_attempts WHERE user_id = ? AND time_taken < 10", (user_id,), fetch='one')
-        return result and result['count'] >= 10
-
-    def check_perfectionist(self, user_id):
-        """100% oikein 20 kysymyksessä peräkkäin."""
-        rows = self.db_manager._execute("SELECT correct FROM question_attempts WHERE user_id = ? ORDER BY timestamp DESC LIMIT 20", (user_id,), fetch='all')
-        if not rows or len(rows) < 20:
-            return False
-        return all(row['correct'] for row in rows)
-
-    def check_dedicated(self, user_id):
-        """Vastasi 100 kysymykseen."""
-        result = self.db_manager._execute("SELECT COUNT(*) as count FROM question_attempts WHERE user_id = ?", (user_id,), fetch='one')
-        return result and result['count'] >= 100
-
-    def check_expert(self, user_id):
-        """Vastasi 500 kysymykseen."""
-        result = self.db_manager._execute("SELECT COUNT(*) as count FROM question_attempts WHERE user_id = ?", (user_id,), fetch='one')
-        return result and result['count'] >= 500
-
-    def check_master(self, user_id):
-        """Vastasi 1000 kysymykseen."""
-        result = self.db_manager._execute("SELECT COUNT(*) as count FROM question_attempts WHERE user_id = ?", (user_id,), fetch='one')
-        return result and result['count'] >= 1000
-
-    def check_streak_3(self, user_id):
-        """Harjoitteli 3 päivää peräkkäin."""
-        return self._check_streak(user_id, 3)
-
-    def check_streak_7(self, user_id):
-        """Harjoitteli 7 päivää peräkkäin."""
-        return self._check_streak(user_id, 7)
-
-    def check_streak_30(self, user_id):
-        """Harjoitteli 30 päivää peräkkäin."""
-        return self._check_streak(user_id, 30)
-
-    def _check_streak(self, user_id, days):
-        """Apufunktio putken tarkistamiseen."""
-        # Hae viimeiset X päivää joina käyttäjä on harjoitellut
-        rows = self.db_manager._execute("""
-            SELECT DISTINCT date(timestamp) as practice_date 
-            FROM question_attempts 
-            WHERE user_id = ? 
-            ORDER BY practice_date DESC 
-            LIMIT ?
-        """, (user_id, days), fetch='all')
-        
-        if not rows or len(rows) < days:
-            return False
-        
-        # Muunnetaan päivämäärät oikein
-        dates = []
-        for row in rows:
-            val = row['practice_date']
-            if isinstance(val, str):
-                dates.append(date.fromisoformat(val))
-            elif isinstance(val, date):
-                dates.append(val)
-
-        # Tarkista että päivät ovat peräkkäisiä
-        for i in range(len(dates) - 1):
-            if (dates[i] - dates[i + 1]).days != 1:
-                return False
-                
-        return True
-
-    def check_category_master(self, user_id, category):
-        """Sai 90% kategorian kysymyksistä oikein."""
-        result = self.db_manager._execute("""
-            SELECT 
-                COUNT(*) as total,
-                SUM(CASE WHEN qa.correct = TRUE THEN 1 ELSE 0 END) as correct
+    def check_achievements(self, user_id, context=None):
+        """
+        Tarkistaa ja avaa uudet saavutukset ilman uutta vastausta
+        (esim. kontekstiriippuvaiset saavutukset testin jälkeen).
+        """
+        try:
+            counters = self._load_counters(user_id)
+            return self._unlock_new(user_id, counters, context or {})
+        except Exception as e:
+            print(f"CRITICAL ERROR checking achievements: {e}")
+            return []
+
+    # ========== LASKURIT ==========
+
+    def _bump_counters(self, user_id, answers, now):
+        """Kasvattaa laskureita; palauttaa päivitetyt laskurit (kategoriat vain muuttuneilta)."""
+        by_id = self.db_manager.question_cache.snapshot().by_id
+        categories = {}
+        fast = speed = trailing_correct = 0
+        for answer in answers:
+            is_correct = bool(answer['is_correct'])
+            time_taken = float(answer.get('time_taken') or 0)
+            fast += 1 if time_taken < FAST_ANSWER_SECONDS else 0
+            speed += 1 if is_correct and time_taken < SPEED_ANSWER_SECONDS else 0
+            trailing_correct = trailing_correct + 1 if is_correct else 0
+
+            category = answer.get('category')
+            if category is None:
+                question = by_id.get(answer['question_id'])
+                category = question.category if question else None
+            if category is not None:
+                correct, total = categories.get(category, (0, 0))
+                categories[category] = (correct + (1 if is_correct else 0), total + 1)
+
+        all_correct = trailing_correct == len(answers)
+        today = now.date()
+        row = self.db_manager.execute_named('achievement_counters_bump', (
+            len(answers), fast, speed,
+            len(answers) if now.hour < 8 else 0,
+            len(answers) if now.hour >= 22 else 0,
+            all_correct, len(answers), trailing_correct,
+            today.isoformat(), (today - timedelta(days=1)).isoformat(), today.isoformat(), now,
+            user_id,
+        ), fetch='one')
+
+        if row is None:
+            # Ei laskureita vielä: lasketaan kaikesta historiasta (sisältää nämä vastaukset)
+            return self.rebuild_counters(user_id)
+
+        counters = dict(row)
+        counters['categories'] = {}
+        if categories:
+            query, params = self.db_manager._multi_row_values("""
+                INSERT INTO user_category_counters (user_id, category, correct, total)
+                VALUES {values}
+                ON CONFLICT (user_id, category) DO UPDATE SET
+                    correct = user_category_counters.correct + EXCLUDED.correct,
+                    total = user_category_counters.total + EXCLUDED.total
+                RETURNING category, correct, total
+            """, [(user_id, category, correct, total) for category, (correct, total) in categories.items()])
+            for category_row in self.db_manager._execute(query, params, fetch='all') or []:
+                counters['categories'][category_row['category']] = (category_row['correct'], category_row['total'])
+        return counters
+
+    def _load_counters(self, user_id):
+        row = self.db_manager._execute(
+            "SELECT * FROM user_achievement_counters WHERE user_id = ?", (user_id,), fetch='one'
+        )
+        if row is None:
+            return self.rebuild_counters(user_id)
+        counters = dict(row)
+        rows = self.db_manager._execute(
+            "SELECT category, correct, total FROM user_category_counters WHERE user_id = ?", (user_id,), fetch='all'
+        ) or []
+        counters['categories'] = {r['category']: (r['correct'], r['total']) for r in rows}
+        return counters
+
+    def rebuild_counters(self, user_id):
+        """
+        Laskee käyttäjän laskurit question_attempts-taulusta ja tallentaa ne.
+
+        Write-behind-tilassa (attempt_log) jonossa olevat yritykset kirjoitetaan
+        ensin, jotta ne tulevat mukaan. Poikkeus: SQLitessä, kun säikeen oma
+        transaktio pitää jo kirjoituslukkoa, taustasäie ei pääse kirjoittamaan,
+        eikä jonoa odoteta; jonossa olleet yritykset jäävät tällöin laskureista
+        pois, kunnes laskurit seuraavan kerran rakennetaan uudelleen.
+        """
+        db = self.db_manager
+        if db.attempt_log is not None and not db.detached_write_blocked():
+            db.attempt_log.flush()
+        hour = "EXTRACT(HOUR FROM timestamp)" if db.is_postgres else "CAST(strftime('%H', timestamp) AS INTEGER)"
+        totals = db._execute(f"""
+            SELECT
+                COUNT(*) as total_attempts,
+                SUM(CASE WHEN time_taken < {FAST_ANSWER_SECONDS} THEN 1 ELSE 0 END) as fast_answers,
+                SUM(CASE WHEN correct AND time_taken < {SPEED_ANSWER_SECONDS} THEN 1 ELSE 0 END) as speed_answers,
+                SUM(CASE WHEN {hour} < 8 THEN 1 ELSE 0 END) as early_answers,
+                SUM(CASE WHEN {hour} >= 22 THEN 1 ELSE 0 END) as late_answers
+            FROM question_attempts WHERE user_id = ?
+        """, (user_id,), fetch='one')
+        counters = {name: (totals[name] or 0) if totals else 0 for name in _COUNTER_FIELDS[:5]}
+
+        recent = db._execute(
+            "SELECT correct FROM question_attempts WHERE user_id = ? ORDER BY timestamp DESC LIMIT ?",
+            (user_id, CORRECT_RUN_SCAN_LIMIT), fetch='all'
+        ) or []
+        run = 0
+        for row in recent:
+            if not row['correct']:
+                break
+            run += 1
+        counters['correct_run'] = run
+
+        date_rows = db._execute("""
+            SELECT DISTINCT date(timestamp) as practice_date
+            FROM question_attempts
+            WHERE user_id = ?
+            ORDER BY practice_date DESC
+        """, (user_id,), fetch='all') or []
+        dates = [d if isinstance(d, date) else date.fromisoformat(str(d))
+                 for d in (row['practice_date'] for row in date_rows) if d is not None]
+        streak = 1 if dates else 0
+        for newer, older in zip(dates, dates[1:]):
+            if (newer - older).days != 1:
+                break
+            streak += 1
+        counters['day_streak'] = streak
+        last_practice_date = dates[0].isoformat() if dates else None
+
+        unlocked_rows = db._execute(
+            "SELECT achievement_id FROM user_achievements WHERE user_id = ?", (user_id,), fetch='all'
+        ) or []
+        counters['unlocked'] = json.dumps(sorted(row['achievement_id'] for row in unlocked_rows))
+
+        category_rows = db._execute("""
+            SELECT q.category as category,
+                   SUM(CASE WHEN qa.correct THEN 1 ELSE 0 END) as correct,
+                   COUNT(*) as total
             FROM question_attempts qa
             JOIN questions q ON qa.question_id = q.id
-            WHERE qa.user_id = ? AND q.category = ?
-        """, (user_id, category), fetch='one')
-        
-        if not result or result['total'] < 20:  # Vähintään 20 kysymystä kategoriasta
-            return False
-        
-        success_rate = result['correct'] / result['total']
-        return success_rate >= 0.9
-
-    def check_simulation_complete(self, user_id):
-        """Suoritti ensimmäisen koesimulaation."""
-        result = self.db_manager._execute("SELECT COUNT(*) as count FROM simulation_results WHERE user_id = ?", (user_id,), fetch='one')
-        return result and result['count'] >= 1
-
-    def check_early_bird(self, user_id):
-        """Harjoitteli ennen klo 8:00."""
-        time_function = "EXTRACT(HOUR FROM timestamp)" if self.db_manager.is_postgres else "strftime('%H', timestamp)"
-        query = f"SELECT COUNT(*) as count FROM question_attempts WHERE user_id = ? AND {time_function} < '08'"
-        result = self.db_manager._execute(query, (user_id,), fetch='one')
-        return result and result['count'] >= 1
-
-    def check_night_owl(self, user_id):
-        """Harjoitteli klo 22:00 jälkeen."""
-        time_function = "EXTRACT(HOUR FROM timestamp)" if self.db_manager.is_postgres else "strftime('%H', timestamp)"
-        query = f"SELECT COUNT(*) as count FROM question_attempts WHERE user_id = ? AND {time_function} >= '22'"
-        result = self.db_manager._execute(query, (user_id,), fetch='one')
-        return result and result['count'] >= 1
-    
+            WHERE qa.user_id = ?
+            GROUP BY q.category
+        """, (user_id,), fetch='all') or []
+        counters['categories'] = {row['category']: (row['correct'] or 0, row['total']) for row in category_rows}
+
+        with db.transaction():
+            db._execute("""
+                INSERT INTO user_achievement_counters
+                    (user_id, total_attempts, fast_answers, speed_answers, early_answers, late_answers,
+                     correct_run, day_streak, last_practice_date, unlocked, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (user_id) DO UPDATE SET
+                    total_attempts = EXCLUDED.total_attempts,
+                    fast_answers = EXCLUDED.fast_answers,
+                    speed_answers = EXCLUDED.speed_answers,
+                    early_answers = EXCLUDED.early_answers,
+                    late_answers = EXCLUDED.late_answers,
+                    correct_run = EXCLUDED.correct_run,
+                    day_streak = EXCLUDED.day_streak,
+                    last_practice_date = EXCLUDED.last_practice_date,
+                    unlocked = EXCLUDED.unlocked,
+                    updated_at = EXCLUDED.updated_at
+            """, (user_id, *(counters[name] for name in _COUNTER_FIELDS), last_practice_date,
+                  counters['unlocked'], datetime.now()))
+            db._execute("DELETE FROM user_category_counters WHERE user_id = ?", (user_id,))
+            if counters['categories']:
+                query, params = db._multi_row_values(
+                    "INSERT INTO user_category_counters (user_id, category, correct, total) VALUES {values}",
+                    [(user_id, category, correct, total) for category, (correct, total) in counters['categories'].items()]
+                )
+                db._execute(query, params)
+        return counters
+
+    def _unlock_new(self, user_id, counters, context):
+        unlocked_ids = set(json.loads(counters.get('unlocked') or '[]'))
+        new_achievements = []
+        for achievement_id, rule in ACHIEVEMENT_RULES.items():
+            if achievement_id in unlocked_ids:
+                continue
+            try:
+                if rule(counters, context):
+                    new_achievements.append(achievement_id)
+            except Exception as e:
+                print(f"❌ Virhe saavutuksen {achievement_id} tarkistuksessa: {e}")
+
+        if new_achievements:
+            self.unlock_achievements(user_id, new_achievements, unlocked_ids)
+            for achievement_id in new_achievements:
+                print(f"✅ Saavutus avattu: {achievement_id} (käyttäjä: {user_id})")
+        return new_achievements
+
     # ========== MUUT METODIT ==========
 
     def unlock_achievement(self, user_id, achievement_id):
         """Tallentaa avatun saavutuksen käyttäjälle."""
+        self.unlock_achievements(user_id, [achievement_id])
+
+    def unlock_achievements(self, user_id, achievement_ids, already_unlocked=None):
+        """Tallentaa avatut saavutukset ja päivittää laskuririvin unlocked-listan."""
         try:
-            self.db_manager._execute("""
-                INSERT INTO user_achievements (user_id, achievement_id, unlocked_at) 
-                VALUES (?, ?, ?)
-            """, (user_id, achievement_id, datetime.now()), fetch='none')
+            query, params = self.db_manager._multi_row_values("""
+                INSERT INTO user_achievements (user_id, achievement_id, unlocked_at)
+                VALUES {values}
+                ON CONFLICT (user_id, achievement_id) DO NOTHING
+            """, [(user_id, achievement_id, datetime.now()) for achievement_id in achievement_ids])
+            self.db_manager._execute(query, params)
+            if already_unlocked is None:
+                # Laskuririvi lasketaan uudelleen seuraavalla vastauksella
+                self.db_manager.reset_user_aggregates(user_id=user_id, tables=('user_achievement_counters',))
+                return
+            unlocked = sorted(set(already_unlocked) | set(achievement_ids))
+            self.db_manager._execute(
+                "UPDATE user_achievement_counters SET unlocked = ? WHERE user_id = ?",
+                (json.dumps(unlocked), user_id)
+            )
         except Exception as e:
             # Voi olla, että saavutus on jo olemassa (race condition), joten ei haittaa
             print(f"Virhe saavutuksen tallennuksessa (voi olla ok): {e}")
@@ -320,6 +432,12 @@ class EnhancedAchievementManager:
         
         return achievements
     
+    def get_recent_achievements(self, user_id, limit=3, unlocked=None):
+        """Viimeksi avatut saavutukset, uusin ensin."""
+        if unlocked is None:
+            unlocked = self.get_unlocked_achievements(user_id)
+        return sorted(unlocked, key=lambda ach: str(ach.unlocked_at or ''), reverse=True)[:limit]
+    
     def get_achievement_progress(self, user_id):
         """Hakee käyttäjän edistymisen saavutuksissa."""
         unlocked = self.get_unlocked_achievements(user_id)
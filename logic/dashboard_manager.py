@@ -0,0 +1,90 @@
+"""
+Dashboard Manager - Dashboardin tietojen kokoaminen yhdellä kertaa
+"""
+import os
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class DashboardManager:
+    """
+    Kokoaa dashboardin osiot kerran per pyyntö.
+
+    Toisistaan riippumattomat osiot ajetaan rinnakkain säiepoolissa; jokainen
+    säie lainaa oman yhteyden DatabaseManagerin poolista. Suositus lasketaan
+    lopuksi jo haetuista tiedoista. Osioiden ajat kirjataan lokiin.
+    """
+
+    def __init__(self, db_manager, stats_manager, achievement_manager, spaced_repetition_manager, max_workers=None):
+        self.db_manager = db_manager
+        self.stats_manager = stats_manager
+        self.achievement_manager = achievement_manager
+        self.spaced_repetition_manager = spaced_repetition_manager
+        if max_workers is None:
+            # Pidä pienempänä kuin DB_POOL_MAX_SIZE: pyynnön oma yhteys on jo lainassa
+            max_workers = int(os.environ.get('DASHBOARD_WORKERS', 3))
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='dashboard') if max_workers > 1 else None
+
+    # Arvot, joilla epäonnistunut osio näytetään
+    DEFAULTS = {
+        'stats': {'general': {'answered_questions': 0, 'total_questions_in_db': 0, 'avg_success_rate': 0},
+                  'categories': [], 'difficulties': [], 'weekly_progress': []},
+        'streak': {'current_streak': 0, 'longest_streak': 0},
+        'due_reviews': 0,
+        'weekly_improvement': 0,
+        'achievements': {'unlocked': 0, 'recent': []},
+    }
+
+    def _sections(self, user_id):
+        return {
+            'stats': lambda: self.stats_manager.get_learning_analytics(user_id),
+            'streak': lambda: self.stats_manager.get_user_streak(user_id),
+            'due_reviews': lambda: self.spaced_repetition_manager.count_due_questions(user_id),
+            'weekly_improvement': lambda: self.stats_manager.get_weekly_improvement(user_id),
+            'achievements': lambda: self._achievements(user_id),
+        }
+
+    def _achievements(self, user_id):
+        unlocked = self.achievement_manager.get_unlocked_achievements(user_id)
+        return {
+            'unlocked': len(unlocked),
+            'recent': self.achievement_manager.get_recent_achievements(user_id, limit=3, unlocked=unlocked),
+        }
+
+    @staticmethod
+    def _timed(func):
+        started = time.perf_counter()
+        try:
+            result, error = func(), None
+        except Exception as e:
+            result, error = None, e
+        return result, error, (time.perf_counter() - started) * 1000
+
+    def assemble(self, user_id):
+        """
+        Palauttaa ({osio: arvo}, {osio: ms}). Epäonnistunut osio saa arvon
+        DEFAULTS-sanakirjasta, jotta muu dashboard näytetään silti.
+        """
+        started = time.perf_counter()
+        sections = self._sections(user_id)
+        if self._executor is not None:
+            futures = {name: self._executor.submit(self._timed, func) for name, func in sections.items()}
+            outcomes = {name: future.result() for name, future in futures.items()}
+        else:
+            outcomes = {name: self._timed(func) for name, func in sections.items()}
+
+        data, timings = {}, {}
+        for name, (result, error, elapsed_ms) in outcomes.items():
+            timings[name] = round(elapsed_ms, 1)
+            if error is not None:
+                logger.error(f"Virhe dashboardin osiossa {name}: {error}")
+                result = self.DEFAULTS[name]
+            data[name] = result
+        timings['total'] = round((time.perf_counter() - started) * 1000, 1)
+
+        logger.info(f"Dashboard user={user_id}: " + ", ".join(f"{name} {ms} ms" for name, ms in timings.items()))
+        return data, timings
@@ -1,20 +1,179 @@
 # logic/simulation_manager.py
-from datetime import datetime
+import os
+import atexit
+import logging
+import secrets
+import threading
+import time
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+SIMULATION_SESSION_TYPE = 'simulation'
+SIMULATION_DURATION_SECONDS = 3600
+
 
 def calculate_remaining_time(start_time_iso, total_duration_seconds):
     """Laskee jäljellä olevan ajan ISO-formatoidusta aikaleimasta."""
     if not start_time_iso:
         return total_duration_seconds
-    
+
     try:
         # Muunnetaan ISO-merkkijono datetime-objektiksi
         start_time = datetime.fromisoformat(start_time_iso)
-        
+
         # Lasketaan kulunut aika sekunteina
-        elapsed_seconds = (datetime.now() - start_time).total_seconds()
-        
+        elapsed_seconds = (datetime.now(start_time.tzinfo) - start_time).total_seconds()
+
         # Palautetaan jäljellä oleva aika, vähintään 0
         return max(0, int(total_duration_seconds - elapsed_seconds))
     except (ValueError, TypeError):
         # Jos aikaleima on virheellinen, palautetaan koko aika
-        return total_duration_seconds
\ No newline at end of file
+        return total_duration_seconds
+
+
+class SimulationStore:
+    """
+    Koesimulaation tila palvelimella (active_sessions-taulu).
+
+    Flaskin cookie-sessioon tallennetaan vain lyhyt session_id, joten
+    pyyntöjen koko ei kasva vastausten mukana ja keskeneräinen koe säilyy
+    workerien uudelleenkäynnistyksissä.
+
+    Vastaukset ja ajastin (save) kirjoitetaan heti, koska palautus voi osua
+    toiseen workeriin. Pelkkä kysymysten selaus (buffer) kerätään muistiin ja
+    kirjoitetaan enintään SIMULATION_FLUSH_INTERVAL sekunnin välein; kirjoitus
+    päivittää vain puskuroidut kentät, joten se ei voi ylikirjoittaa toisen
+    workerin tallentamia vastauksia.
+    """
+
+    def __init__(self, db_manager, flush_interval=None):
+        self.db_manager = db_manager
+        if flush_interval is None:
+            flush_interval = float(os.environ.get('SIMULATION_FLUSH_INTERVAL', 5.0))
+        self.flush_interval = flush_interval
+
+        self._lock = threading.Lock()
+        # user_id -> (session_id, {kenttä: arvo}), kirjoittamattomat muutokset
+        self._pending = {}
+        self._flushed_at = time.monotonic()
+        atexit.register(self.flush)
+
+    @staticmethod
+    def new_session_id():
+        return secrets.token_urlsafe(12)
+
+    def create(self, user_id, question_ids, duration=SIMULATION_DURATION_SECONDS):
+        """Luo uuden kokeen (korvaa käyttäjän edellisen) ja palauttaa sen tilan."""
+        with self._lock:
+            self._pending.pop(user_id, None)
+        state = {
+            'user_id': user_id,
+            'session_id': self.new_session_id(),
+            'question_ids': question_ids,
+            'answers': [None] * len(question_ids),
+            'current_index': 0,
+            'start_time': datetime.now(timezone.utc).isoformat(),
+            'time_remaining': duration,
+        }
+        success, error = self.db_manager.save_or_update_session(
+            user_id, SIMULATION_SESSION_TYPE, state['question_ids'], state['answers'],
+            state['current_index'], state['time_remaining'],
+            session_id=state['session_id'], start_time=state['start_time']
+        )
+        if not success:
+            raise RuntimeError(f"Simulaation tallennus epäonnistui: {error}")
+        return state
+
+    def get(self, user_id, session_id):
+        """Palauttaa kokeen tilan tai None, jos session_id ei ole käyttäjän aktiivinen koe."""
+        if not session_id:
+            return None
+        self._maybe_flush()
+        row = self.db_manager.get_active_session(user_id)
+        if not row or row.get('session_type') != SIMULATION_SESSION_TYPE or row.get('session_id') != session_id:
+            return None
+
+        state = {
+            'user_id': user_id,
+            'session_id': session_id,
+            'question_ids': row['question_ids'],
+            'answers': row['answers'],
+            'current_index': row['current_index'],
+            'start_time': row.get('start_time'),
+            'time_remaining': row['time_remaining'],
+        }
+        with self._lock:
+            pending = self._pending.get(user_id)
+        if pending and pending[0] == session_id:
+            state.update(pending[1])
+        return state
+
+    def save(self, user_id, session_id, **changes):
+        """Kirjoittaa muutokset heti (sekä mahdolliset puskuroidut). Palauttaa (success, error)."""
+        with self._lock:
+            pending = self._pending.pop(user_id, None)
+        if pending and pending[0] == session_id:
+            changes = {**pending[1], **changes}
+        return self.db_manager.update_active_session(user_id, session_id, changes)
+
+    def buffer(self, user_id, session_id, **changes):
+        """Kerää muutokset muistiin; ne kirjoitetaan seuraavassa flushissa."""
+        with self._lock:
+            pending = self._pending.get(user_id)
+            if pending is None or pending[0] != session_id:
+                pending = (session_id, {})
+                self._pending[user_id] = pending
+            pending[1].update(changes)
+        self._maybe_flush()
+
+    def delete(self, user_id):
+        with self._lock:
+            self._pending.pop(user_id, None)
+        return self.db_manager.delete_active_session(user_id)
+
+    def _maybe_flush(self):
+        if self._pending and time.monotonic() - self._flushed_at >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """
+        Kirjoittaa kaikki puskuroidut muutokset yhdessä transaktiossa omalla
+        yhteydellä: muutokset ovat eri käyttäjien, joten flushin laukaisseen
+        pyynnön peruminen ei saa perua niitä. Epäonnistuneet kirjoitukset
+        palautetaan puskuriin seuraavaa yritystä varten. SQLitessä flush
+        odottaa, jos säikeen oma transaktio pitää kirjoituslukkoa.
+        """
+        if self.db_manager.detached_write_blocked():
+            return 0
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._flushed_at = time.monotonic()
+        if not pending:
+            return 0
+        failed = {}
+        try:
+            with self.db_manager.detached_transaction():
+                for user_id, (session_id, changes) in pending.items():
+                    success, error = self.db_manager.update_active_session(user_id, session_id, changes)
+                    if not success and error != 'not_found':
+                        failed[user_id] = (session_id, changes)
+        except Exception as e:
+            logger.error(f"Virhe simulaatiosessioiden tallennuksessa: {e}")
+            failed = pending
+        if failed:
+            self._requeue(failed)
+        return len(pending) - len(failed)
+
+    def _requeue(self, failed):
+        """Palauttaa kirjoittamatta jääneet muutokset puskuriin; flushin aikana tulleet uudemmat voittavat."""
+        with self._lock:
+            for user_id, (session_id, changes) in failed.items():
+                newer = self._pending.get(user_id)
+                if newer is None:
+                    self._pending[user_id] = (session_id, changes)
+                elif newer[0] == session_id:
+                    self._pending[user_id] = (session_id, {**changes, **newer[1]})
+
+    def stats(self):
+        return {'pending': len(self._pending), 'flush_interval': self.flush_interval}
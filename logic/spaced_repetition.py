@@ -1,7 +1,36 @@
 import json
+from datetime import datetime, timedelta
 from models.models import Question
 from typing import List
 
+
+def _sm2(interval, ease_factor, times_shown, performance_rating):
+    """SM-2 yhdelle kysymykselle: palauttaa (interval, ease_factor)."""
+    if performance_rating < 3:
+        interval = 1
+        ease_factor = max(1.3, ease_factor - 0.8 + 0.28 * performance_rating - 0.02 * (performance_rating**2))
+    else:
+        if times_shown <= 1:
+            interval = 6
+        else:
+            interval = round(interval * ease_factor)
+        ease_factor = ease_factor + (0.1 - (5 - performance_rating) * (0.08 + (5 - performance_rating) * 0.02))
+        ease_factor = max(1.3, ease_factor)
+    return interval, ease_factor
+
+
+def schedule_batch(intervals, ease_factors, times_shown, ratings):
+    """
+    calculate_next_review monelle kysymykselle: sama _sm2-kaava rivi kerrallaan,
+    tulokset sarakkeina apply_review_schedulea varten. Laskenta ei nopeudu;
+    erähyöty tulee yhdestä kirjoituksesta.
+
+    Parametrit ovat samanpituisia sekvenssejä. Palauttaa listat (intervals, ease_factors).
+    """
+    results = [_sm2(*row) for row in zip(intervals, ease_factors, times_shown, ratings)]
+    return [r[0] for r in results], [r[1] for r in results]
+
+
 class SpacedRepetitionManager:
     """SM-2 algoritmin toteutus, nyt käyttäjäkohtainen."""
     
@@ -10,53 +39,43 @@ class SpacedRepetitionManager:
     
     def calculate_next_review(self, question: Question, performance_rating: int) -> tuple:
         """Laskee seuraavan kertausajan SM-2 algoritmin mukaan."""
-        if performance_rating < 3:
-            interval = 1
-            ease_factor = max(1.3, question.ease_factor - 0.8 + 0.28 * performance_rating - 0.02 * (performance_rating**2))
-        else:
-            if question.times_shown <= 1:
-                interval = 6
-            else:
-                interval = round(question.interval * question.ease_factor)
-            ease_factor = question.ease_factor + (0.1 - (5 - performance_rating) * (0.08 + (5 - performance_rating) * 0.02))
-            ease_factor = max(1.3, ease_factor)
-        return interval, ease_factor
+        return _sm2(question.interval, question.ease_factor, question.times_shown, performance_rating)
+
+    def reschedule(self, user_id, ratings, questions=None):
+        """
+        Ajoittaa monta kysymystä kerralla, esim. simulaation jälkeen.
+
+        ratings: {question_id: suorituksen laatu 0-5}. questions: kysymykset
+        edistymisineen ennen vastausten tallennusta (kuten calculate_next_review
+        saa ne); jos puuttuu, edistyminen luetaan yhdellä kyselyllä. Uudet arvot
+        lasketaan schedule_batchilla ja kirjoitetaan
+        DatabaseManager.apply_review_schedule-metodilla. Palauttaa (success, error).
+        """
+        if questions is None:
+            questions = self.db_manager.get_questions_by_ids(list(ratings), user_id)
+        questions = [q for q in questions if q.id in ratings]
+        if not questions:
+            return True, None
+        intervals, ease_factors = schedule_batch(
+            [q.interval or 1 for q in questions],
+            [q.ease_factor or 2.5 for q in questions],
+            [q.times_shown or 0 for q in questions],
+            [ratings[q.id] for q in questions],
+        )
+        return self.db_manager.apply_review_schedule(
+            (user_id, q.id, interval, ease_factor)
+            for q, interval, ease_factor in zip(questions, intervals, ease_factors)
+        )
     
     def get_due_questions(self, user_id, limit=20) -> List[Question]:
-        """Hakee käyttäjän erääntyvät kertauskysymykset."""
-        date_func = "DATE" if not self.db_manager.is_postgres else ""
-        query = f"""
-            SELECT 
-                q.*,
-                p.times_shown, p.times_correct, p.last_shown, p.ease_factor, p.interval
-            FROM questions q
-            JOIN user_question_progress p ON q.id = p.question_id
-            WHERE p.user_id = ?
-              AND p.last_shown IS NOT NULL
-              AND {date_func}(p.last_shown, '+' || p.interval || ' days') <= {date_func}('now')
-            ORDER BY {date_func}(p.last_shown, '+' || p.interval || ' days') ASC
-            LIMIT ?
-        """
-        if self.db_manager.is_postgres:
-             query = """
-                SELECT 
-                    q.*,
-                    p.times_shown, p.times_correct, p.last_shown, p.ease_factor, p.interval
-                FROM questions q
-                JOIN user_question_progress p ON q.id = p.question_id
-                WHERE p.user_id = %s
-                  AND p.last_shown IS NOT NULL
-                  AND p.last_shown + (p.interval * INTERVAL '1 day') <= NOW()
-                ORDER BY p.last_shown + (p.interval * INTERVAL '1 day') ASC
-                LIMIT %s
-            """
-        
-        rows = self.db_manager._execute(query, (user_id, limit), fetch='all')
+        """Hakee käyttäjän erääntyvät kertauskysymykset (vanhimmat ensin)."""
+        rows = self.db_manager.execute_named('due_questions', (user_id, datetime.now(), limit), fetch='all')
             
         questions = []
         if rows:
             for row in rows:
                 try:
+                    row = dict(row)
                     questions.append(Question(
                         id=row['id'], question=row['question'], explanation=row['explanation'],
                         options=json.loads(row['options']), correct=row['correct'], category=row['category'],
@@ -72,10 +91,27 @@ class SpacedRepetitionManager:
                     continue
         return questions
 
+    def count_due_questions(self, user_id) -> int:
+        """Laskee erääntyvät kertauskysymykset hakematta niitä."""
+        row = self.db_manager.execute_named('due_count', (user_id, datetime.now()), fetch='one')
+        return row['count'] if row else 0
+
+    def count_due(self, user_id, now=None) -> dict:
+        """
+        Erääntyvien kertausten määrät: nyt, tämän päivän aikana ja seuraavan
+        seitsemän päivän aikana (kumulatiivisesti). Yksi välihaku indeksiin
+        (user_id, next_review_at).
+        """
+        now = now or datetime.now()
+        end_of_today = datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
+        end_of_week = end_of_today + timedelta(days=6)
+        row = self.db_manager.execute_named(
+            'due_counts', (now, end_of_today, user_id, end_of_week), fetch='one'
+        )
+        if not row:
+            return {'now': 0, 'today': 0, 'week': 0}
+        return {'now': row['due_now'] or 0, 'today': row['due_today'] or 0, 'week': row['due_week'] or 0}
+
     def record_review(self, user_id, question_id, interval, ease_factor):
-        """Päivittää käyttäjän SR-tiedot kysymykselle."""
-        self.db_manager._execute("""
-            UPDATE user_question_progress
-            SET interval = ?, ease_factor = ?
-            WHERE user_id = ? AND question_id = ?
-        """, (interval, ease_factor, user_id, question_id), fetch='none')
\ No newline at end of file
+        """Päivittää käyttäjän SR-tiedot ja seuraavan kertauksen ajankohdan kysymykselle."""
+        self.db_manager.execute_named('record_review', (interval, ease_factor, interval, user_id, question_id))
\ No newline at end of file
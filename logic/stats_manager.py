@@ -2,8 +2,14 @@
 Stats Manager - Oppimistilastojen hallinta ja analytiikka
 """
 import json
+import logging
 from datetime import datetime, date, timedelta
 
+logger = logging.getLogger(__name__)
+
+# Päiväkohtaiset luvut (weekly_progress) säilytetään koosteessa näin monelta päivältä
+SUMMARY_DAYS = 30
+
 class EnhancedStatsManager:
     """Käyttäjäkohtaisten oppimistilastojen hallinta."""
     
@@ -46,75 +52,189 @@ class EnhancedStatsManager:
         except Exception as e:
             print(f"Virhe session lopetuksessa: {e}")
 
-    def get_learning_analytics(self, user_id):
-        """Hae kattavat käyttäjäkohtaiset oppimistilastot."""
+    def get_learning_analytics(self, user_id, summary=None):
+        """
+        Hae kattavat käyttäjäkohtaiset oppimistilastot.
+
+        Tilastot luetaan user_stats_summary-rivistä (yksi kysely), jota
+        record_answers päivittää. Puuttuva rivi lasketaan historiasta.
+        """
         analytics_data = {'general': {}, 'categories': [], 'difficulties': [], 'weekly_progress': [], 'recent_sessions': []}
         try:
-            general_stats_q = """
-                SELECT 
-                    COUNT(DISTINCT p.question_id) as answered_questions,
-                    SUM(p.times_shown) as total_attempts,
-                    SUM(p.times_correct) as total_correct,
-                    AVG(qa.time_taken) as avg_time_per_question
-                FROM user_question_progress p
-                LEFT JOIN question_attempts qa ON p.user_id = qa.user_id AND p.question_id = qa.question_id
-                WHERE p.user_id = ?"""
-            general_stats = self.db_manager._execute(general_stats_q, (user_id,), fetch='one') or {}
-
-            total_q_in_db_res = self.db_manager._execute("SELECT COUNT(*) as count FROM questions", fetch='one')
-            total_q_in_db = total_q_in_db_res['count'] if total_q_in_db_res else 0
-            
-            total_attempts = general_stats.get('total_attempts') or 0
-            total_correct = general_stats.get('total_correct') or 0
+            if summary is None:
+                summary = self.get_summary(user_id)
+
+            total_attempts = summary['total_attempts']
+            total_correct = summary['total_correct']
             
             analytics_data['general'] = {
-                'answered_questions': general_stats.get('answered_questions') or 0,
-                'total_questions_in_db': total_q_in_db,
+                'answered_questions': summary['answered_questions'],
+                'total_questions_in_db': len(self.db_manager.question_cache.snapshot().by_id),
                 'avg_success_rate': (total_correct / total_attempts) if total_attempts > 0 else 0,
                 'total_attempts': total_attempts,
                 'total_correct': total_correct,
-                'avg_time_per_question': round(general_stats.get('avg_time_per_question') or 0, 1)
+                'avg_time_per_question': round(summary['total_time'] / summary['timed_attempts'], 1) if summary['timed_attempts'] else 0
             }
 
-            category_stats_q = """
-                SELECT q.category, SUM(p.times_shown) as attempts, SUM(p.times_correct) as corrects
-                FROM questions q JOIN user_question_progress p ON q.id = p.question_id
-                WHERE p.user_id = ? AND p.times_shown > 0 GROUP BY q.category"""
-            category_stats = self.db_manager._execute(category_stats_q, (user_id,), fetch='all') or []
-            analytics_data['categories'] = [{'category': r['category'], 'attempts': r['attempts'], 'success_rate': (r['corrects'] / r['attempts']) if r['attempts'] > 0 else 0} for r in category_stats]
+            analytics_data['categories'] = [
+                {'category': category, 'attempts': attempts, 'success_rate': (corrects / attempts) if attempts > 0 else 0}
+                for category, (attempts, corrects) in summary['categories'].items() if attempts > 0
+            ]
+            analytics_data['difficulties'] = [
+                {'difficulty': difficulty, 'attempts': attempts, 'success_rate': (corrects / attempts) if attempts > 0 else 0}
+                for difficulty, (attempts, corrects) in summary['difficulties'].items() if attempts > 0
+            ]
 
-            difficulty_stats_q = """
-                SELECT q.difficulty, SUM(p.times_shown) as attempts, SUM(p.times_correct) as corrects
-                FROM questions q JOIN user_question_progress p ON q.id = p.question_id
-                WHERE p.user_id = ? AND p.times_shown > 0 GROUP BY q.difficulty"""
-            difficulty_stats = self.db_manager._execute(difficulty_stats_q, (user_id,), fetch='all') or []
-            analytics_data['difficulties'] = [{'difficulty': r['difficulty'], 'attempts': r['attempts'], 'success_rate': (r['corrects'] / r['attempts']) if r['attempts'] > 0 else 0} for r in difficulty_stats]
-
-            days_ago_30 = date.today() - timedelta(days=30)
-            
-            if self.db_manager.is_postgres:
-                weekly_progress_q = """
-                    SELECT CAST(timestamp AS DATE) as date, COUNT(*) as questions_answered,
-                           SUM(CASE WHEN correct THEN 1 ELSE 0 END) as corrects
-                    FROM question_attempts WHERE user_id = %s AND timestamp >= %s
-                    GROUP BY CAST(timestamp AS DATE) ORDER BY date"""
-            else:
-                weekly_progress_q = """
-                    SELECT date(timestamp) as date, COUNT(*) as questions_answered,
-                           SUM(CASE WHEN correct THEN 1 ELSE 0 END) as corrects
-                    FROM question_attempts WHERE user_id = ? AND date(timestamp) >= ?
-                    GROUP BY date(timestamp) ORDER BY date"""
-            weekly_progress = self.db_manager._execute(weekly_progress_q, (user_id, days_ago_30), fetch='all') or []
-            analytics_data['weekly_progress'] = [dict(row) for row in weekly_progress]
+            days_ago_30 = (date.today() - timedelta(days=SUMMARY_DAYS)).isoformat()
+            analytics_data['weekly_progress'] = [
+                {'date': day, 'questions_answered': answered, 'corrects': corrects}
+                for day, (answered, corrects) in sorted(summary['daily'].items()) if day >= days_ago_30
+            ]
 
             return analytics_data
         except Exception as e:
             print(f"CRITICAL ERROR fetching analytics: {e}")
             return analytics_data
 
-    def get_recommendations(self, user_id):
+    # ========== KOOSTE (user_stats_summary) ==========
+
+    def get_summary(self, user_id):
+        """Palauttaa käyttäjän koosteen; puuttuva kooste lasketaan ja tallennetaan."""
+        row = self.db_manager._execute(
+            "SELECT summary FROM user_stats_summary WHERE user_id = ?", (user_id,), fetch='one'
+        )
+        if row is None:
+            return self.rebuild_summary(user_id)
+        return json.loads(row['summary'])
+
+    def record_answers(self, user_id, answers):
+        """
+        Päivittää koosteen juuri tallennetuilla vastauksilla. Kutsu
+        record_answer/record_answers-kutsun jälkeen samassa transaktiossa.
+
+        answers: lista sanakirjoja, joissa question_id, is_correct, time_taken ja
+        first_time (True, jos käyttäjä ei ollut vastannut kysymykseen aiemmin).
+        Kategoria ja vaikeustaso haetaan kysymysvälimuistista.
+        """
+        if not answers:
+            return
+        try:
+            lock = " FOR UPDATE" if self.db_manager.is_postgres else ""
+            row = self.db_manager._execute(
+                f"SELECT summary FROM user_stats_summary WHERE user_id = ?{lock}", (user_id,), fetch='one'
+            )
+            if row is None:
+                # Kooste lasketaan historiasta (näiden vastausten kanssa) seuraavalla lukukerralla
+                return
+            summary = json.loads(row['summary'])
+            by_id = self.db_manager.question_cache.snapshot().by_id
+            today = date.today().isoformat()
+
+            for answer in answers:
+                correct = 1 if answer['is_correct'] else 0
+                summary['total_attempts'] += 1
+                summary['total_correct'] += correct
+                if answer.get('first_time'):
+                    summary['answered_questions'] += 1
+                if answer.get('time_taken') is not None:
+                    summary['total_time'] += float(answer['time_taken'])
+                    summary['timed_attempts'] += 1
+
+                question = by_id.get(answer['question_id'])
+                if question is not None:
+                    for key, value in (('categories', question.category), ('difficulties', question.difficulty)):
+                        bucket = summary[key].setdefault(value, [0, 0])
+                        bucket[0] += 1
+                        bucket[1] += correct
+
+                day = summary['daily'].setdefault(today, [0, 0])
+                day[0] += 1
+                day[1] += correct
+
+            self._trim_daily(summary)
+            self.db_manager._execute(
+                "UPDATE user_stats_summary SET summary = ?, updated_at = ? WHERE user_id = ?",
+                (json.dumps(summary), datetime.now(), user_id)
+            )
+        except Exception as e:
+            logger.error(f"Virhe tilastokoosteen päivityksessä (käyttäjä {user_id}), kooste lasketaan uudelleen: {e}")
+            try:
+                # Osittain päivitetty kooste ei saa jäädä voimaan: seuraava luku laskee sen historiasta
+                self.db_manager.reset_user_aggregates(user_id=user_id, tables=('user_stats_summary',))
+            except Exception as reset_error:
+                logger.error(f"Virhe tilastokoosteen poistossa (käyttäjä {user_id}): {reset_error}")
+
+    def rebuild_summary(self, user_id):
+        """
+        Laskee käyttäjän koosteen user_question_progress- ja question_attempts-tauluista.
+        Write-behind-jonon yritykset kirjoitetaan ensin (ks. EnhancedAchievementManager.rebuild_counters).
+        """
+        db = self.db_manager
+        if db.attempt_log is not None and not db.detached_write_blocked():
+            db.attempt_log.flush()
+        general = db._execute("""
+            SELECT 
+                COUNT(*) as answered_questions,
+                SUM(times_shown) as total_attempts,
+                SUM(times_correct) as total_correct
+            FROM user_question_progress
+            WHERE user_id = ? AND times_shown > 0""", (user_id,), fetch='one')
+        # Keskimääräinen vastausaika yrityksistä (ei progress-riveihin liitettynä)
+        timing = db._execute("""
+            SELECT COUNT(time_taken) as timed_attempts, SUM(time_taken) as total_time
+            FROM question_attempts WHERE user_id = ?""", (user_id,), fetch='one')
+
+        summary = {
+            'answered_questions': (general['answered_questions'] or 0) if general else 0,
+            'total_attempts': (general['total_attempts'] or 0) if general else 0,
+            'total_correct': (general['total_correct'] or 0) if general else 0,
+            'total_time': float(timing['total_time'] or 0) if timing else 0.0,
+            'timed_attempts': (timing['timed_attempts'] or 0) if timing else 0,
+            'categories': {},
+            'difficulties': {},
+            'daily': {},
+        }
+
+        for key, column in (('categories', 'category'), ('difficulties', 'difficulty')):
+            rows = db._execute(f"""
+                SELECT q.{column} as name, SUM(p.times_shown) as attempts, SUM(p.times_correct) as corrects
+                FROM questions q JOIN user_question_progress p ON q.id = p.question_id
+                WHERE p.user_id = ? AND p.times_shown > 0 GROUP BY q.{column}""", (user_id,), fetch='all') or []
+            summary[key] = {row['name']: [row['attempts'] or 0, row['corrects'] or 0] for row in rows}
+
+        days_ago_30 = date.today() - timedelta(days=SUMMARY_DAYS)
+        rows = db._execute("""
+            SELECT date(timestamp) as date, COUNT(*) as questions_answered,
+                   SUM(CASE WHEN correct THEN 1 ELSE 0 END) as corrects
+            FROM question_attempts WHERE user_id = ? AND timestamp >= ?
+            GROUP BY date(timestamp)""", (user_id, days_ago_30), fetch='all') or []
+        summary['daily'] = {str(row['date']): [row['questions_answered'], row['corrects'] or 0] for row in rows}
+
+        db._execute("""
+            INSERT INTO user_stats_summary (user_id, summary, updated_at) VALUES (?, ?, ?)
+            ON CONFLICT (user_id) DO UPDATE SET summary = EXCLUDED.summary, updated_at = EXCLUDED.updated_at
+        """, (user_id, json.dumps(summary), datetime.now()))
+        return summary
+
+    def rebuild_all_summaries(self, user_ids=None):
+        """Laskee koosteet uudelleen annetuille tai kaikille käyttäjille. Palauttaa määrän."""
+        if user_ids is None:
+            rows = self.db_manager._execute("SELECT id FROM users ORDER BY id", fetch='all') or []
+            user_ids = [row['id'] for row in rows]
+        for user_id in user_ids:
+            with self.db_manager.transaction():
+                self.rebuild_summary(user_id)
+        return len(user_ids)
+
+    @staticmethod
+    def _trim_daily(summary):
+        oldest = (date.today() - timedelta(days=SUMMARY_DAYS)).isoformat()
+        summary['daily'] = {day: value for day, value in summary['daily'].items() if day >= oldest}
+
+    def get_recommendations(self, user_id, analytics=None):
         """Anna käyttäjäkohtaiset oppimissuositukset."""
-        analytics = self.get_learning_analytics(user_id)
+        if analytics is None:
+            analytics = self.get_learning_analytics(user_id)
         recommendations = []
         if not analytics: return recommendations
 
@@ -136,9 +256,23 @@ class EnhancedStatsManager:
         recommendations.sort(key=lambda x: priority_order.get(x.get('priority', 'low'), 2))
         return recommendations
 
+    def get_weekly_improvement(self, user_id):
+        """Tämän viikon onnistumisprosentin muutos edelliseen viikkoon, prosentteina."""
+        now = datetime.now()
+        week_ago = now - timedelta(days=7)
+        two_weeks_ago = now - timedelta(days=14)
+
+        this_week = self.db_manager.execute_named('accuracy_since', (user_id, week_ago), fetch='one')
+        last_week = self.db_manager.execute_named('accuracy_between', (user_id, two_weeks_ago, week_ago), fetch='one')
+
+        if this_week and last_week and this_week['avg_rate'] and last_week['avg_rate']:
+            improvement = ((this_week['avg_rate'] - last_week['avg_rate']) / last_week['avg_rate']) * 100
+            return round(improvement, 1)
+        return 0
+
     def get_user_streak(self, user_id):
         """Laske käyttäjän harjoitteluputki."""
-        date_func = "DATE" if not self.db_manager.is_postgres else "CAST(timestamp AS DATE)"
+        date_func = "DATE(timestamp)" if not self.db_manager.is_postgres else "CAST(timestamp AS DATE)"
         query = f"SELECT DISTINCT {date_func} as practice_date FROM question_attempts WHERE user_id = ? ORDER BY practice_date DESC"
         rows = self.db_manager._execute(query, (user_id,), fetch='all')
         
@@ -1,11 +1,53 @@
 # -*- coding: utf-8 -*-
 # models/models.py
+import random
 from dataclasses import dataclass
+from functools import lru_cache
+from itertools import permutations
 from typing import List, Optional
 from datetime import datetime
 from flask_login import UserMixin
 
-@dataclass
+# @dataclass(slots=True) vaatii Python 3.10+ (ks. runtime.txt)
+
+# Vaihtoehtomäärät, joiden kaikki järjestykset lasketaan valmiiksi (6! = 720)
+PRECOMPUTED_SHUFFLE_MAX = 6
+
+
+@lru_cache(maxsize=None)
+def _option_permutations(count):
+    """Kaikki count vaihtoehdon järjestykset ja kunkin käänteiskuvaus (vanha indeksi -> uusi)."""
+    result = []
+    for order in permutations(range(count)):
+        inverse = [0] * count
+        for new_index, old_index in enumerate(order):
+            inverse[old_index] = new_index
+        result.append((order, tuple(inverse)))
+    return tuple(result)
+
+
+def shuffle_options(options, correct, rng=None):
+    """
+    Palauttaa (sekoitetut vaihtoehdot, oikean vastauksen uusi indeksi).
+
+    Järjestys arvotaan valmiiksi lasketuista permutaatioista yhdellä
+    satunnaisluvulla, ja oikea vastaus seurataan indeksinä (ei tekstinä),
+    joten samansisältöiset vaihtoehdot eivät sotke sitä. Alkuperäistä
+    listaa ei muuteta. Virheellinen correct palautetaan sekoittamatta.
+    """
+    rng = rng or random
+    count = len(options)
+    if not 0 <= correct < count:
+        return list(options), correct
+    if count > PRECOMPUTED_SHUFFLE_MAX:
+        order = list(range(count))
+        rng.shuffle(order)
+        return [options[i] for i in order], order.index(correct)
+    table = _option_permutations(count)
+    order, inverse = table[rng.randrange(len(table))]
+    return [options[i] for i in order], inverse[correct]
+
+@dataclass(slots=True)
 class User(UserMixin):
     """Käyttäjämalli Flask-Login yhteensopiva."""
     id: int
@@ -27,7 +69,7 @@ class User(UserMixin):
         """Tarkistaa onko käyttäjä admin."""
         return self.role == 'admin'
 
-@dataclass
+@dataclass(slots=True)
 class Question:
     id: int
     question: str
@@ -49,7 +91,98 @@ class Question:
     created_at: datetime = None             # ← UUSI
     hint_type: str = None                   # ← UUSI
 
-@dataclass
+    def to_dict(self, shuffle=False, rng=None):
+        """
+        Sanakirjaksi kuten dataclasses.asdict, mutta ilman syväkopiota
+        (options kopioidaan matalasti). shuffle=True sekoittaa vaihtoehdot
+        shuffle_optionsilla ja päivittää correct-indeksin.
+        """
+        if shuffle:
+            options, correct = shuffle_options(self.options, self.correct, rng)
+        else:
+            options, correct = list(self.options), self.correct
+        return {
+            'id': self.id,
+            'question': self.question,
+            'options': options,
+            'correct': correct,
+            'explanation': self.explanation,
+            'category': self.category,
+            'difficulty': self.difficulty,
+            'times_shown': self.times_shown,
+            'times_correct': self.times_correct,
+            'last_shown': self.last_shown,
+            'ease_factor': self.ease_factor,
+            'interval': self.interval,
+            'status': self.status,
+            'validated_by': self.validated_by,
+            'validated_at': self.validated_at,
+            'validation_comment': self.validation_comment,
+            'question_normalized': self.question_normalized,
+            'created_at': self.created_at,
+            'hint_type': self.hint_type,
+        }
+
+
+@dataclass(slots=True)
+class PracticeQuestion:
+    """
+    Harjoittelun kevyt näkymä kysymykseen käyttäjän edistymisellä.
+
+    Lukupolut (harjoittelu, simulaatio, vastaaminen) eivät tarvitse
+    validointitietoja, joten niitä ei kopioida eikä lähetetä selaimelle.
+    options on sama lista kuin välimuistin Question-objektissa: sitä ei
+    muuteta, vaan to_dict palauttaa kopion. (frozen=True hidastaisi luontia
+    moninkertaisesti, koska jokainen kenttä asetettaisiin object.__setattr__:lla.)
+    """
+    id: int
+    question: str
+    options: list
+    correct: int
+    explanation: str
+    category: str
+    difficulty: str
+    hint_type: str = None
+    times_shown: int = 0
+    times_correct: int = 0
+    last_shown: datetime = None
+    ease_factor: float = 2.5
+    interval: int = 1
+
+    @classmethod
+    def from_question(cls, question, progress=None):
+        """Luo näkymän Question-objektista; progress on user_question_progress-rivi tai None."""
+        if progress is None:
+            return cls(question.id, question.question, question.options, question.correct,
+                       question.explanation, question.category, question.difficulty, question.hint_type)
+        return cls(question.id, question.question, question.options, question.correct,
+                   question.explanation, question.category, question.difficulty, question.hint_type,
+                   progress['times_shown'] or 0, progress['times_correct'] or 0, progress['last_shown'],
+                   progress['ease_factor'] or 2.5, progress['interval'] or 1)
+
+    def to_dict(self, shuffle=False, rng=None):
+        """Kuten Question.to_dict, ilman validointikenttiä."""
+        if shuffle:
+            options, correct = shuffle_options(self.options, self.correct, rng)
+        else:
+            options, correct = list(self.options), self.correct
+        return {
+            'id': self.id,
+            'question': self.question,
+            'options': options,
+            'correct': correct,
+            'explanation': self.explanation,
+            'category': self.category,
+            'difficulty': self.difficulty,
+            'hint_type': self.hint_type,
+            'times_shown': self.times_shown,
+            'times_correct': self.times_correct,
+            'last_shown': self.last_shown,
+            'ease_factor': self.ease_factor,
+            'interval': self.interval,
+        }
+
+@dataclass(slots=True)
 class QuestionAttempt:
     """Kysymykseen vastaamisen yritys."""
     id: int
@@ -59,7 +192,7 @@ class QuestionAttempt:
     time_taken: int
     created_at: Optional[str] = None
 
-@dataclass
+@dataclass(slots=True)
 class Achievement:
     """Saavutus."""
     id: str
@@ -69,7 +202,7 @@ class Achievement:
     unlocked: bool = False
     unlocked_at: Optional[datetime] = None
 
-@dataclass
+@dataclass(slots=True)
 class UserStats:
     """Käyttäjän tilastot."""
     user_id: int
@@ -81,7 +214,7 @@ class UserStats:
     best_streak: int
     last_activity: Optional[datetime] = None
 
-@dataclass
+@dataclass(slots=True)
 class DistractorAttempt:
     """Häiriötekijäyritys."""
     id: int
@@ -93,7 +226,7 @@ class DistractorAttempt:
     response_time: int
     created_at: Optional[str] = None
 
-@dataclass
+@dataclass(slots=True)
 class SpacedRepetitionCard:
     """Väliajoin kertauksen kortti."""
     id: int
@@ -106,7 +239,7 @@ class SpacedRepetitionCard:
     last_reviewed: Optional[datetime] = None
     quality: int = 0
 
-@dataclass
+@dataclass(slots=True)
 class LearningSession:
     """Oppimissessio."""
     id: int
@@ -118,7 +251,7 @@ class LearningSession:
     started_at: datetime
     completed_at: Optional[datetime] = None
     
-@dataclass
+@dataclass(slots=True)
 class CategoryProgress:
     """Kategoriakohtainen edistyminen."""
     category: str
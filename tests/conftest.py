@@ -0,0 +1,66 @@
+import os
+
+import pytest
+
+from data_access.database_manager import DatabaseManager
+
+
+@pytest.fixture
+def db(request, tmp_path, monkeypatch):
+    """
+    Tyhjä, migroitu DatabaseManager. Tila valitaan epäsuoralla parametrilla:
+
+        @pytest.mark.parametrize('db', ['sqlite', 'postgres'], indirect=True)
+
+    - 'sqlite' (oletus): väliaikainen SQLite-tiedosto.
+    - 'write_behind': SQLite, yritykset jonon kautta (attempt_log.py). Pitkä
+      flush-väli: yritykset ovat jonossa, kunnes testi tai koodi kutsuu flush().
+    - 'postgres': TEST_DATABASE_URL:n kanta, ohitetaan ilman sitä. Kanta on
+      yhteinen, joten testi siivoaa omat rivinsä.
+    """
+    mode = getattr(request, 'param', 'sqlite')
+    monkeypatch.delenv('ATTEMPT_LOG_WRITE_BEHIND', raising=False)
+    monkeypatch.delenv('DATABASE_URL', raising=False)
+    if mode == 'postgres':
+        if not os.environ.get('TEST_DATABASE_URL'):
+            pytest.skip('TEST_DATABASE_URL puuttuu')
+        monkeypatch.setenv('DATABASE_URL', os.environ['TEST_DATABASE_URL'])
+    elif mode == 'write_behind':
+        monkeypatch.setenv('ATTEMPT_LOG_WRITE_BEHIND', '1')
+        monkeypatch.setenv('ATTEMPT_LOG_FLUSH_MS', '60000')
+
+    db = DatabaseManager(str(tmp_path / 'test.db'))
+    db.init_database()
+    db.migrate_database()
+    yield db
+    if db.attempt_log is not None:
+        db.attempt_log.close()
+    db.jobs.close()
+    db.pool.close_all()
+
+
+def _seed_questions(db, rows):
+    """
+    Lisää kysymykset suoraan tauluun (ohi add_questionin duplikaattitarkistuksen)
+    ja palauttaa niiden id:t. rows: sanakirjoja, joissa voi olla category,
+    difficulty ja status; tekstit ovat 'Kysymys <n>'.
+    """
+    first = db._execute("SELECT COUNT(*) AS n FROM questions", fetch='one')['n']
+    question_ids = []
+    for i, row in enumerate(rows, start=first):
+        question_ids.append(db._execute(
+            "INSERT INTO questions (question, question_normalized, explanation, options, correct, category, "
+            "difficulty, status) VALUES (?, ?, 'selitys', '[\"a\", \"b\"]', 0, ?, ?, ?) RETURNING id",
+            (f'Kysymys {i}', f'kysymys {i}', row.get('category', 'laskut'), row.get('difficulty', 'helppo'),
+             row.get('status', 'validated')),
+            fetch='one'
+        )['id'])
+    db.similarity_index.index_missing()
+    db.invalidate_question_cache()
+    return question_ids
+
+
+@pytest.fixture
+def seed_questions():
+    """seed_questions(db, rows) -> id:t; ks. _seed_questions."""
+    return _seed_questions
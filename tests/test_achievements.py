@@ -0,0 +1,74 @@
+import json
+
+import pytest
+
+from logic.achievement_manager import EnhancedAchievementManager, _COUNTER_FIELDS
+
+USER_ID = 1
+
+
+# 'write_behind': yritykset ovat jonossa, kun laskurit rakennetaan uudelleen
+pytestmark = pytest.mark.parametrize('db', ['sqlite', 'write_behind'], indirect=True)
+
+
+@pytest.fixture(autouse=True)
+def questions(db, seed_questions):
+    return seed_questions(db, [{'category': 'Farmakologia'}] * 25 + [{'category': 'Annosjakelu'}] * 5)
+
+
+def answer_all(db, manager, answers):
+    unlocked = []
+    for question_id, is_correct, time_taken in answers:
+        db.record_answer(USER_ID, question_id, is_correct, time_taken)
+        unlocked += manager.record_answer(USER_ID, question_id, is_correct, time_taken)
+    return unlocked
+
+
+def snapshot(counters):
+    return ({name: counters[name] for name in _COUNTER_FIELDS}, counters['categories'],
+            sorted(json.loads(counters['unlocked'])))
+
+
+def question_ids(db, category):
+    rows = db._execute("SELECT id FROM questions WHERE category = ? ORDER BY id", (category,), fetch='all')
+    return [row['id'] for row in rows]
+
+
+def test_rebuild_matches_incremental_counters(db):
+    manager = EnhancedAchievementManager(db)
+    farmakologia = question_ids(db, 'Farmakologia')
+    annosjakelu = question_ids(db, 'Annosjakelu')
+    answers = [(question_id, True, 3) for question_id in farmakologia]
+    answers += [(annosjakelu[0], False, 12), (annosjakelu[1], True, 4), (annosjakelu[2], True, 20)]
+
+    unlocked = answer_all(db, manager, answers)
+    for achievement_id in ('first_steps', 'quick_learner', 'perfectionist', 'speed_demon',
+                           'category_master_farmakologia'):
+        assert achievement_id in unlocked
+    assert 'category_master_annosjakelu' not in unlocked
+    incremental = snapshot(manager._load_counters(USER_ID))
+    assert incremental[0]['total_attempts'] == len(answers)
+    assert incremental[0]['correct_run'] == 2
+    assert incremental[1] == {'Farmakologia': (25, 25), 'Annosjakelu': (2, 3)}
+
+    db.reset_user_aggregates(user_id=USER_ID)
+    db._execute("DELETE FROM user_category_counters WHERE user_id = ?", (USER_ID,))
+    assert snapshot(manager._load_counters(USER_ID)) == incremental
+    assert manager.check_achievements(USER_ID) == []
+
+
+def test_delete_question_resets_counters_of_answering_users(db):
+    manager = EnhancedAchievementManager(db)
+    farmakologia = question_ids(db, 'Farmakologia')
+    answer_all(db, manager, [(question_id, True, 15) for question_id in farmakologia[:3]])
+    assert manager._load_counters(USER_ID)['total_attempts'] == 3
+
+    if db.attempt_log is not None:
+        db.attempt_log.flush()
+    assert db.delete_questions(farmakologia[:1]) == (True, 1)
+    assert db._execute("SELECT COUNT(*) AS n FROM user_achievement_counters WHERE user_id = ?",
+                       (USER_ID,), fetch='one')['n'] == 0
+
+    counters = manager._load_counters(USER_ID)
+    assert counters['total_attempts'] == 2
+    assert counters['categories'] == {'Farmakologia': (2, 2)}
@@ -0,0 +1,158 @@
+import threading
+import time
+
+import pytest
+
+from data_access import attempt_log
+from data_access.attempt_log import SHUTDOWN_RETRIES, AttemptLog
+
+
+class FakeDB:
+    """insert_attempts, joka voi epäonnistua tai pitää taustasäikeen kirjoitusta kiinni."""
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.written = []
+        self.sync_rows = []
+        self.calls = 0
+        # Kun gate on kiinni, taustasäikeen kirjoitus odottaa (kanta hidas)
+        self.gate = threading.Event()
+        self.gate.set()
+
+    def insert_attempts(self, rows):
+        background = threading.current_thread().name == 'attempt-log'
+        if background:
+            self.gate.wait(5)
+        self.calls += 1
+        if self.failures:
+            self.failures -= 1
+            return False, 'kanta alhaalla'
+        self.written += rows
+        if not background:
+            self.sync_rows += rows
+        return True, None
+
+
+class SleepRecorder:
+    """attempt_log.time, jonka sleep vain kirjaa viiveen."""
+
+    def __init__(self):
+        self.sleeps = []
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+
+    @staticmethod
+    def monotonic():
+        return time.monotonic()
+
+
+def rows(*numbers):
+    return [(1, number, True, 5, None) for number in numbers]
+
+
+@pytest.fixture
+def logs():
+    created = []
+    yield created
+    for log in created:
+        log.db_manager.gate.set()
+        log.close(timeout=2)
+
+
+@pytest.fixture
+def make_log(logs):
+    def make(db=None, **settings):
+        settings = {'batch_size': 500, 'flush_interval': 60, 'max_queue': 100, 'put_timeout': 0.01, **settings}
+        log = AttemptLog(db or FakeDB(), **settings)
+        logs.append(log)
+        return log
+    return make
+
+
+def test_flush_wakes_collecting_batch(make_log):
+    log = make_log()
+    assert log.flush(timeout=0.1)
+    assert log.append(rows(1, 2)) == (True, None)
+    assert log.append(rows(3)) == (True, None)
+
+    # Ilman _WAKE-merkkiä erä odottaisi flush_intervalin (60 s)
+    started = time.monotonic()
+    assert log.flush(timeout=2)
+    assert time.monotonic() - started < 1
+    assert log.db_manager.written == rows(1, 2, 3)
+    stats = log.stats()
+    assert (stats['appended'], stats['written'], stats['batches'], stats['queued']) == (3, 3, 1, 0)
+
+
+def test_flush_times_out_while_database_is_slow(make_log):
+    log = make_log()
+    log.db_manager.gate.clear()
+    log.append(rows(1))
+    assert not log.flush(timeout=0.05)
+    log.db_manager.gate.set()
+    assert log.flush(timeout=2)
+    assert log.db_manager.written == rows(1)
+
+
+def test_full_queue_falls_back_to_synchronous_write(make_log):
+    log = make_log(max_queue=2, batch_size=1)
+    db = log.db_manager
+    db.gate.clear()
+    log.append(rows(1))
+    # Taustasäie on ottanut rivin 1 ja odottaa kantaa; jonoon mahtuu kaksi riviä
+    deadline = time.monotonic() + 2
+    while log.stats()['queued'] and time.monotonic() < deadline:
+        time.sleep(0.005)
+
+    assert log.append(rows(2, 3, 4, 5)) == (True, None)
+    assert db.sync_rows == rows(4, 5)
+    stats = log.stats()
+    assert (stats['sync_writes'], stats['appended'], stats['queued']) == (1, 3, 2)
+
+    db.gate.set()
+    assert log.flush(timeout=2)
+    assert sorted(db.written) == rows(1, 2, 3, 4, 5)
+
+
+def test_failed_batch_is_retried_with_backoff(make_log, monkeypatch):
+    clock = SleepRecorder()
+    monkeypatch.setattr(attempt_log, 'time', clock)
+    log = make_log(FakeDB(failures=8))
+    log.append(rows(1, 2))
+
+    assert log.flush(timeout=2)
+    assert log.db_manager.written == rows(1, 2)
+    assert clock.sleeps == [0.1, 0.2, 0.4, 0.8, 1.6, 3.2, 5.0, 5.0]
+    stats = log.stats()
+    assert (stats['write_errors'], stats['written'], stats['dropped']) == (8, 2, 0)
+
+
+def test_close_drains_queue(make_log):
+    log = make_log()
+    log.append(rows(1, 2, 3))
+    started = time.monotonic()
+    log.close(timeout=2)
+    assert time.monotonic() - started < 1
+    assert not log._thread.is_alive()
+    assert log.db_manager.written == rows(1, 2, 3)
+
+    # Sammutuksen jälkeen rivit kirjoitetaan heti
+    assert log.append(rows(4)) == (True, None)
+    assert log.db_manager.sync_rows == rows(4)
+
+
+def test_close_drops_batch_after_shutdown_retries(make_log, monkeypatch):
+    monkeypatch.setattr(attempt_log, 'time', SleepRecorder())
+    db = FakeDB(failures=100)
+    db.gate.clear()
+    log = make_log(db)
+    log.append(rows(1, 2))
+    # Kanta ei vastaa sammutuksen alkaessa
+    threading.Timer(0.05, db.gate.set).start()
+    log.close(timeout=2)
+
+    assert not log._thread.is_alive()
+    assert db.written == []
+    assert db.calls == SHUTDOWN_RETRIES
+    assert log.stats()['dropped'] == 2
@@ -0,0 +1,200 @@
+import threading
+import time
+
+import pytest
+
+from data_access import connection_pool
+from data_access.connection_pool import ConnectionPool, PoolTimeoutError
+
+
+class FakeConnection:
+    def __init__(self, number):
+        self.number = number
+        self.closed = 0
+        self.rollbacks = 0
+        self.fail_rollback = False
+
+    def rollback(self):
+        if self.fail_rollback:
+            raise RuntimeError('yhteys katkesi')
+        self.rollbacks += 1
+
+    def close(self):
+        self.closed = 1
+
+
+class Factory:
+    """Yhteystehdas: numeroi yhteydet, valinnainen virhe avattaessa."""
+
+    def __init__(self):
+        self.opened = []
+        self.fail = False
+
+    def __call__(self):
+        if self.fail:
+            raise RuntimeError('kanta ei vastaa')
+        conn = FakeConnection(len(self.opened) + 1)
+        self.opened.append(conn)
+        return conn
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def factory():
+    return Factory()
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(connection_pool, 'time', clock)
+    return clock
+
+
+def test_exhausted_pool_times_out(factory):
+    pool = ConnectionPool(factory, max_size=2, timeout=0.05)
+    first, second = pool.acquire(), pool.acquire()
+
+    started = time.monotonic()
+    with pytest.raises(PoolTimeoutError, match='pool täynnä, koko 2'):
+        pool.acquire()
+    assert time.monotonic() - started >= 0.05
+
+    stats = pool.stats()
+    assert (stats['size'], stats['in_use'], stats['timeouts'], stats['created']) == (2, 2, 1, 2)
+    pool.release(first)
+    assert pool.acquire() is first
+    pool.release(second)
+
+
+def test_waiter_gets_released_connection(factory):
+    pool = ConnectionPool(factory, max_size=1, timeout=5)
+    conn = pool.acquire()
+    timer = threading.Timer(0.05, pool.release, (conn,))
+    timer.start()
+
+    assert pool.acquire() is conn
+    timer.join()
+    stats = pool.stats()
+    assert (stats['created'], stats['waits'], stats['timeouts']) == (1, 1, 0)
+    assert stats['wait_time_max'] > 0
+
+
+def test_failed_connect_frees_the_slot(factory):
+    pool = ConnectionPool(factory, max_size=1, timeout=0.05)
+    factory.fail = True
+    with pytest.raises(RuntimeError, match='kanta ei vastaa'):
+        pool.acquire()
+    assert pool.stats()['size'] == 0
+
+    factory.fail = False
+    assert pool.acquire().number == 1
+
+
+def test_health_check_only_after_ping_interval(factory, clock):
+    pinged = []
+    pool = ConnectionPool(factory, health_check=pinged.append, ping_interval=30, idle_timeout=300)
+    conn = pool.acquire()
+    pool.release(conn)
+
+    clock.now += 10
+    assert pool.acquire() is conn
+    assert pinged == []
+    pool.release(conn)
+
+    clock.now += 31
+    assert pool.acquire() is conn
+    assert pinged == [conn]
+
+
+def test_dead_connection_is_discarded_and_replaced(factory, clock):
+    def health_check(conn):
+        raise RuntimeError('server closed the connection unexpectedly')
+
+    pool = ConnectionPool(factory, health_check=health_check, ping_interval=30, idle_timeout=300)
+    dead = pool.acquire()
+    pool.release(dead)
+
+    clock.now += 60
+    conn = pool.acquire()
+    assert conn is not dead and dead.closed
+    stats = pool.stats()
+    assert (stats['failed_health_checks'], stats['closed'], stats['size']) == (1, 1, 1)
+
+
+def test_closed_connection_is_not_reused(factory, clock):
+    pool = ConnectionPool(factory, health_check=lambda conn: None)
+    conn = pool.acquire()
+    pool.release(conn)
+    conn.closed = 1
+
+    assert pool.acquire() is not conn
+    assert pool.stats()['size'] == 1
+
+
+def test_idle_connections_are_reaped(factory, clock):
+    pool = ConnectionPool(factory, max_size=3, idle_timeout=300, ping_interval=30)
+    old, recent = pool.acquire(), pool.acquire()
+    pool.release(old)
+    clock.now += 200
+    pool.release(recent)
+
+    clock.now += 200
+    assert pool.acquire() is recent
+    assert old.closed
+    stats = pool.stats()
+    assert (stats['closed'], stats['size'], stats['idle']) == (1, 1, 0)
+
+
+def test_release_rolls_back_or_discards(factory):
+    pool = ConnectionPool(factory)
+    conn = pool.acquire()
+    pool.release(conn)
+    assert conn.rollbacks == 1 and pool.stats()['idle'] == 1
+
+    conn = pool.acquire()
+    conn.fail_rollback = True
+    pool.release(conn)
+    assert conn.closed
+    assert (pool.stats()['idle'], pool.stats()['size']) == (0, 0)
+
+
+def test_connection_context_discards_broken_connection(factory):
+    pool = ConnectionPool(factory)
+    with pytest.raises(RuntimeError):
+        with pool.connection() as conn:
+            conn.closed = 1
+            raise RuntimeError('katkesi kyselyn aikana')
+    assert pool.stats()['size'] == 0
+
+    with pytest.raises(ValueError):
+        with pool.connection() as conn:
+            raise ValueError('sovellusvirhe')
+    assert pool.stats()['idle'] == 1 and not conn.closed
+
+
+def test_forked_process_starts_with_empty_pool(factory, monkeypatch):
+    pool = ConnectionPool(factory, max_size=2, timeout=0.05)
+    idle, busy = pool.acquire(), pool.acquire()
+    pool.release(idle)
+
+    # gunicorn --preload: worker perii poolin, jossa on isäprosessin yhteyksiä
+    child_pid = pool._pid + 1
+    monkeypatch.setattr(connection_pool.os, 'getpid', lambda: child_pid)
+    # Isäprosessin yhteyttä ei palauteta eikä suljeta: socket on yhteinen
+    pool.release(busy)
+    assert not busy.closed and not idle.closed
+    stats = pool.stats()
+    assert (stats['size'], stats['idle'], stats['created']) == (0, 0, 0)
+
+    first, second = pool.acquire(), pool.acquire()
+    assert {first.number, second.number} == {3, 4}
+    assert pool.stats()['size'] == 2
+    assert not idle.closed
@@ -0,0 +1,184 @@
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+from data_access import job_runner
+from data_access.job_runner import STATUS_DONE, STATUS_FAILED, STATUS_QUEUED, STATUS_RUNNING, JobRunner
+
+
+@pytest.fixture
+def runner(db, tmp_path):
+    runner = JobRunner(db, max_workers=1, output_dir=str(tmp_path / 'jobs'), stale_seconds=60, retention_hours=1)
+    yield runner
+    runner.close()
+
+
+@pytest.fixture
+def progress_writes(runner, monkeypatch):
+    """Kantaan kirjoitetut edistymispäivitykset (done, total, message)."""
+    written = []
+    update = runner._update
+
+    def recording_update(job_id, **fields):
+        if 'progress_done' in fields:
+            written.append((fields['progress_done'], fields['progress_total'], fields['message']))
+        update(job_id, **fields)
+
+    monkeypatch.setattr(runner, '_update', recording_update)
+    return written
+
+
+def wait(runner, job_id, statuses=(STATUS_DONE, STATUS_FAILED), timeout=5):
+    deadline = time.monotonic() + timeout
+    while True:
+        job = runner.get(job_id)
+        if job['status'] in statuses or time.monotonic() > deadline:
+            return job
+        time.sleep(0.01)
+
+
+def insert_job(db, job_id, status, updated_at):
+    db._execute(
+        "INSERT INTO admin_jobs (id, kind, status, progress_done, created_at, updated_at) VALUES (?, 'testi', ?, 0, ?, ?)",
+        (job_id, status, updated_at, updated_at)
+    )
+
+
+def test_job_runs_to_done_with_result_and_output(runner):
+    started, release = threading.Event(), threading.Event()
+
+    def export(context, name):
+        started.set()
+        release.wait(5)
+        with open(context.output_path(name), 'w') as f:
+            f.write('sisältö')
+        return {'rows': 3, 'at': datetime(2024, 1, 2)}
+
+    first = runner.submit('export', export, 'vienti.txt', user_id=7)
+    second = runner.submit('export', lambda context: None)
+    assert started.wait(5)
+    # Yksi säie: toinen työ odottaa jonossa
+    assert wait(runner, first, (STATUS_RUNNING,))['status'] == STATUS_RUNNING
+    assert runner.get(second)['status'] == STATUS_QUEUED
+    release.set()
+
+    job = wait(runner, first)
+    assert (job['status'], job['kind'], job['created_by']) == (STATUS_DONE, 'export', 7)
+    assert job['result'] == {'rows': 3, 'at': '2024-01-02 00:00:00'}
+    assert job['finished_at'] is not None and job['error'] is None
+    with open(runner.output_file_path(job)) as f:
+        assert f.read() == 'sisältö'
+    assert wait(runner, second)['result'] is None
+    assert runner.get('ei-ole') is None
+
+
+def test_exception_marks_job_failed(runner):
+    def broken(context):
+        raise ValueError('rikki')
+
+    job = wait(runner, runner.submit('broken', broken))
+    assert (job['status'], job['error'], job['result']) == (STATUS_FAILED, 'rikki', None)
+    assert job['finished_at'] is not None
+    assert runner.output_file_path(job) is None
+
+
+def test_progress_is_throttled_within_a_phase(runner, progress_writes, monkeypatch):
+    clock = SimpleNamespace(now=100.0)
+    monkeypatch.setattr(job_runner, 'time', SimpleNamespace(monotonic=lambda: clock.now))
+
+    def work(context):
+        context.progress(1, 10, 'Tuodaan')
+        context.progress(2, 10, 'Tuodaan')       # sama vaihe, liian pian
+        context.progress(3, 10, 'Indeksoidaan')  # vaihe vaihtui
+        clock.now += job_runner.PROGRESS_INTERVAL
+        context.progress(4, 10, 'Indeksoidaan')  # väli kulunut
+        context.progress(10, 10, 'Indeksoidaan')  # viimeinen kirjoitetaan aina
+
+    job = wait(runner, runner.submit('progress', work))
+    assert progress_writes == [(1, 10, 'Tuodaan'), (3, 10, 'Indeksoidaan'), (4, 10, 'Indeksoidaan'),
+                               (10, 10, 'Indeksoidaan')]
+    assert (job['progress_done'], job['progress_total'], job['message']) == (10, 10, 'Indeksoidaan')
+
+
+def test_sqlite_progress_skipped_while_job_holds_unit_of_work(runner, db, progress_writes):
+    def work(context):
+        db.begin_unit_of_work()
+        try:
+            # Työsäikeellä on kirjoituslukko: edistymisen kirjoitus omalla yhteydellä jäisi odottamaan
+            db._execute("UPDATE admin_jobs SET kind = kind WHERE id = ?", (context.job_id,))
+            context.progress(5, 10, 'Transaktiossa')
+        finally:
+            db.end_unit_of_work()
+        context.progress(10, 10, 'Valmis')
+
+    job = wait(runner, runner.submit('unit', work))
+    assert job['status'] == STATUS_DONE
+    assert progress_writes == [(10, 10, 'Valmis')]
+
+
+def test_stale_active_job_is_marked_failed(runner, db):
+    old = datetime.now() - timedelta(seconds=120)
+    insert_job(db, 'stale-running', STATUS_RUNNING, old)
+    insert_job(db, 'stale-queued', STATUS_QUEUED, old)
+    insert_job(db, 'fresh', STATUS_RUNNING, datetime.now())
+    insert_job(db, 'old-done', STATUS_DONE, old)
+
+    for job_id in ('stale-running', 'stale-queued'):
+        job = runner.get(job_id)
+        assert job['status'] == STATUS_FAILED and 'keskeytyi' in job['error']
+    assert runner.get('fresh')['status'] == STATUS_RUNNING
+    assert runner.get('old-done')['status'] == STATUS_DONE
+
+
+def test_status_read_does_not_wait_for_sqlite_write_lock(runner, db):
+    insert_job(db, 'running', STATUS_RUNNING, datetime.now())
+    # Tuonti pitää kirjoituslukkoa koko transaktionsa ajan
+    writer = sqlite3.connect(db.db_path, isolation_level=None)
+    writer.execute("BEGIN IMMEDIATE")
+    try:
+        started = time.monotonic()
+        assert runner.get('running')['status'] == STATUS_RUNNING
+        assert time.monotonic() - started < 1
+    finally:
+        writer.execute("ROLLBACK")
+        writer.close()
+
+
+def test_cleanup_removes_finished_jobs_after_retention(runner, db):
+    old = datetime.now() - timedelta(hours=2)
+    insert_job(db, 'old-done', STATUS_DONE, old)
+    insert_job(db, 'old-failed', STATUS_FAILED, old)
+    insert_job(db, 'old-running', STATUS_RUNNING, old)
+    insert_job(db, 'new-done', STATUS_DONE, datetime.now())
+    for job_id in ('old-done', 'new-done'):
+        os.makedirs(os.path.join(runner.output_dir, job_id))
+
+    runner.cleanup()
+    remaining = {row['id'] for row in db._execute("SELECT id FROM admin_jobs", fetch='all')}
+    assert remaining == {'old-running', 'new-done'}
+    assert not os.path.exists(os.path.join(runner.output_dir, 'old-done'))
+    assert os.path.isdir(os.path.join(runner.output_dir, 'new-done'))
+
+
+def test_close_fails_queued_jobs(runner):
+    started, release = threading.Event(), threading.Event()
+
+    def blocking(context):
+        started.set()
+        release.wait(5)
+        return 'ok'
+
+    running = runner.submit('blocking', blocking)
+    queued = runner.submit('blocking', blocking)
+    assert started.wait(5)
+    runner.close()
+    job = runner.get(queued)
+    assert job['status'] == STATUS_FAILED and 'sammutettiin' in job['error']
+
+    release.set()
+    assert wait(runner, running)['result'] == 'ok'
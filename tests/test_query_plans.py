@@ -0,0 +1,23 @@
+from data_access.database_manager import DatabaseManager
+from data_access.migrations import MIGRATIONS
+
+
+def test_hot_queries_use_indexes(tmp_path, monkeypatch):
+    monkeypatch.delenv('DATABASE_URL', raising=False)
+    db = DatabaseManager(str(tmp_path / 'plans.db'))
+    db.init_database()
+
+    results = db.explain_hot_queries()
+
+    missing = {name: plan for name, (uses_index, plan) in results.items() if not uses_index}
+    assert not missing, f"Kyselyt ilman indeksiä: {missing}"
+
+
+def test_migrations_are_recorded_once(tmp_path, monkeypatch):
+    monkeypatch.delenv('DATABASE_URL', raising=False)
+    db = DatabaseManager(str(tmp_path / 'migrations.db'))
+    db.init_database()
+    db.migrate_database()
+
+    rows = db._execute("SELECT version FROM schema_version ORDER BY version", fetch='all')
+    assert [row['version'] for row in rows] == [m.version for m in MIGRATIONS]
@@ -0,0 +1,87 @@
+import pytest
+
+USER_ID = 1
+OTHER_USER_ID = 2
+
+
+@pytest.fixture(autouse=True)
+def questions(db, seed_questions):
+    return seed_questions(db, [{'category': category, 'status': 'needs_review'} for category in
+                               ['Farmakologia', 'lääkelaskut', 'LÄÄKELASKUT', 'laskut', 'etiikka']])
+
+
+def ids(db):
+    return [row['id'] for row in db._execute("SELECT id FROM questions ORDER BY id", fetch='all')]
+
+
+def categories(db):
+    return [row['category'] for row in db._execute("SELECT category FROM questions ORDER BY id", fetch='all')]
+
+
+def count(db, table, where='1 = 1', params=()):
+    return db._execute(f"SELECT COUNT(*) AS n FROM {table} WHERE {where}", params, fetch='one')['n']
+
+
+def test_remap_categories_ignores_case_and_does_not_chain(db):
+    assert sorted(db.get_categories()) == sorted(['Farmakologia', 'lääkelaskut', 'LÄÄKELASKUT', 'laskut',
+                                                  'etiikka'])
+    # a->b ja b->c: lääkelaskut muuttuu laskuiksi, ei turvallisuudeksi
+    assert db.remap_categories({'Lääkelaskut': 'laskut', 'laskut': 'turvallisuus',
+                                'FARMAKOLOGIA': 'kliininen farmakologia'}) == (True, 4)
+    assert categories(db) == ['kliininen farmakologia', 'laskut', 'laskut', 'turvallisuus', 'etiikka']
+    assert sorted(db.get_categories()) == ['etiikka', 'kliininen farmakologia', 'laskut', 'turvallisuus']
+
+
+def test_remap_categories_without_matches(db):
+    assert db.remap_categories({}) == (True, 0)
+    assert db.remap_categories({'ei ole': 'laskut'}) == (True, 0)
+    assert categories(db) == ['Farmakologia', 'lääkelaskut', 'LÄÄKELASKUT', 'laskut', 'etiikka']
+
+
+def test_remap_categories_resets_user_aggregates(db):
+    db.record_answer(USER_ID, ids(db)[0], True, 3)
+    db._execute("INSERT INTO user_stats_summary (user_id, summary) VALUES (?, '{}')", (USER_ID,))
+    assert db.remap_categories({'etiikka': 'ammattietiikka'}) == (True, 1)
+    assert count(db, 'user_stats_summary') == 0
+
+
+def test_validate_questions_counts_existing_rows(db):
+    first, second = ids(db)[:2]
+    assert db.get_question_by_id(first)['status'] != 'validated'
+    assert db.validate_questions([], 'admin') == (True, 0)
+    assert db.validate_questions([first, second, second, 999999], 'admin', 'ok') == (True, 2)
+    rows = db._execute("SELECT id, status, validated_by, validation_comment FROM questions ORDER BY id",
+                       fetch='all')
+    assert [(row['status'], row['validated_by'], row['validation_comment']) for row in rows[:2]] == \
+        [('validated', 'admin', 'ok')] * 2
+    assert rows[2]['status'] == 'needs_review'
+    assert db.get_question_by_id(first)['status'] == 'validated'
+
+
+def test_delete_questions_removes_related_rows_and_resets_answering_users(db):
+    question_ids = ids(db)
+    deleted, kept = question_ids[:2], question_ids[2]
+    db.record_answer(USER_ID, deleted[0], True, 3)
+    db.record_answer(OTHER_USER_ID, kept, True, 3)
+    for user_id in (USER_ID, OTHER_USER_ID):
+        db._execute("INSERT INTO user_stats_summary (user_id, summary) VALUES (?, '{}')", (user_id,))
+    assert db.get_question_by_id(deleted[0]) is not None
+
+    assert db.delete_questions(deleted + [deleted[0], 999999]) == (True, 2)
+
+    assert ids(db) == question_ids[2:]
+    assert db.get_question_by_id(deleted[0]) is None
+    assert sorted(db.get_categories()) == ['LÄÄKELASKUT', 'etiikka', 'laskut']
+    placeholders = ', '.join(['?'] * len(deleted))
+    for table in ('question_attempts', 'user_question_progress', 'question_lsh'):
+        assert count(db, table, f'question_id IN ({placeholders})', tuple(deleted)) == 0
+    assert count(db, 'question_lsh', 'question_id = ?', (kept,)) > 0
+    # Vain poistettuihin vastanneen käyttäjän kooste lasketaan uudelleen
+    assert [row['user_id'] for row in db._execute("SELECT user_id FROM user_stats_summary", fetch='all')] == \
+        [OTHER_USER_ID]
+
+
+def test_delete_questions_without_ids(db):
+    assert db.delete_questions([]) == (True, 0)
+    assert db.delete_questions([999999]) == (True, 0)
+    assert len(ids(db)) == 5
@@ -0,0 +1,113 @@
+import io
+import json
+
+import pytest
+
+from data_access.question_import import QuestionImporter, iter_json_array, validate_question
+
+
+def parse(text, read_size, bom=False):
+    data = (b'\xef\xbb\xbf' if bom else b'') + text.encode('utf-8')
+    return list(iter_json_array(io.BytesIO(data), read_size=read_size))
+
+
+@pytest.mark.parametrize('read_size', [1, 2, 3, 7, 64 * 1024])
+def test_values_split_across_reads(read_size):
+    values = [1.5, -20e3, 12345678901234567890, 0, 'ääkköset "lainaus" \\ €', {'a': [1, 2.25, None]},
+              [], {}, True, False, None, 'x' * 50]
+    text = ' [ ' + ' ,\n'.join(json.dumps(value, ensure_ascii=False) for value in values) + ' ]\n'
+    assert parse(text, read_size) == values
+    assert parse(text, read_size, bom=True) == values
+
+
+@pytest.mark.parametrize('read_size', [1, 4, 64 * 1024])
+@pytest.mark.parametrize('text', ['[]', '  [ \n ]  ', '﻿[]'])
+def test_empty_array(text, read_size):
+    assert parse(text, read_size) == []
+
+
+@pytest.mark.parametrize('text', ['', '   ', '{"question": "x"}', '"[1]"', '1'])
+def test_root_must_be_array(text):
+    with pytest.raises(ValueError, match='lista kysymyksiä'):
+        parse(text, 2)
+
+
+@pytest.mark.parametrize('read_size', [1, 3, 64 * 1024])
+@pytest.mark.parametrize('text', ['[', '[1', '[1,', '[1, 2', '[{"a": 1}', '["kesken', '[1.'])
+def test_truncated_array(text, read_size):
+    with pytest.raises(ValueError, match='Virheellinen JSON-tiedosto'):
+        parse(text, read_size)
+
+
+@pytest.mark.parametrize('text', ['[1 2]', '[1,]', '[{"a": }]', '[1] x', '[] []'])
+def test_invalid_json(text):
+    with pytest.raises(ValueError, match='Virheellinen JSON-tiedosto'):
+        list(parse(text, 2))
+
+
+def question(text, **overrides):
+    data = {'question': text, 'options': ['a', 'b', 'c'], 'correct': 1, 'explanation': 'selitys',
+            'category': 'laskut', 'difficulty': 'helppo'}
+    data.update(overrides)
+    return data
+
+
+def test_validate_question():
+    assert validate_question(question('Kelpaa')) is None
+    assert 'JSON-objekti' in validate_question(['ei', 'objekti'])
+    assert "'question'" in validate_question(question('   '))
+    assert "'explanation'" in validate_question(question('x', explanation=None))
+    assert "'options'" in validate_question(question('x', options=['vain yksi']))
+    assert "'options'" in validate_question(question('x', options='ei lista'))
+    assert "'correct'" in validate_question(question('x', correct=3))
+    assert "'correct'" in validate_question(question('x', correct=True))
+
+
+BASE = 'Kuinka monta milligrammaa parasetamolia potilas saa ottaa vuorokaudessa enintään?'
+NEAR = 'Kuinka monta milligrammaa parasetamolia potilas saa ottaa vuorokaudessa enintään!'
+OTHER = 'Mitä tarkoittaa kaksoistarkistus lääkkeiden jaossa osastolla?'
+
+
+def questions_in_db(db):
+    return [row['question'] for row in db._execute("SELECT question FROM questions ORDER BY id", fetch='all')]
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 200])
+def test_importer_skips_duplicates_within_and_across_chunks(db, chunk_size):
+    items = [
+        question(BASE),
+        question('  ' + BASE.upper() + ' '),   # tarkka kopio normalisoinnin jälkeen
+        question(NEAR),                        # lähes sama
+        question(OTHER),
+        question('x', options='ei lista'),     # virheellinen
+        {'question': OTHER},                   # virheellinen (puuttuvat kentät)
+    ]
+    progress = []
+    with db.transaction():
+        stats = QuestionImporter(db, chunk_size=chunk_size).run(
+            iter(items), progress=lambda processed, _stats: progress.append(processed))
+
+    assert (stats['added'], stats['duplicates'], stats['skipped']) == (2, 2, 2)
+    assert len(stats['errors']) == 2
+    assert progress[-1] == len(items)
+    assert questions_in_db(db) == [BASE, OTHER]
+
+
+def test_import_questions_skips_existing_and_indexes_new(db):
+    assert db.import_questions([question(BASE)]) == (True, {'added': 1, 'duplicates': 0, 'skipped': 0,
+                                                           'errors': []})
+    success, stats = db.import_questions(iter_json_array(io.BytesIO(json.dumps(
+        [question(BASE), question(NEAR), question(OTHER)]).encode('utf-8'))))
+    assert success and (stats['added'], stats['duplicates']) == (1, 2)
+
+    # Uusi kysymys on indeksissä: sen lähes sama kopio tunnistetaan seuraavassa tuonnissa
+    success, stats = db.import_questions([question(OTHER.replace('?', '!'))])
+    assert success and (stats['added'], stats['duplicates']) == (0, 1)
+    assert questions_in_db(db) == [BASE, OTHER]
+
+
+def test_import_questions_rolls_back_on_broken_json(db):
+    text = '[' + json.dumps(question(BASE)) + ', ' + json.dumps(question(OTHER))
+    success, error = db.import_questions(iter_json_array(io.BytesIO(text.encode('utf-8')), read_size=16))
+    assert not success and 'päättyi kesken' in error
+    assert questions_in_db(db) == []
@@ -0,0 +1,86 @@
+import random
+
+import pytest
+
+from data_access.question_sampler import make_rng, sample_question_ids
+
+
+class RecordingRandom(random.Random):
+    """Kirjaa, käytettiinkö tiheää (sample) vai harvaa (randrange) arvontaa."""
+
+    def __init__(self, seed):
+        super().__init__(seed)
+        self.dense_calls = 0
+
+    def sample(self, population, k, **kwargs):
+        self.dense_calls += 1
+        return super().sample(population, k, **kwargs)
+
+
+@pytest.fixture
+def questions(db, seed_questions):
+    rows = [{'category': category, 'difficulty': difficulty, 'status': 'needs_review' if i % 4 == 0 else 'validated'}
+            for category in ('laskut', 'etiikka', 'turvallisuus')
+            for difficulty in ('helppo', 'vaikea')
+            for i in range(20)]
+    question_ids = seed_questions(db, rows)
+    return {question_id: row for question_id, row in zip(question_ids, rows)}
+
+
+@pytest.fixture
+def snapshot(db, questions):
+    return db.question_cache.snapshot()
+
+
+def test_same_seed_gives_same_sample(snapshot):
+    first = sample_question_ids(snapshot, 10, rng=make_rng(42))
+    assert sample_question_ids(snapshot, 10, rng=make_rng(42)) == first
+    assert sample_question_ids(snapshot, 10, rng=make_rng(43)) != first
+    filters = {'categories': ['etiikka'], 'difficulties': ['vaikea'], 'exclude_ids': first}
+    assert (sample_question_ids(snapshot, 5, rng=make_rng(7), **filters)
+            == sample_question_ids(snapshot, 5, rng=make_rng(7), **filters))
+
+
+@pytest.mark.parametrize('count', [1, 10, 30, 59, 60])
+def test_sample_is_distinct_and_respects_filters(snapshot, questions, count):
+    exclude = [question_id for question_id, row in questions.items() if row['category'] == 'laskut'][:10]
+    result = sample_question_ids(snapshot, count, categories=['laskut', 'etiikka'], exclude_ids=exclude,
+                                 rng=make_rng(count))
+    assert len(result) == len(set(result)) == min(count, 70)
+    for question_id in result:
+        assert questions[question_id]['category'] in ('laskut', 'etiikka')
+        assert question_id not in exclude
+
+
+def test_count_is_capped_to_available(snapshot, questions):
+    result = sample_question_ids(snapshot, 1000, categories=['turvallisuus'], difficulties=['helppo'],
+                                 rng=make_rng(1))
+    expected = {question_id for question_id, row in questions.items()
+                if (row['category'], row['difficulty']) == ('turvallisuus', 'helppo')}
+    assert sorted(result) == sorted(expected)
+    assert sample_question_ids(snapshot, 0, rng=make_rng(1)) == []
+    assert sample_question_ids(snapshot, 5, categories=['ei ole'], rng=make_rng(1)) == []
+
+
+def test_published_only_skips_unpublished(snapshot, questions):
+    result = sample_question_ids(snapshot, 200, published_only=True, rng=make_rng(3))
+    assert sorted(result) == sorted(question_id for question_id, row in questions.items()
+                                    if row['status'] == 'validated')
+
+
+@pytest.mark.parametrize('count, dense', [(5, False), (39, False), (40, True), (75, True)])
+def test_dense_fallback_when_count_is_close_to_pool(snapshot, count, dense):
+    # Pooli: 80 laskut/etiikka-kysymystä; tiheä arvonta, kun pyydetään vähintään puolet
+    rng = RecordingRandom(5)
+    result = sample_question_ids(snapshot, count, categories=['laskut', 'etiikka'],
+                                 difficulties=['helppo', 'vaikea', 'ei ole'], exclude_ids=[], rng=rng)
+    assert len(result) == len(set(result)) == min(count, 80)
+    assert bool(rng.dense_calls) is dense
+
+
+def test_dense_fallback_when_most_of_pool_is_excluded(snapshot, questions):
+    pool = [question_id for question_id, row in questions.items() if row['category'] == 'etiikka']
+    rng = RecordingRandom(5)
+    result = sample_question_ids(snapshot, 3, categories=['etiikka'], exclude_ids=pool[:30], rng=rng)
+    assert rng.dense_calls == 1
+    assert len(set(result)) == 3 and not set(result) & set(pool[:30])
@@ -0,0 +1,107 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from data_access.database_manager import DatabaseManager
+
+USER_ID = 900001
+
+# PostgreSQL-polut (CTE:t) ajetaan, kun TEST_DATABASE_URL osoittaa testikantaan
+BACKENDS = ['sqlite', 'postgres']
+
+
+@pytest.fixture(autouse=True)
+def cleanup(db):
+    yield
+    for table in ('question_attempts', 'user_question_progress'):
+        db._execute(f"DELETE FROM {table} WHERE user_id = ?", (USER_ID,))
+
+
+def progress(db, question_id):
+    return db._execute(
+        "SELECT times_shown, times_correct, interval, ease_factor, last_shown, next_review_at "
+        "FROM user_question_progress WHERE user_id = ? AND question_id = ?",
+        (USER_ID, question_id), fetch='one'
+    )
+
+
+def attempts(db):
+    rows = db._execute(
+        "SELECT question_id, correct, time_taken FROM question_attempts WHERE user_id = ? ORDER BY id",
+        (USER_ID,), fetch='all'
+    )
+    return [(row['question_id'], bool(row['correct']), row['time_taken']) for row in rows]
+
+
+def review_days(row):
+    """next_review_at - last_shown päivinä (SQLiten datetime() pudottaa mikrosekunnit)."""
+    parse = lambda value: value if isinstance(value, datetime) else datetime.fromisoformat(str(value))
+    return (parse(row['next_review_at']) - parse(row['last_shown'])) / timedelta(days=1)
+
+
+@pytest.mark.parametrize('db', BACKENDS, indirect=True)
+def test_record_answer_counts_and_keeps_sr_values(db):
+    assert db.record_answer(USER_ID, 1, True, 4) == (True, None)
+    assert db.record_answer(USER_ID, 1, False, 6) == (True, None)
+
+    row = progress(db, 1)
+    assert (row['times_shown'], row['times_correct']) == (2, 1)
+    assert (row['interval'], row['ease_factor']) == (1, 2.5)
+    assert review_days(row) == pytest.approx(1, abs=1e-4)
+    assert attempts(db) == [(1, True, 4), (1, False, 6)]
+
+
+@pytest.mark.parametrize('db', BACKENDS, indirect=True)
+def test_record_answer_with_sr_values_updates_schedule(db):
+    db.record_answer(USER_ID, 2, True, 3)
+    assert db.record_answer(USER_ID, 2, True, 5, interval=6, ease_factor=2.6) == (True, None)
+
+    row = progress(db, 2)
+    assert (row['times_shown'], row['times_correct']) == (2, 2)
+    assert (row['interval'], row['ease_factor']) == (6, pytest.approx(2.6))
+    assert review_days(row) == pytest.approx(6, abs=1e-4)
+
+    # SR-arvot säilyvät, kun seuraava vastaus ei anna niitä
+    db.record_answer(USER_ID, 2, False, 7)
+    row = progress(db, 2)
+    assert (row['times_shown'], row['times_correct'], row['interval']) == (3, 2, 6)
+    assert review_days(row) == pytest.approx(6, abs=1e-4)
+    assert attempts(db) == [(2, True, 3), (2, True, 5), (2, False, 7)]
+
+
+@pytest.mark.parametrize('db', BACKENDS, indirect=True)
+def test_record_answers_matches_single_answers(db, monkeypatch):
+    # Pieni erä pakottaa useamman monirivisen lauseen
+    monkeypatch.setattr(DatabaseManager, 'RECORD_ANSWERS_CHUNK', 3)
+    db.record_answer(USER_ID, 10, True, 1)
+    results = [
+        {'question_id': question_id, 'is_correct': question_id % 2 == 0, 'time_taken': question_id}
+        for question_id in (10, 11, 12, 11, 13, 14, 10, 15)
+    ]
+    assert db.record_answers(USER_ID, results) == (True, None)
+
+    expected = {}
+    for question_id, correct in [(10, True)] + [(r['question_id'], r['is_correct']) for r in results]:
+        shown, hits = expected.get(question_id, (0, 0))
+        expected[question_id] = (shown + 1, hits + correct)
+    for question_id, counts in expected.items():
+        row = progress(db, question_id)
+        assert (row['times_shown'], row['times_correct']) == counts
+    assert attempts(db) == [(10, True, 1)] + [(r['question_id'], r['is_correct'], r['time_taken']) for r in results]
+
+
+@pytest.mark.parametrize('db', BACKENDS, indirect=True)
+def test_record_answers_empty_is_noop(db):
+    assert db.record_answers(USER_ID, []) == (True, None)
+    assert attempts(db) == []
+
+
+@pytest.mark.parametrize('db', ['write_behind'], indirect=True)
+def test_write_behind_writes_attempts_after_flush(db):
+    db.record_answer(USER_ID, 1, True, 2)
+    db.record_answers(USER_ID, [{'question_id': 1, 'is_correct': False, 'time_taken': 3},
+                                {'question_id': 2, 'is_correct': True, 'time_taken': 4}])
+    db.attempt_log.close()
+
+    assert (progress(db, 1)['times_shown'], progress(db, 1)['times_correct']) == (2, 1)
+    assert sorted(attempts(db)) == [(1, False, 3), (1, True, 2), (2, True, 4)]
@@ -0,0 +1,77 @@
+from difflib import SequenceMatcher
+
+import pytest
+
+from data_access.similarity import (LSH_RECALL, MinHasher, candidate_jaccard, find_similar_pairs, jaccard,
+                                    lsh_bands, shingles)
+
+QUESTIONS = [
+    'Potilas painaa 70 kg. Montako millilitraa 10 mg/ml liuosta tarvitaan, kun annos on 0,5 mg/kg?',
+    'Potilas painaa 75 kg. Montako millilitraa 10 mg/ml liuosta tarvitaan, kun annos on 0,5 mg/kg?',
+    'Mikä on aikuisen normaali leposyke?',
+    'Miten toimit, kun huomaat lääkepoikkeaman?',
+    'Mitä tarkoittaa aseptinen työskentely?',
+    'Kuinka monta tablettia potilas saa vuorokaudessa, kun annos on 2 x 500 mg ja tabletti 250 mg?',
+]
+
+
+def estimated_jaccard(signature1, signature2):
+    return sum(a == b for a, b in zip(signature1, signature2)) / len(signature1)
+
+
+def test_identical_texts_have_equal_signatures():
+    hasher = MinHasher()
+    text = QUESTIONS[0]
+    signature = hasher.signature(shingles(text))
+    assert estimated_jaccard(signature, MinHasher().signature(shingles(text.upper()))) == 1.0
+    assert estimated_jaccard(signature, hasher.signature(shingles(QUESTIONS[0]))) == 1.0
+
+
+def test_disjoint_texts_have_near_zero_estimate():
+    hasher = MinHasher()
+    tokens1, tokens2 = shingles('aaaa bbbb cccc dddd'), shingles('xxxx yyyy zzzz wwww')
+    assert not tokens1 & tokens2
+    assert estimated_jaccard(hasher.signature(tokens1), hasher.signature(tokens2)) <= 0.05
+
+
+def test_estimate_follows_exact_jaccard():
+    hasher = MinHasher(num_perm=256)
+    tokens1, tokens2 = shingles(QUESTIONS[0]), shingles(QUESTIONS[5])
+    exact = jaccard(tokens1, tokens2)
+    assert 0.1 < exact < 0.6
+    assert estimated_jaccard(hasher.signature(tokens1), hasher.signature(tokens2)) == pytest.approx(exact, abs=0.15)
+
+
+@pytest.mark.parametrize('text', ['', 'ab', 'abcd', 'Syke?'])
+def test_short_text_gets_full_signature(text):
+    # Densification: muutamasta kolmikosta huolimatta jokainen lokero saa arvon
+    signature = MinHasher().signature(shingles(text))
+    assert len(signature) == 64 and None not in signature
+    assert len(set(signature)) == 64
+    assert signature == MinHasher().signature(shingles(text))
+
+
+@pytest.mark.parametrize('min_jaccard', [0.3, candidate_jaccard(0.9), candidate_jaccard(0.95), 0.99])
+def test_lsh_bands_reach_recall(min_jaccard):
+    bands, rows = lsh_bands(min_jaccard)
+    assert bands * rows <= 64
+
+    def recall(bands, rows):
+        return 1.0 - (1.0 - min_jaccard ** rows) ** bands
+    assert recall(bands, rows) >= LSH_RECALL
+    # Kapein kaista: leveämmällä kaistalla raja ei enää täyty
+    assert rows == 64 or recall(64 // (rows + 1), rows + 1) < LSH_RECALL
+
+
+def test_find_similar_pairs_finds_near_duplicate():
+    questions = [{'id': 10 + i, 'question': text, 'category': 'laskut'} for i, text in enumerate(QUESTIONS)]
+    questions.append({'id': 5, 'question': QUESTIONS[2].replace('normaali', 'normaalin'), 'category': 'muu'})
+
+    pairs = find_similar_pairs(reversed(questions), 0.9)
+    assert [(pair['id1'], pair['id2']) for pair in pairs] == [(5, 12), (10, 11)]
+    ratio = SequenceMatcher(None, QUESTIONS[0].lower(), QUESTIONS[1].lower()).ratio()
+    assert pairs[1]['similarity'] == round(ratio * 100, 1)
+    assert (pairs[0]['category1'], pairs[0]['category2']) == ('muu', 'laskut')
+
+    assert find_similar_pairs(questions[2:6], 0.9) == []
+    assert find_similar_pairs([], 0.9) == []
@@ -0,0 +1,40 @@
+import pytest
+
+from logic.simulation_manager import SimulationStore
+
+
+@pytest.fixture
+def store(db):
+    return SimulationStore(db, flush_interval=3600)
+
+
+def test_flush_survives_rollback_of_triggering_request(db, store):
+    first = store.create(1, [1, 2, 3])
+    second = store.create(2, [4, 5, 6])
+    store.buffer(1, first['session_id'], current_index=2)
+    store.buffer(2, second['session_id'], current_index=1)
+
+    # Toisen käyttäjän pyyntö laukaisee flushin ja perutaan sen jälkeen
+    db.begin_unit_of_work()
+    db.get_active_session(2)
+    assert store.flush() == 2
+    db.end_unit_of_work(error=True)
+
+    assert db.get_active_session(1)['current_index'] == 2
+    assert db.get_active_session(2)['current_index'] == 1
+    assert store.stats()['pending'] == 0
+
+
+def test_flush_waits_while_own_sqlite_transaction_holds_lock(db, store):
+    state = store.create(1, [1, 2, 3])
+    store.buffer(1, state['session_id'], current_index=2)
+
+    db.begin_unit_of_work()
+    db.update_active_session(1, state['session_id'], {'time_remaining': 100})
+    assert store.flush() == 0
+    assert store.get(1, state['session_id'])['current_index'] == 2
+    db.end_unit_of_work()
+
+    assert store.flush() == 1
+    row = db.get_active_session(1)
+    assert (row['current_index'], row['time_remaining']) == (2, 100)
@@ -0,0 +1,77 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from logic.spaced_repetition import SpacedRepetitionManager, schedule_batch
+
+PRACTICE_USER = 1
+SIMULATION_USER = 2
+
+
+@pytest.fixture(autouse=True)
+def questions(db, seed_questions):
+    return seed_questions(db, [{}] * 4)
+
+
+def progress(db, user_id):
+    rows = db._execute(
+        "SELECT question_id, times_shown, times_correct, interval, ease_factor, last_shown, next_review_at "
+        "FROM user_question_progress WHERE user_id = ? ORDER BY question_id", (user_id,), fetch='all'
+    )
+    parse = lambda value: value if isinstance(value, datetime) else datetime.fromisoformat(str(value))
+    # SQLiten datetime() pudottaa mikrosekunnit: päivät pyöristetään
+    return [(row['question_id'], row['times_shown'], row['times_correct'], row['interval'],
+             round(row['ease_factor'], 6),
+             round((parse(row['next_review_at']) - parse(row['last_shown'])) / timedelta(days=1), 3))
+            for row in rows]
+
+
+def practice_answer(db, manager, user_id, question_id, is_correct):
+    """Kuten /api/submit_answer: SR-arvot lasketaan vastausta edeltävästä edistymisestä."""
+    question = db.get_question_by_id(question_id, user_id)
+    interval, ease_factor = manager.calculate_next_review(question, 5 if is_correct else 2)
+    db.record_answer(user_id, question_id, is_correct, 30, interval=interval, ease_factor=ease_factor)
+
+
+def test_schedule_batch_matches_calculate_next_review(db):
+    manager = SpacedRepetitionManager(db)
+    states = [(1, 2.5, 0, 5), (6, 2.6, 1, 4), (15, 1.3, 7, 2), (10, 2.5, 3, 0), (3, 1.9, 2, 3)]
+    expected = []
+    for interval, ease_factor, times_shown, rating in states:
+        question = db.get_question_by_id(1, PRACTICE_USER)
+        question.interval, question.ease_factor, question.times_shown = interval, ease_factor, times_shown
+        expected.append(manager.calculate_next_review(question, rating))
+    intervals, ease_factors = schedule_batch(*zip(*states))
+    assert list(zip(intervals, ease_factors)) == expected
+
+
+def test_simulation_reschedule_matches_practice_answers(db):
+    manager = SpacedRepetitionManager(db)
+    history = [(1, True), (2, True), (2, False), (3, True), (3, True)]
+    simulation = [(1, True), (2, True), (3, False), (4, True)]
+    for user_id in (PRACTICE_USER, SIMULATION_USER):
+        for question_id, is_correct in history:
+            practice_answer(db, manager, user_id, question_id, is_correct)
+
+    for question_id, is_correct in simulation:
+        practice_answer(db, manager, PRACTICE_USER, question_id, is_correct)
+
+    # Kuten /api/submit_simulation: edistyminen luetaan ennen tallennusta, SR-arvot kirjoitetaan erällä
+    questions = db.get_questions_by_ids([question_id for question_id, _ in simulation], SIMULATION_USER)
+    answers = [{'question_id': question_id, 'is_correct': is_correct, 'time_taken': 30}
+               for question_id, is_correct in simulation]
+    assert db.record_answers(SIMULATION_USER, answers) == (True, None)
+    ratings = {answer['question_id']: 5 if answer['is_correct'] else 2 for answer in answers}
+    assert manager.reschedule(SIMULATION_USER, ratings, questions) == (True, None)
+
+    assert progress(db, SIMULATION_USER) == progress(db, PRACTICE_USER)
+
+
+def test_reschedule_reads_progress_when_questions_not_given(db):
+    manager = SpacedRepetitionManager(db)
+    practice_answer(db, manager, PRACTICE_USER, 1, True)
+    assert manager.reschedule(PRACTICE_USER, {}) == (True, None)
+    assert manager.reschedule(PRACTICE_USER, {1: 5, 999999: 5}) == (True, None)
+    [(question_id, times_shown, _, interval, ease_factor, days)] = progress(db, PRACTICE_USER)
+    assert (question_id, times_shown, interval) == (1, 1, 6)
+    assert (ease_factor, days) == (2.7, 6)
@@ -0,0 +1,61 @@
+import pytest
+
+from logic.stats_manager import EnhancedStatsManager
+
+USER_ID = 1
+
+
+pytestmark = pytest.mark.parametrize('db', ['sqlite', 'write_behind'], indirect=True)
+
+
+@pytest.fixture(autouse=True)
+def questions(db, seed_questions):
+    return seed_questions(db, [{'category': category, 'difficulty': difficulty} for category, difficulty in [
+        ('laskut', 'helppo'), ('laskut', 'vaikea'), ('etiikka', 'helppo'), ('turvallisuus', 'keskivaikea')]])
+
+
+def first_time(db, question_id):
+    row = db._execute("SELECT times_shown FROM user_question_progress WHERE user_id = ? AND question_id = ?",
+                      (USER_ID, question_id), fetch='one')
+    return row is None
+
+
+def test_incremental_summary_matches_rebuild(db):
+    stats = EnhancedStatsManager(db)
+    question_ids = [row['id'] for row in db._execute("SELECT id FROM questions ORDER BY id", fetch='all')]
+
+    # Tyhjä kooste luodaan ensin (esim. dashboard), sen jälkeen vastaukset päivittävät sitä
+    assert stats.get_summary(USER_ID)['total_attempts'] == 0
+    for question_id, is_correct, time_taken in [(question_ids[0], True, 4), (question_ids[1], False, 12),
+                                                (question_ids[0], False, 7.5)]:
+        answer = {'question_id': question_id, 'is_correct': is_correct, 'time_taken': time_taken,
+                  'first_time': first_time(db, question_id)}
+        db.record_answer(USER_ID, question_id, is_correct, time_taken)
+        stats.record_answers(USER_ID, [answer])
+
+    batch = [{'question_id': question_id, 'is_correct': question_id % 2 == 0, 'time_taken': 30,
+              'first_time': first_time(db, question_id)} for question_id in question_ids[1:]]
+    db.record_answers(USER_ID, batch)
+    stats.record_answers(USER_ID, batch)
+
+    incremental = stats.get_summary(USER_ID)
+    assert incremental['total_attempts'] == 6
+    assert incremental['answered_questions'] == 4
+    assert stats.rebuild_summary(USER_ID) == incremental
+
+
+def test_failed_update_drops_summary_for_rebuild(db, monkeypatch):
+    stats = EnhancedStatsManager(db)
+    question_id = db._execute("SELECT MIN(id) AS id FROM questions", fetch='one')['id']
+    db.record_answer(USER_ID, question_id, True, 5)
+    stats.get_summary(USER_ID)
+
+    db.record_answer(USER_ID, question_id, True, 6)
+    monkeypatch.setattr(EnhancedStatsManager, '_trim_daily', staticmethod(lambda summary: 1 / 0))
+    stats.record_answers(USER_ID, [{'question_id': question_id, 'is_correct': True, 'time_taken': 6,
+                                    'first_time': False}])
+    monkeypatch.undo()
+
+    assert db._execute("SELECT COUNT(*) AS n FROM user_stats_summary WHERE user_id = ?",
+                       (USER_ID,), fetch='one')['n'] == 0
+    assert stats.get_summary(USER_ID)['total_attempts'] == 2
@@ -0,0 +1,102 @@
+import sqlite3
+
+import pytest
+
+# PostgreSQL-polut (savepointit kyselyn mukana) ajetaan, kun TEST_DATABASE_URL osoittaa testikantaan
+pytestmark = pytest.mark.parametrize('db', ['sqlite', 'postgres'], indirect=True)
+
+
+class Boom(Exception):
+    pass
+
+
+@pytest.fixture(autouse=True)
+def table(db):
+    db._execute("CREATE TABLE IF NOT EXISTS tx_test (value TEXT NOT NULL)")
+    db._execute("DELETE FROM tx_test")
+    yield
+    db._execute("DROP TABLE tx_test")
+
+
+def insert(db, value):
+    db._execute("INSERT INTO tx_test (value) VALUES (?)", (value,))
+
+
+def values(db):
+    return [row['value'] for row in db._execute("SELECT value FROM tx_test ORDER BY value", fetch='all')]
+
+
+def assert_no_open_savepoints(db, *names):
+    """SQLite: vapautettu savepoint ei ole enää olemassa (PostgreSQL:n virhe kaataisi transaktion)."""
+    if db.is_postgres:
+        return
+    for name in names:
+        with pytest.raises(sqlite3.OperationalError, match='no such savepoint'):
+            db._run_sqlite_control(db._local.unit.conn, f"RELEASE SAVEPOINT {name}")
+
+
+def test_failed_inner_block_rolls_back_only_itself(db):
+    with db.transaction():
+        insert(db, 'a')
+        with pytest.raises(Boom):
+            with db.transaction():
+                insert(db, 'x')
+                raise Boom()
+        # Epäonnistunut lause lohkossa ei kaada ulompaa transaktiota (PostgreSQL)
+        with pytest.raises(Exception):
+            with db.transaction():
+                insert(db, 'y')
+                db._execute("SELECT * FROM no_such_table")
+        with db.transaction():
+            insert(db, 'b')
+            with db.transaction():
+                insert(db, 'c')
+        assert values(db) == ['a', 'b', 'c']
+        assert_no_open_savepoints(db, 'uow_tx_1', 'uow_tx_2', 'uow_tx_3', 'uow_tx_4')
+    assert values(db) == ['a', 'b', 'c']
+
+
+def test_inner_block_without_statements(db):
+    with db.transaction():
+        with db.transaction():
+            pass
+        with pytest.raises(Boom):
+            with db.transaction():
+                raise Boom()
+        insert(db, 'a')
+        with db.transaction():
+            pass
+        insert(db, 'b')
+        assert_no_open_savepoints(db, 'uow_tx_1', 'uow_tx_2', 'uow_tx_3')
+    assert values(db) == ['a', 'b']
+
+
+def test_nested_transaction_in_request_unit_of_work(db):
+    db.begin_unit_of_work()
+    try:
+        with db.transaction():
+            insert(db, 'a')
+        with pytest.raises(Boom):
+            with db.transaction():
+                insert(db, 'x')
+                raise Boom()
+        assert values(db) == ['a']
+        assert_no_open_savepoints(db, 'uow_tx_1', 'uow_tx_2')
+    finally:
+        db.end_unit_of_work()
+    assert values(db) == ['a']
+
+
+def test_request_rollback_undoes_committed_inner_blocks(db):
+    db.begin_unit_of_work()
+    try:
+        # Lohko on unit of workin ensimmäinen kysely: sen RELEASE ei saa vahvistaa mitään
+        with db.transaction():
+            insert(db, 'a')
+        with db.transaction():
+            with db.transaction():
+                insert(db, 'b')
+        assert values(db) == ['a', 'b']
+    finally:
+        db.end_unit_of_work(error=True)
+    assert values(db) == []